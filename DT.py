@@ -12,6 +12,9 @@ import time
 import subprocess, os
 from music21 import *
 import pickle
+import numbers
+import sys
+import importlib.util
 
 """
 ================================================================================================================================
@@ -1179,7 +1182,30 @@ def minimum_vl(first, second, sort = True, modulus = 12):		# do better for chord
 		minimum_vl.fullList = sorted(minimum_vl.fullList, key = lambda x: x[1])
 	return currentBest
 
+_pcsetTable = None
+
+def pcset_table():						# the lookup tables of chordgnn/utils/pcset_table.py, loaded from the file on first use so that the chordgnn package (and its training dependencies) is not imported
+	global _pcsetTable
+	if _pcsetTable is None:
+		_pcsetTable = sys.modules.get("chordgnn.utils.pcset_table")
+	if _pcsetTable is None:
+		spec = importlib.util.spec_from_file_location("pcset_table", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chordgnn", "utils", "pcset_table.py"))
+		_pcsetTable = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(_pcsetTable)
+	return _pcsetTable
+
+def pc_set_mask(inList, modulus = 12, removeDuplicates = False):				# 12-bit mask of the PCs for the lookup tables, None if they do not apply
+	if modulus != 12 or len(inList) == 0 or not all(isinstance(k, numbers.Integral) for k in inList):
+		return None
+	mask = pcset_table().pc_mask(inList)
+	if not removeDuplicates and bin(mask).count('1') != len(inList):
+		return None
+	return mask
+
 def interval_vector(mySet, modulus = 12):
+	mask = pc_set_mask(mySet, modulus = modulus)
+	if mask is not None:
+		return pcset_table().INTERVAL_VECTORS[mask].tolist()
 	output = [0] * int(modulus/2)
 	for i in range(len(mySet) - 1):
 		for j in range(i + 1, len(mySet)):
@@ -1301,6 +1327,11 @@ def geometrical_normal_form_local(inList, invert = False, modulus = 12, extraRot
 	return outList
 
 def normal_form(inList, invert = False, removeDuplicates = False, modulus = 12):				# takes a list of midi numbers
+	mask = None if invert else pc_set_mask(inList, modulus = modulus, removeDuplicates = removeDuplicates)
+	if mask is not None:
+		normal_form.transposition = int(pcset_table().NORMAL_FORM_TRANSPOSITIONS[mask])
+		normal_form.inversion = False
+		return list(pcset_table().NORMAL_FORMS[mask])
 	if removeDuplicates:
 		listOfPCs = sorted(list(set([k % modulus for k in inList])))
 	else:
@@ -1,41 +1,87 @@
 import os
-import subprocess
-import shutil
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+from analyse_score import load_models, analyse_score
 
 INPUT_DIR = "data/mozart"
 OUTPUT_DIR = "analysis/mozart"
 
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# The models of the process, loaded once and reused for every file.
+_models = None
 
-for fname in sorted(os.listdir(INPUT_DIR)):
-    if not fname.endswith(".xml"):
-        continue
-    if "-analysis" in fname:
-        continue
 
-    # full path to input file
-    in_path = os.path.join(INPUT_DIR, fname)
-    
-    # base name (e.g., "K310-1" from "K310-1.xml")
-    base = os.path.splitext(fname)[0]
-    print(base)
+def init_worker(use_ckpt, num_threads):
+    """Set up a warm worker: torch threads and the models, unless inherited from the parent on fork."""
+    global _models
+    torch.set_num_threads(num_threads)
+    if _models is None:
+        _models = load_models(use_ckpt)
 
-    print(f"Analyzing {fname}...")
 
-    # Run your analyzer normally (DEFAULT OUTPUT)
-    subprocess.run(["python", "analyse_score.py", "--score_path", in_path], check=True)
+def analyse_file(in_path, out_path):
+    start = time.time()
+    encoder, model = _models
+    analyse_score(in_path, encoder, model, output_path=out_path)
+    return time.time() - start
 
-    # The analyzer should have created:  <base>-analysis.musicxml
-    out_filename = f"{base}-analysis.musicxml"
 
-    out_path = os.path.join(INPUT_DIR, out_filename)
+def score_files(input_dir):
+    # e.g., "K310-1.xml", previous analyses are skipped.
+    return [fname for fname in sorted(os.listdir(input_dir)) if fname.endswith(".xml") and "-analysis" not in fname]
 
-    if not os.path.exists(out_path):
-        print(f"  ERROR: Expected output {out_filename} not found.")
-        continue
 
-    # Move output file to analysis/mozart/
-    dest_path = os.path.join(OUTPUT_DIR, out_filename)
-    shutil.move(out_path, dest_path)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Batch analysis of the Mozart sonatas")
+    parser.add_argument("--use_ckpt", type=str, default="melkisedeath/chord_rec/model-kvd0jic5:v0",
+                        help="Wandb artifact to use for prediction")
+    parser.add_argument("--input_dir", type=str, default=INPUT_DIR)
+    parser.add_argument("--output_dir", type=str, default=OUTPUT_DIR)
+    parser.add_argument("--num_workers", type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="Number of worker processes, 0 to analyse in this process")
+    parser.add_argument("--num_threads", type=int, default=1, help="Torch intra-op threads of every worker")
+    args = parser.parse_args()
 
-    print(f"  → Moved {out_filename} to {dest_path}")
+    os.makedirs(args.output_dir, exist_ok=True)
+    files = score_files(args.input_dir)
+    start = time.time()
+    # Load (and download) the checkpoint once, forked workers share this copy.
+    init_worker(args.use_ckpt, args.num_threads)
+    print(f"Loaded the model in {time.time() - start:.1f}s, analyzing {len(files)} files with {args.num_workers} workers...")
+
+    jobs = {
+        fname: (os.path.join(args.input_dir, fname),
+                os.path.join(args.output_dir, f"{os.path.splitext(fname)[0]}-analysis.musicxml"))
+        for fname in files}
+    failed = []
+    start = time.time()
+    if args.num_workers == 0:
+        for fname, job in jobs.items():
+            try:
+                elapsed = analyse_file(*job)
+                print(f"  {fname} → {job[1]} ({elapsed:.1f}s)")
+            except Exception as e:
+                failed.append(fname)
+                print(f"  ERROR: {fname} failed: {e}")
+    else:
+        context = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+        with ProcessPoolExecutor(args.num_workers, mp_context=context, initializer=init_worker,
+                                 initargs=(args.use_ckpt, args.num_threads)) as pool:
+            futures = {pool.submit(analyse_file, *job): fname for fname, job in jobs.items()}
+            for future in as_completed(futures):
+                fname = futures[future]
+                try:
+                    elapsed = future.result()
+                    print(f"  {fname} → {jobs[fname][1]} ({elapsed:.1f}s)")
+                except Exception as e:
+                    failed.append(fname)
+                    print(f"  ERROR: {fname} failed: {e}")
+
+    elapsed = time.time() - start
+    done = len(files) - len(failed)
+    print(f"Analyzed {done}/{len(files)} files in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.2f} files/s, "
+          f"{args.num_workers} workers x {args.num_threads} threads)")
+    if failed:
+        print("Failed: " + ", ".join(failed))
@@ -0,0 +1,49 @@
+"""
+Batches of the length-bucket sampler against the token-budget sampler, from the dataset index only.
+
+Reports the number of batches, the spread of the nodes per batch (a proxy of the memory per batch) and the
+padding waste of the onset sequences packed for the GRU.
+
+Usage: PYTHONPATH=. python benchmarks/bench_batch_sampler.py --batch_size 100 --max_nodes 40000 --max_onsets 12000
+"""
+import argparse
+import numpy as np
+import chordgnn as st
+from chordgnn.data.samplers import BySequenceLengthSampler, TokenBudgetBatchSampler, padding_waste
+
+
+def report(name, batches, sizes):
+    nodes = np.array([sizes[batch, 0].sum() for batch in batches])
+    waste = padding_waste(batches, sizes[:, 2])
+    print("{:>10} {:>9} {:>12.0f} {:>10.0f} {:>10} {:>10.1%}".format(
+        name, len(batches), nodes.mean(), nodes.std(), nodes.max(), waste["waste"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Batch sampler benchmark")
+    parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"])
+    parser.add_argument("--batch_size", type=int, default=100)
+    parser.add_argument("--max_nodes", type=int, default=None)
+    parser.add_argument("--max_edges", type=int, default=None)
+    parser.add_argument("--max_onsets", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The lazy dataset only reads the index of the store.
+    datamodule = st.data.AugmentedGraphDatamodule(
+        batch_size=args.batch_size, version=args.data_version, lazy=True, seed=args.seed)
+    datamodule.setup()
+    sizes = datamodule.train_sizes
+    if args.max_nodes is None and args.max_edges is None and args.max_onsets is None:
+        # The same mean number of nodes per batch as the fixed batch size.
+        args.max_nodes = int(sizes[:, 0].mean() * args.batch_size)
+    length_sampler = BySequenceLengthSampler(
+        None, datamodule.bucket_boundaries, args.batch_size, lengths=sizes[:, 0], seed=args.seed)
+    budget_sampler = TokenBudgetBatchSampler(
+        sizes, max_nodes=args.max_nodes, max_edges=args.max_edges, max_onsets=args.max_onsets, seed=args.seed)
+    print("{} training examples, budgets: nodes={}, edges={}, onsets={}".format(
+        len(sizes), args.max_nodes, args.max_edges, args.max_onsets))
+    print("{:>10} {:>9} {:>12} {:>10} {:>10} {:>10}".format(
+        "sampler", "batches", "nodes/batch", "std", "max", "padding"))
+    report("length", list(length_sampler), sizes)
+    report("budget", budget_sampler.batches(), sizes)
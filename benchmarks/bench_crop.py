@@ -0,0 +1,57 @@
+"""
+Per-sample latency of cropping a training window with the source-sorted edge index of the graph store,
+against masking all edges with torch.isin and recomputing the unique onsets of the graph.
+
+Both crops are run on the same windows and compared.
+
+Usage: PYTHONPATH=. python benchmarks/bench_crop.py --data_version v1.0.0 --max_size 512 --samples 2000
+"""
+import argparse
+import random
+import time
+import torch
+from chordgnn.data.datasets import AugmentedNetChordGraphDataset, Augmented2022ChordGraphDataset
+
+
+def isin_crop(graph, start, end):
+    """The crop of get_graph_attr before the edges were indexed by node."""
+    indices = torch.arange(start, end)
+    onset_divs = graph.onset_div[start:end]
+    unique_onsets = torch.unique(graph.onset_div, sorted=True)
+    label_idx = (unique_onsets >= onset_divs.min()) & (unique_onsets <= onset_divs.max())
+    edge_indices = torch.isin(graph.edge_index[0], indices) & torch.isin(graph.edge_index[1], indices)
+    return (graph.x[start:end], graph.edge_index[:, edge_indices] - start, graph.edge_type[edge_indices],
+            graph.y[label_idx], onset_divs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Training window cropping benchmark")
+    parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"])
+    parser.add_argument("--max_size", type=int, default=512)
+    parser.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    dataset_class = AugmentedNetChordGraphDataset if args.data_version == "v1.0.0" else Augmented2022ChordGraphDataset
+    dataset = dataset_class(max_size=args.max_size, verbose=False)
+    large = [i for i, entry in enumerate(dataset.index)
+             if entry.num_nodes > args.max_size and entry.collection != "test"]
+    rng = random.Random(0)
+    windows = list()
+    for _ in range(args.samples):
+        i = rng.choice(large)
+        start = rng.randint(0, dataset.index[i].num_nodes - args.max_size)
+        windows.append((dataset.graphs[i], start, start + args.max_size))
+
+    timings = dict()
+    for name, crop in [("isin", isin_crop), ("indexed", dataset.crop_graph)]:
+        start_time = time.perf_counter()
+        crops = [crop(graph, start, end) for graph, start, end in windows]
+        timings[name] = (time.perf_counter() - start_time) / len(windows), crops
+    equal = all(torch.equal(a, b) for old, new in zip(timings["isin"][1], timings["indexed"][1])
+                for a, b in zip(old, new[:5]))
+    mean_edges = sum(graph.edge_index.shape[1] for graph, _, _ in windows) / len(windows)
+    print("{} windows of {} nodes from {} graphs, {:.0f} edges per graph on average, identical crops: {}".format(
+        len(windows), args.max_size, len(large), mean_edges, equal))
+    print("{:>10} {:>16}".format("crop", "latency (us)"))
+    for name, (latency, _) in timings.items():
+        print("{:>10} {:>16.1f}".format(name, latency * 1e6))
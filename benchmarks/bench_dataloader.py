@@ -0,0 +1,51 @@
+"""
+Steps per second of the training DataLoader of AugmentedGraphDatamodule for several numbers of workers.
+
+The workers crop the graphs and collate the batches. A fixed compute time per step can stand in for the
+training step, to see how much of the loading the workers hide behind it.
+
+Usage: PYTHONPATH=. python benchmarks/bench_dataloader.py --num_workers 0 4 16 --batch_size 100 --max_steps 200 --step_time 0.05
+"""
+import argparse
+import time
+import chordgnn as st
+
+
+def steps_per_second(loader, max_steps, warmup_steps, step_time):
+    """Training steps per second over max_steps batches, after warmup_steps batches that start the workers."""
+    iterator = iter(loader)
+    for _ in range(warmup_steps):
+        next(iterator)
+    steps = 0
+    start = time.perf_counter()
+    for _ in iterator:
+        if step_time > 0:
+            time.sleep(step_time)
+        steps += 1
+        if steps == max_steps:
+            break
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Training DataLoader benchmark")
+    parser.add_argument("--num_workers", type=int, nargs="+", default=[0, 4, 16])
+    parser.add_argument("--batch_size", type=int, default=100)
+    parser.add_argument("--max_steps", type=int, default=200)
+    parser.add_argument("--warmup_steps", type=int, default=5)
+    parser.add_argument("--step_time", type=float, default=0.0, help="Simulated training step, in seconds")
+    parser.add_argument("--prefetch_factor", type=int, default=2)
+    parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"])
+    parser.add_argument("--lazy", action="store_true")
+    parser.add_argument("--online_transpose", action="store_true")
+    args = parser.parse_args()
+
+    datamodule = st.data.AugmentedGraphDatamodule(
+        batch_size=args.batch_size, version=args.data_version, lazy=args.lazy,
+        online_transpose=args.online_transpose, prefetch_factor=args.prefetch_factor, seed=0)
+    datamodule.setup()
+    print("{:>10} {:>10}".format("workers", "steps/s"))
+    for num_workers in args.num_workers:
+        datamodule.num_workers = num_workers
+        rate = steps_per_second(datamodule.train_dataloader(), args.max_steps, args.warmup_steps, args.step_time)
+        print("{:>10} {:>10.2f}".format(num_workers, rate))
@@ -0,0 +1,93 @@
+"""
+Distributed data parallel training throughput on the CPU with the gloo backend, from 1 to N processes.
+
+Every process trains ChordPredictionModel on its shard of the training set (see
+chordgnn.data.samplers.shard_examples) for a fixed number of steps, the batch counts of the ranks are equal
+so no rank waits on a missing step. No GPU is needed.
+
+Usage: PYTHONPATH=. python benchmarks/bench_ddp.py --num_processes 1 2 4 --max_steps 50 --batch_size 16 --num_threads 1
+"""
+import argparse
+import os
+import time
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.nn as nn
+import chordgnn as st
+from torch.nn.parallel import DistributedDataParallel
+from chordgnn.models.chord import ChordPredictionModel, MultiTaskLoss, unique_onsets
+
+
+def make_datamodule(args):
+    # The lazy datasets read the graphs of the shard of the process only.
+    return st.data.AugmentedGraphDatamodule(
+        batch_size=args.batch_size, num_workers=0, num_tasks=args.num_tasks, version=args.data_version,
+        lazy=True, seed=0, pin_memory=False)
+
+
+def train(rank, world_size, args, results):
+    os.environ["MASTER_ADDR"] = "127.0.0.1"
+    os.environ["MASTER_PORT"] = str(args.port)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    torch.set_num_threads(args.num_threads)
+    torch.manual_seed(0)
+    datamodule = make_datamodule(args)
+    datamodule.setup()
+    loader = datamodule.train_dataloader()
+    tasks = datamodule.tasks
+    model = DistributedDataParallel(ChordPredictionModel(datamodule.features, 256, tasks, 1, dropout=0.44))
+    loss_fn = MultiTaskLoss(list(tasks.keys()), nn.ModuleDict({task: nn.CrossEntropyLoss(ignore_index=-1) for task in tasks}))
+    optimizer = torch.optim.AdamW(list(model.parameters()) + list(loss_fn.parameters()), lr=0.0015)
+    steps, examples = 0, 0
+    dist.barrier()
+    start = time.perf_counter()
+    for x, edge_index, edge_type, labels, onset_div, lengths in loader:
+        prediction = model((x, edge_index, edge_type, edge_index[:, edge_type == 0], unique_onsets(onset_div), lengths))
+        loss = loss_fn(prediction, {task: labels[task].reshape(-1) for task in tasks})["total"]
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        steps += 1
+        examples += len(lengths)
+        if steps == args.max_steps:
+            break
+    elapsed = time.perf_counter() - start
+    stats = torch.tensor([examples, steps, len(loader.batch_sampler)], dtype=torch.float64)
+    gathered = [torch.zeros_like(stats) for _ in range(world_size)]
+    dist.all_gather(gathered, stats)
+    elapsed = torch.tensor([elapsed])
+    dist.all_reduce(elapsed, op=dist.ReduceOp.MAX)
+    if rank == 0:
+        results[world_size] = (elapsed.item(), [g.tolist() for g in gathered])
+    dist.destroy_process_group()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Distributed CPU training benchmark")
+    parser.add_argument("--num_processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--max_steps", type=int, default=50)
+    parser.add_argument("--batch_size", type=int, default=16)
+    parser.add_argument("--num_threads", type=int, default=1, help="Torch threads of every process")
+    parser.add_argument("--num_tasks", type=int, default=11)
+    parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"])
+    parser.add_argument("--port", type=int, default=29517)
+    args = parser.parse_args()
+
+    # Process (or load) the dataset once, before the processes open it.
+    make_datamodule(args)
+    results = mp.Manager().dict()
+    for world_size in args.num_processes:
+        mp.spawn(train, args=(world_size, args, results), nprocs=world_size, join=True)
+        args.port += 1
+
+    base = None
+    print("{:>10} {:>10} {:>12} {:>10} {:>11} {:>22}".format(
+        "processes", "time (s)", "examples/s", "speedup", "efficiency", "batches per rank"))
+    for world_size in args.num_processes:
+        elapsed, ranks = results[world_size]
+        throughput = sum(r[0] for r in ranks) / elapsed
+        base = base or throughput / world_size
+        print("{:>10} {:>10.1f} {:>12.1f} {:>9.2f}x {:>10.0%} {:>22}".format(
+            world_size, elapsed, throughput, throughput / base, throughput / (base * world_size),
+            "/".join(str(int(r[2])) for r in ranks)))
@@ -0,0 +1,63 @@
+"""
+Import time, model load time and per-score latency of the exported models against the checkpoint path of analyse_score.py.
+
+Export the model first with export_model.py.
+
+Usage: PYTHONPATH=. python benchmarks/bench_export.py --export_dir artifacts/export --score_dir data/mozart --max_scores 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+def import_time(statement):
+    """Wall time of a fresh interpreter running the statement, the interpreter start-up included."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Exported model benchmark")
+    parser.add_argument("--use_ckpt", type=str, default="melkisedeath/chord_rec/model-kvd0jic5:v0")
+    parser.add_argument("--export_dir", type=str, default="./artifacts/export")
+    parser.add_argument("--score_dir", type=str, default="data/mozart")
+    parser.add_argument("--max_scores", type=int, default=10)
+    parser.add_argument("--num_threads", type=int, default=1)
+    args = parser.parse_args()
+
+    paths = {"torchscript": os.path.join(args.export_dir, "chordgnn.pt"),
+             "onnx": os.path.join(args.export_dir, "chordgnn.onnx")}
+    print("{:>12} {:>10}".format("import", "time (s)"))
+    for name, statement in [("checkpoint", "from analyse_score import load_models"),
+                            ("torchscript", "import torch"), ("onnx", "import onnxruntime")]:
+        print("{:>12} {:>10.2f}".format(name, import_time(statement)))
+
+    import torch
+    import partitura as pt
+    from analyse_score import load_models
+    from chordgnn.models.export import ExportedChordModel
+
+    torch.set_num_threads(args.num_threads)
+    start = time.perf_counter()
+    encoder, model = load_models(args.use_ckpt)
+    runners = {"checkpoint": (time.perf_counter() - start, lambda score: model.predict(encoder.predict(score)))}
+    for name, path in paths.items():
+        start = time.perf_counter()
+        runner = ExportedChordModel(path, num_threads=args.num_threads)
+        runners[name] = (time.perf_counter() - start, runner.predict)
+
+    files = sorted(f for f in os.listdir(args.score_dir) if f.endswith(".xml") and "-analysis" not in f)
+    scores = [pt.load_score(os.path.join(args.score_dir, f)) for f in files[:args.max_scores]]
+    with torch.no_grad():
+        reference = [runners["checkpoint"][1](score) for score in scores]
+        print("{:>12} {:>10} {:>16} {:>12}".format("model", "load (s)", "latency (ms)", "max diff"))
+        for name, (load_time, predict) in runners.items():
+            start = time.perf_counter()
+            predictions = [predict(score) for score in scores]
+            latency = (time.perf_counter() - start) / len(scores)
+            diff = max((p[task] - r[task]).abs().max().item()
+                       for p, r in zip(predictions, reference) for task in encoder.tasks)
+            print("{:>12} {:>10.2f} {:>16.1f} {:>12.2e}".format(name, load_time, latency * 1000, diff))
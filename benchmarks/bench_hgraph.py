@@ -0,0 +1,59 @@
+"""
+Benchmark the hetero graph builders on synthetic scores of increasing size.
+
+Usage: PYTHONPATH=. python benchmarks/bench_hgraph.py --sizes 1000 10000 100000 --legacy_max 10000
+"""
+import argparse
+import time
+import numpy as np
+from chordgnn.utils.hgraph import hetero_graph_from_note_array, fast_hetero_graph_from_note_array
+
+
+def synthetic_note_array(n_notes, seed=0):
+    """A piano-like note array with chords, held notes and occasional gaps between onsets."""
+    rng = np.random.default_rng(seed)
+    chord_sizes = rng.integers(1, 5, size=n_notes)
+    n_onsets = np.searchsorted(np.cumsum(chord_sizes), n_notes) + 1
+    steps = rng.choice([1, 2, 3, 4, 6, 8, 12], size=n_onsets) + (rng.random(n_onsets) < 0.1) * rng.integers(1, 3, size=n_onsets)
+    onsets = np.repeat(np.r_[0, np.cumsum(steps)[:-1]], chord_sizes[:n_onsets])[:n_notes]
+    durations = rng.choice([1, 2, 3, 4, 6, 8, 12, 16, 24, 48], size=n_notes)
+    note_array = np.zeros(n_notes, dtype=[
+        ("onset_div", int), ("duration_div", int), ("onset_beat", float), ("duration_beat", float),
+        ("ts_beats", int), ("ts_beat_type", int), ("pitch", int)])
+    note_array["onset_div"] = onsets
+    note_array["duration_div"] = durations
+    note_array["onset_beat"] = onsets / 12
+    note_array["duration_beat"] = durations / 12
+    note_array["ts_beats"] = 4
+    note_array["ts_beat_type"] = 4
+    note_array["pitch"] = rng.integers(30, 90, size=n_notes)
+    return note_array
+
+
+def time_builder(fn, note_array, repeats):
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn(note_array.copy())
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Hetero graph builder benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000, 10000, 30000, 100000])
+    parser.add_argument("--legacy_max", type=int, default=10000, help="Largest size to run the O(N^2) legacy builder on.")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:>8} {:>10} {:>12} {:>12} {:>9} {:>7}".format("notes", "edges", "legacy (s)", "sweep (s)", "speedup", "equal"))
+    for n in args.sizes:
+        note_array = synthetic_note_array(n)
+        t_fast, (_, edges_fast) = time_builder(fast_hetero_graph_from_note_array, note_array, args.repeats)
+        if n <= args.legacy_max:
+            t_legacy, (_, edges_legacy) = time_builder(hetero_graph_from_note_array, note_array, 1)
+            equal = edges_legacy.shape == edges_fast.shape and bool(np.all(edges_legacy == edges_fast))
+            print("{:>8} {:>10} {:>12.4f} {:>12.4f} {:>8.1f}x {:>7}".format(
+                n, edges_fast.shape[1], t_legacy, t_fast, t_legacy / t_fast, str(equal)))
+        else:
+            print("{:>8} {:>10} {:>12} {:>12.4f} {:>9} {:>7}".format(n, edges_fast.shape[1], "-", t_fast, "-", "-"))
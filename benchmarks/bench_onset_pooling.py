@@ -0,0 +1,51 @@
+"""
+Microbenchmark of the onset edge contraction of OnsetEdgePoolingVersion2, vectorized against edge by edge.
+
+Usage: PYTHONPATH=. python benchmarks/bench_onset_pooling.py --n_notes 2000 --device cuda
+"""
+import argparse
+import time
+import numpy as np
+import torch
+from chordgnn.models.chord import OnsetEdgePoolingVersion2
+
+
+def onset_edges(n_notes, seed=0):
+    """The onset edges of a random score, every pair of notes of an onset sorted by source then target."""
+    rng = np.random.default_rng(seed)
+    onsets = np.repeat(np.arange(n_notes), rng.integers(1, 6, n_notes))[:n_notes]
+    src, dst = np.nonzero(onsets[:, None] == onsets[None, :])
+    mask = src != dst
+    return torch.tensor(np.vstack((src[mask], dst[mask])))
+
+
+def timed(fn, repeats, device):
+    out = fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        out = fn()
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Onset edge pooling benchmark")
+    parser.add_argument("--n_notes", type=int, default=2000)
+    parser.add_argument("--n_hidden", type=int, default=256)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--device", type=str, default="cpu")
+    args = parser.parse_args()
+
+    device = torch.device(args.device)
+    pool = OnsetEdgePoolingVersion2(args.n_hidden).to(device)
+    edge_index = onset_edges(args.n_notes).to(device)
+    x = torch.randn(args.n_notes, args.n_hidden, device=device)
+    t_seq, (x_seq, mask_seq) = timed(lambda: pool.__merge_edges_sequential__(x, edge_index), args.repeats, device)
+    t_vec, (x_vec, mask_vec) = timed(lambda: pool.__merge_edges__(x, edge_index), args.repeats, device)
+    print("{} notes, {} onset edges, {} kept nodes".format(args.n_notes, edge_index.size(1), int(mask_vec.sum())))
+    print("edge by edge: {:.2f} ms, vectorized: {:.2f} ms, speedup: {:.1f}x".format(
+        t_seq * 1000, t_vec * 1000, t_seq / t_vec))
+    print("identical mask: {}".format(bool(torch.equal(mask_seq.to(device), mask_vec) and torch.equal(x_seq, x_vec))))
@@ -0,0 +1,64 @@
+"""
+Microbenchmark of the pitch class set lookup tables against computing the set features per call.
+
+Usage: PYTHONPATH=. python benchmarks/bench_pcset_table.py --n_chords 100000
+"""
+import argparse
+import time
+from itertools import combinations
+import numpy as np
+from chordgnn.utils.chord_representations import chord_to_intervalVector
+from chordgnn.utils.pcset_table import INTERVAL_VECTORS, CHORD_MATCHES, NORMAL_FORMS, CHORDS, pc_mask, mask_to_pcs, _normal_form
+
+
+def combinations_interval_vector(midi_pitches):
+    """The per-call set and combinations implementation the tables replace."""
+    interval_vector = [0, 0, 0, 0, 0, 0]
+    pcs = set([mp % 12 for mp in midi_pitches])
+    for p1, p2 in combinations(pcs, 2):
+        interval = int(abs(p1 - p2))
+        index = interval if interval <= 6 else 12 - interval
+        if index != 0:
+            interval_vector[index - 1] += 1
+    return interval_vector
+
+
+def random_chords(n_chords, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(30, 90, size=rng.integers(1, 7)).tolist() for _ in range(n_chords)]
+
+
+def timed(fn, chords):
+    start = time.perf_counter()
+    out = [fn(chord) for chord in chords]
+    return time.perf_counter() - start, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Pitch class set table benchmark")
+    parser.add_argument("--n_chords", type=int, default=100000)
+    args = parser.parse_args()
+
+    chords = random_chords(args.n_chords)
+    templates = list(CHORDS.values())
+    rows = [
+        ("interval vector", lambda c: combinations_interval_vector(c),
+         lambda c: chord_to_intervalVector(c)),
+        ("CHORDS match", lambda c: [combinations_interval_vector(c) == v for v in templates],
+         lambda c: CHORD_MATCHES[pc_mask(c)].tolist()),
+        ("normal form", lambda c: _normal_form(mask_to_pcs(pc_mask(c)))[0],
+         lambda c: list(NORMAL_FORMS[pc_mask(c)])),
+    ]
+    print("{:>16} {:>12} {:>12} {:>9} {:>7}".format("feature", "compute (s)", "table (s)", "speedup", "equal"))
+    for name, compute, lookup in rows:
+        t_compute, out_compute = timed(compute, chords)
+        t_table, out_table = timed(lookup, chords)
+        print("{:>16} {:>12.4f} {:>12.4f} {:>8.1f}x {:>7}".format(
+            name, t_compute, t_table, t_compute / t_table, str(out_compute == out_table)))
+
+    # Vectorized lookup of a whole score's chords at once.
+    masks = np.array([pc_mask(c) for c in chords])
+    start = time.perf_counter()
+    INTERVAL_VECTORS[masks]
+    CHORD_MATCHES[masks]
+    print("batched table lookup of {} chords: {:.4f}s".format(len(chords), time.perf_counter() - start))
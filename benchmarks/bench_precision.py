@@ -0,0 +1,54 @@
+"""
+Epoch time and peak memory of ChordPrediction training in mixed precision against the fp32 baseline.
+
+Every precision trains the same freshly seeded model for a few (possibly truncated) epochs, the first epoch
+is a warm-up and is left out of the mean epoch time.
+
+Usage: PYTHONPATH=. python benchmarks/bench_precision.py --gpus 0 --precisions 32 16 bf16 --n_epochs 3 --limit_train_batches 200
+"""
+import argparse
+import torch
+import chordgnn as st
+from pytorch_lightning import Trainer, seed_everything
+from chordgnn.train.callbacks import EpochStatsCallback, trainer_precision
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Mixed precision training benchmark")
+    parser.add_argument("--gpus", type=int, default=0, help="GPU id, -1 for the CPU")
+    parser.add_argument("--precisions", type=str, nargs="+", default=["32", "16", "bf16"])
+    parser.add_argument("--n_epochs", type=int, default=3)
+    parser.add_argument("--limit_train_batches", type=float, default=1.0)
+    parser.add_argument("--batch_size", type=int, default=100)
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--num_tasks", type=int, default=11)
+    parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"])
+    args = parser.parse_args()
+
+    datamodule = st.data.AugmentedGraphDatamodule(
+        num_workers=args.num_workers, num_tasks=args.num_tasks, batch_size=args.batch_size, version=args.data_version)
+    results = dict()
+    for precision in args.precisions:
+        seed_everything(0)
+        model = st.models.chord.ChordPrediction(
+            datamodule.features, 256, datamodule.tasks, 1, lr=0.0015, dropout=0.44, weight_decay=0.0035,
+            device=args.gpus if args.gpus >= 0 else "cpu")
+        stats = EpochStatsCallback(verbose=False)
+        trainer = Trainer(
+            max_epochs=args.n_epochs, accelerator="gpu" if args.gpus >= 0 else "cpu",
+            devices=[args.gpus] if args.gpus >= 0 else 1, precision=trainer_precision(precision),
+            limit_train_batches=args.limit_train_batches, limit_val_batches=0, num_sanity_val_steps=0,
+            logger=False, enable_checkpointing=False, enable_progress_bar=False, callbacks=[stats])
+        trainer.fit(model, datamodule)
+        epochs = stats.history[1:] if len(stats.history) > 1 else stats.history
+        results[precision] = (sum(e["epoch_time"] for e in epochs) / len(epochs),
+                              max(e["peak_memory"] for e in stats.history),
+                              trainer.callback_metrics["train_loss"].item())
+        if args.gpus >= 0:
+            torch.cuda.empty_cache()
+
+    baseline = results.get("32", next(iter(results.values())))
+    print("{:>10} {:>14} {:>10} {:>16} {:>12}".format("precision", "epoch time (s)", "speedup", "peak memory (MB)", "train loss"))
+    for precision, (epoch_time, peak_memory, loss) in results.items():
+        print("{:>10} {:>14.1f} {:>9.2f}x {:>16.0f} {:>12.4f}".format(
+            precision, epoch_time, baseline[0] / epoch_time, peak_memory, loss))
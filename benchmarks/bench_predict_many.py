@@ -0,0 +1,54 @@
+"""
+Inference throughput of ChordPredictionModel.predict_many against predicting the scores one by one.
+
+The scores are loaded once, so only the graph construction and the model are timed.
+
+Usage: PYTHONPATH=. python benchmarks/bench_predict_many.py --score_dir data/mozart --batch_sizes 1 4 16 --ckpt artifacts/model-kvd0jic5:v0/model.ckpt
+"""
+import argparse
+import os
+import time
+import partitura as pt
+import torch
+from chordgnn.models.chord import ChordPrediction, PostChordPrediction
+
+
+TASKS = {
+    "localkey": 38, "tonkey": 38, "degree1": 22, "degree2": 22, "quality": 11, "inversion": 4,
+    "root": 35, "romanNumeral": 31, "hrhythm": 7, "pcset": 121, "bass": 35, "tenor": 35,
+    "alto": 35, "soprano": 35}
+
+
+def load_models(ckpt):
+    encoder = ChordPrediction(in_feats=83, n_hidden=256, tasks=TASKS, n_layers=1, lr=0.0, dropout=0.0,
+                              weight_decay=0.0, use_nade=False, use_jk=False, use_rotograd=False, device="cpu").module
+    model = PostChordPrediction(83, 256, TASKS, 1, device="cpu", frozen_model=encoder)
+    if ckpt is not None:
+        model = model.load_from_checkpoint(ckpt)
+    return model.frozen_model.eval(), model.module.eval()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Batched inference benchmark")
+    parser.add_argument("--score_dir", type=str, default="data/mozart")
+    parser.add_argument("--max_scores", type=int, default=32)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--ckpt", type=str, default=None, help="PostChordPrediction checkpoint, random weights if not given")
+    args = parser.parse_args()
+
+    paths = sorted(os.path.join(args.score_dir, f) for f in os.listdir(args.score_dir)
+                   if f.endswith((".xml", ".musicxml", ".krn", ".mei")) and "-analysis" not in f)[:args.max_scores]
+    scores = [pt.load_score(path) for path in paths]
+    encoder, post_processing = load_models(args.ckpt)
+    with torch.no_grad():
+        start = time.perf_counter()
+        single = [post_processing.predict(encoder.predict(score)) for score in scores]
+        t_single = time.perf_counter() - start
+        print("{:>12} {:>10} {:>10} {:>12}".format("batch size", "time (s)", "scores/s", "max diff"))
+        print("{:>12} {:>10.2f} {:>10.2f} {:>12}".format("one by one", t_single, len(scores) / t_single, "-"))
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            many = encoder.predict_many(scores, batch_size=batch_size, post_processing=post_processing)
+            elapsed = time.perf_counter() - start
+            diff = max((a[task] - b[task]).abs().max().item() for a, b in zip(single, many) for task in TASKS)
+            print("{:>12} {:>10.2f} {:>10.2f} {:>12.2e}".format(batch_size, elapsed, len(scores) / elapsed, diff))
@@ -0,0 +1,70 @@
+"""
+Accuracy against latency of the int8 dynamically quantized chord models, on the test split.
+
+Runs the test step of PostChordPrediction with the fp32 and the quantized models on the CPU and reports the
+per-task accuracy, the Roman Numeral CSR (chord symbol recall), the latency per test score and the model size.
+
+Usage: PYTHONPATH=. python benchmarks/bench_quantize.py --ckpt artifacts/model-kvd0jic5:v0/model.ckpt --data_version latest --num_threads 1
+"""
+import argparse
+import io
+import time
+import torch
+import chordgnn as st
+from pytorch_lightning import Trainer
+from chordgnn.models.chord import ChordPrediction, PostChordPrediction
+from chordgnn.models.export import quantize_models
+
+
+def model_size(*models):
+    """Size of the serialized state dicts, in MB."""
+    buffer = io.BytesIO()
+    for model in models:
+        torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def run_test(model, datamodule):
+    trainer = Trainer(accelerator="cpu", devices=1, logger=False, enable_progress_bar=False)
+    start = time.perf_counter()
+    metrics = trainer.test(model, datamodule, verbose=False)[0]
+    return metrics, (time.perf_counter() - start) / len(datamodule.dataset_test)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Int8 quantization benchmark")
+    parser.add_argument("--ckpt", type=str, default="artifacts/model-kvd0jic5:v0/model.ckpt",
+                        help="PostChordPrediction checkpoint")
+    parser.add_argument("--data_version", type=str, default="latest", choices=["v1.0.0", "latest"])
+    parser.add_argument("--num_tasks", type=int, default=14)
+    parser.add_argument("--collection", type=str, default="all")
+    parser.add_argument("--num_workers", type=int, default=4)
+    parser.add_argument("--num_threads", type=int, default=1)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.num_threads)
+    datamodule = st.data.AugmentedGraphDatamodule(
+        num_workers=args.num_workers, num_tasks=args.num_tasks, collection=args.collection, version=args.data_version)
+    encoder = ChordPrediction(datamodule.features, 256, datamodule.tasks, 1, lr=0.0, dropout=0.0, weight_decay=0.0,
+                              use_nade=False, use_jk=False, use_rotograd=False, device="cpu").module
+    model = PostChordPrediction(datamodule.features, 256, datamodule.tasks, 1, device="cpu", frozen_model=encoder)
+    model = model.load_from_checkpoint(args.ckpt, map_location="cpu")
+    fp32 = (model.frozen_model.eval(), model.module.eval())
+    int8 = quantize_models(*fp32)
+
+    results = dict()
+    for name, (frozen_model, module) in [("fp32", fp32), ("int8", int8)]:
+        model.frozen_model, model.module = frozen_model, module
+        metrics, latency = run_test(model, datamodule)
+        results[name] = (metrics, latency, model_size(frozen_model, module))
+
+    metric_names = [f"Test {task}" for task in datamodule.tasks] + [
+        name for name in results["fp32"][0] if name.endswith("CSR") or name.startswith("Test Roman Numeral")]
+    print("{:>36} {:>10} {:>10} {:>10}".format("metric", "fp32", "int8", "diff"))
+    for name in dict.fromkeys(metric_names):
+        a, b = results["fp32"][0][name], results["int8"][0][name]
+        print("{:>36} {:>10.4f} {:>10.4f} {:>+10.4f}".format(name, a, b, b - a))
+    for i, label in [(1, "latency per score (ms)"), (2, "model size (MB)")]:
+        a, b = results["fp32"][i], results["int8"][i]
+        scale = 1000 if i == 1 else 1
+        print("{:>36} {:>10.1f} {:>10.1f} {:>10.2f}x".format(label, a * scale, b * scale, a / b))
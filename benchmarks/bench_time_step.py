@@ -0,0 +1,48 @@
+"""
+Latency of the time-step (CSR) expansion of the onset accuracies, against a row by row expansion as done
+before, on synthetic pieces of increasing length.
+
+Both expansions are compared on every piece.
+
+Usage: PYTHONPATH=. python benchmarks/bench_time_step.py --num_onsets 500 2000 8000 --reference_limit 2000
+"""
+import argparse
+import time
+import numpy as np
+from chordgnn.models.chord import time_step_accuracy
+
+
+def loop_time_step_accuracy(acc, onset, step=0.125):
+    """The row by row expansion of acc_compute_time_step before it was vectorized."""
+    rows = [(o - onset.min(), a) for o, a in zip(onset, acc)]
+    for i in range(1, len(onset)):
+        row_onset = onset[i - 1]
+        for _ in range(int((onset[i] - onset[i - 1]) / step) - 1):
+            row_onset = row_onset + step
+            rows.append((row_onset, acc[i - 1]))
+    rows.sort(key=lambda r: r[0])
+    return np.array([a for _, a in rows])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Time-step accuracy benchmark")
+    parser.add_argument("--num_onsets", type=int, nargs="+", default=[500, 2000, 8000])
+    parser.add_argument("--reference_limit", type=int, default=2000, help="Longest piece to run the loop on")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>12} {:>16} {:>14} {:>10}".format("onsets", "time steps", "vectorized (ms)", "loop (ms)", "equal"))
+    for num_onsets in args.num_onsets:
+        onset = np.cumsum(np.r_[0, rng.choice([0.125, 0.25, 0.5, 1.0, 1.5], num_onsets - 1)])
+        acc = (rng.random(num_onsets) > 0.3).astype(np.float32)
+        start = time.perf_counter()
+        expanded = time_step_accuracy(acc, onset)
+        vectorized = time.perf_counter() - start
+        loop, equal = float("nan"), "-"
+        if num_onsets <= args.reference_limit:
+            start = time.perf_counter()
+            reference = loop_time_step_accuracy(acc, onset)
+            loop = time.perf_counter() - start
+            equal = np.array_equal(reference, expanded)
+        print("{:>10} {:>12} {:>16.2f} {:>14.1f} {:>10}".format(
+            num_onsets, len(expanded), vectorized * 1e3, loop * 1e3, str(equal)))
@@ -0,0 +1,81 @@
+"""
+Parsing throughput of the typed tsv reader against the eval based parsing it replaces, over the AugmentedNet tsv files.
+
+Usage: PYTHONPATH=. python benchmarks/bench_tsv_reader.py --dataset_dir ~/.chordgnn/AugmentedNetChordDataset --max_files 100
+"""
+import argparse
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+import partitura
+from chordgnn.utils.globals import ALTER
+from chordgnn.utils.tsv_reader import read_time_divided_tsv, frames_to_note_array, NOTE_ARRAY_DTYPE
+
+
+def eval_read(path):
+    """The eval based reading of the list valued columns the reader replaces."""
+    df = pd.read_csv(path, sep='\t', header=0)
+    has_onsets = df["s_isOnset"].apply(lambda x: any(eval(x))).to_numpy()
+    num_notes = df["s_isOnset"].apply(lambda x: len(eval(x))).to_numpy()
+    return df, has_onsets, num_notes
+
+
+def eval_note_array(df, time_signature):
+    """The per row and per note construction of the note array the reader replaces."""
+    note_array = list()
+    for i, row in df.iterrows():
+        for pitch in eval(row["s_notes"]):
+            p = re.findall(r'[A-Za-z]+|\W+|\d+', pitch)
+            step, alter, octave = (p[0], p[1], eval(p[2])) if len(p) == 3 else (p[0], "", eval(p[1]))
+            alter = ALTER[alter]
+            mp = partitura.utils.pitch_spelling_to_midi_pitch(step, alter, octave)
+            note_array.append((row["j_offset"], row["s_duration"], mp, int(time_signature), 4, step, alter, octave))
+    return np.array(note_array, NOTE_ARRAY_DTYPE)
+
+
+def tsv_files(dataset_dir, max_files):
+    files = list()
+    for root, dirs, names in os.walk(dataset_dir):
+        for name in names:
+            if name.endswith(".tsv") and not name.startswith("dataset_summary"):
+                files.append(os.path.join(root, name))
+    return sorted(files)[:max_files]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("Time divided tsv reader benchmark")
+    parser.add_argument("--dataset_dir", type=str,
+                        default=os.path.join(os.path.expanduser("~"), ".chordgnn", "AugmentedNetChordDataset"))
+    parser.add_argument("--max_files", type=int, default=100)
+    args = parser.parse_args()
+
+    files = tsv_files(args.dataset_dir, args.max_files)
+    if not files:
+        raise FileNotFoundError("No tsv files found in {}".format(args.dataset_dir))
+    t_eval, t_typed, n_frames, n_notes, equal = 0.0, 0.0, 0, 0, True
+    for path in files:
+        start = time.perf_counter()
+        df, has_onsets, num_notes = eval_read(path)
+        if "j_offset" not in df.columns:
+            df["j_offset"] = df["Unnamed: 0"]
+        expected = eval_note_array(df, 4)
+        t_eval += time.perf_counter() - start
+
+        start = time.perf_counter()
+        typed_df, typed_has_onsets, typed_num_notes = read_time_divided_tsv(path)
+        if "j_offset" not in typed_df.columns:
+            typed_df["j_offset"] = typed_df["Unnamed: 0"]
+        note_array = frames_to_note_array(typed_df, 4)
+        t_typed += time.perf_counter() - start
+
+        equal &= bool(np.array_equal(expected, note_array) and np.array_equal(has_onsets, typed_has_onsets)
+                      and np.array_equal(num_notes, typed_num_notes))
+        n_frames += len(df)
+        n_notes += len(note_array)
+    print("{} files, {} frames, {} notes".format(len(files), n_frames, n_notes))
+    print("{:>8} {:>10} {:>14} {:>14}".format("reader", "time (s)", "frames/s", "notes/s"))
+    for name, elapsed in [("eval", t_eval), ("typed", t_typed)]:
+        print("{:>8} {:>10.3f} {:>14.0f} {:>14.0f}".format(name, elapsed, n_frames / elapsed, n_notes / elapsed))
+    print("speedup: {:.1f}x, identical output: {}".format(t_eval / t_typed, equal))
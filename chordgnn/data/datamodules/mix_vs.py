@@ -1,14 +1,15 @@
 from pytorch_lightning import LightningDataModule
+from functools import partial
+import numpy as np
 import torch
-from torch.utils.data import ConcatDataset
+from torch.utils.data import ConcatDataset, Subset
 from chordgnn.data.datasets import (
     AugmentedNetChordGraphDataset,
     Augmented2022ChordGraphDataset,
 )
 from collections import defaultdict
-from chordgnn.utils import add_reverse_edges_from_edge_index
-from chordgnn.data.samplers import BySequenceLengthSampler
-import numpy as np
+from chordgnn.utils import add_reverse_edges_from_edge_index, batch_graphs
+from chordgnn.data.samplers import BySequenceLengthSampler, TokenBudgetBatchSampler
 
 
 
@@ -21,21 +22,64 @@ def idx_tuple_to_dict(idx_tuple, datasets_map):
     return result_dict
 
 
+def collate_train_graphs(examples, version="v1.0.0"):
+    """Collate cropped training graphs into a batch, module level so that the loader workers receive it
+    without the datamodule and its datasets."""
+    lengths = list()
+    x = list()
+    edge_index = list()
+    edge_types = list()
+    y = list()
+    onset_divs = list()
+    for e in examples:
+        lengths.append(e[3].shape[0])
+        x.append(e[0])
+        edge_index.append(e[1])
+        edge_types.append(e[2])
+        y.append(e[3])
+        onset_divs.append(e[4])
+    x, edge_index, edge_types, onset_divs, lengths, perm_idx = batch_graphs(
+        x, edge_index, edge_types, onset_divs, lengths)
+    # y = torch.cat([y[i] for i in perm_idx], dim=0).float()
+    # batch_label = {task: y[:, i].squeeze().long() for i, task in
+    #                enumerate(available_representations.keys())}
+    # batch_label["onset"] = y[:, -1]
+    y = torch.nn.utils.rnn.pad_sequence([y[i] for i in perm_idx], batch_first=True, padding_value=-1)
+    if version == "v1.0.0":
+        from chordgnn.utils.chord_representations import available_representations
+    else:
+        from chordgnn.utils.chord_representations_latest import available_representations
+    batch_label = {task: y[:, :, i].squeeze().long() for i, task in
+                   enumerate(available_representations.keys())}
+    batch_label["onset"] = y[:, :, -1]
+    return x, edge_index, edge_types, batch_label, onset_divs, lengths
+
+
 class AugmentedGraphDatamodule(LightningDataModule):
-    def __init__(self, batch_size=1, num_workers=4, force_reload=False, include_synth=False, num_tasks=11, collection="all", version="v1.0.0"):
+    def __init__(self, batch_size=1, num_workers=4, force_reload=False, include_synth=False, num_tasks=11, collection="all", version="v1.0.0", lazy=False, online_transpose=False, prefetch_factor=2, pin_memory=None, seed=None, max_nodes=None, max_edges=None, max_onsets=None):
         super(AugmentedGraphDatamodule, self).__init__()
         self.bucket_boundaries = [50, 100, 150, 200, 250, 300, 350, 400, 450, 500]
         self.batch_size = batch_size
         self.num_workers = num_workers
+        # Batches prefetched by every training worker, and pinned memory for the host to GPU copies.
+        self.prefetch_factor = prefetch_factor
+        self.pin_memory = torch.cuda.is_available() if pin_memory is None else pin_memory
+        self.seed = seed
+        # Budgets of a training batch, batches are formed by the TokenBudgetBatchSampler when any is given.
+        self.max_nodes = max_nodes
+        self.max_edges = max_edges
+        self.max_onsets = max_onsets
         self.force_reload = force_reload
         self.normalize_features = True
         self.version = version
         data_source = AugmentedNetChordGraphDataset(
             force_reload=self.force_reload, nprocs=self.num_workers,
-            include_synth=include_synth, num_tasks=num_tasks, collection=collection
+            include_synth=include_synth, num_tasks=num_tasks, collection=collection, lazy=lazy,
+            online_transpose=online_transpose
         ) if version=="v1.0.0" else Augmented2022ChordGraphDataset(
                     force_reload=self.force_reload, nprocs=self.num_workers,
-                    include_synth=include_synth, num_tasks=num_tasks, collection=collection)
+                    include_synth=include_synth, num_tasks=num_tasks, collection=collection, lazy=lazy,
+                    online_transpose=online_transpose)
         self.datasets = [data_source]
         self.tasks = self.datasets[0].tasks
         if not (all([d.features == self.datasets[0].features for d in self.datasets])):
@@ -52,10 +96,11 @@ class AugmentedGraphDatamodule(LightningDataModule):
 
         idxs = range(len(self.datasets_map))
 
+        # Splits are read from the dataset index, so that lazy datasets do not materialize any graph here.
         test_idx = [
             i
             for i in idxs
-            if self.datasets[self.datasets_map[i][0]].graphs[
+            if self.datasets[self.datasets_map[i][0]].index[
                    self.datasets_map[i][1]].collection == "test"
         ]
 
@@ -69,7 +114,7 @@ class AugmentedGraphDatamodule(LightningDataModule):
         train_idx = [
             i
             for i in idxs
-            if self.datasets[self.datasets_map[i][0]].graphs[
+            if self.datasets[self.datasets_map[i][0]].index[
                    self.datasets_map[i][1]].collection == "training"
         ]
 
@@ -82,10 +127,22 @@ class AugmentedGraphDatamodule(LightningDataModule):
         train_idx_dict = idx_tuple_to_dict(train_idx, self.datasets_map)
         # val_idx_dict = idx_tuple_to_dict(val_idx, self.datasets_map)
 
-        # create the datasets
-        self.dataset_train = ConcatDataset([self.datasets[k][train_idx_dict[k]] for k in train_idx_dict.keys()])
+        # create the datasets, training graphs are cropped (and materialized by lazy datasets) when they are
+        # sampled, in the loader workers, and online transposition draws a new interval every time
+        self.dataset_train = ConcatDataset([Subset(self.datasets[k], train_idx_dict[k]) for k in train_idx_dict.keys()])
         # self.dataset_val = ConcatDataset([self.datasets[k][val_idx_dict[k]] for k in val_idx_dict.keys()])
-        self.dataset_test = ConcatDataset([self.datasets[k][test_idx_dict[k]] for k in test_idx_dict.keys()])
+        self.dataset_test = ConcatDataset([
+            Subset(self.datasets[k], test_idx_dict[k]) if self.datasets[k].lazy else self.datasets[k][test_idx_dict[k]]
+            for k in test_idx_dict.keys()])
+        # nodes, edges and onsets of every training example after cropping, for the batch samplers, the edges
+        # and onsets of cropped examples are estimated in proportion to the kept nodes
+        entries = [(self.datasets[k].index[i], self.datasets[k].max_size) for k in train_idx_dict.keys() for i in train_idx_dict[k]]
+        self.train_sizes = np.array(
+            [(entry.num_nodes, entry.num_edges, entry.num_labels) for entry, _ in entries], dtype=np.int64).reshape(-1, 3)
+        max_sizes = np.array([max_size for _, max_size in entries])
+        scale = np.minimum(1.0, max_sizes / np.maximum(self.train_sizes[:, 0], 1))
+        self.train_sizes = np.ceil(self.train_sizes * scale[:, None]).astype(np.int64)
+        self.train_lengths = self.train_sizes[:, 0].tolist()
         print("Running on all collections")
         print(
             f"Train size :{len(self.dataset_train)}, Val size :{len(self.dataset_test)}, Test size :{len(self.dataset_test)}"
@@ -112,56 +169,35 @@ class AugmentedGraphDatamodule(LightningDataModule):
         return batch_inputs, edges, edge_type, batch_label, onset_div, name
 
     def collate_train_fn(self, examples):
-        lengths = list()
-        x = list()
-        edge_index = list()
-        edge_types = list()
-        y = list()
-        onset_divs = list()
-        max_idx = []
-        max_onset_div = []
-        for e in examples:
-            lengths.append(e[3].shape[0])
-            x.append(e[0])
-            edge_index.append(e[1])
-            edge_types.append(e[2])
-            y.append(e[3])
-            onset_divs.append(e[4])
-            max_idx.append(e[0].shape[0])
-            max_onset_div.append(e[4].max().item() + 1)
-        lengths = torch.tensor(lengths).long()
-        lengths, perm_idx = lengths.sort(descending=True)
-        perm_idx = perm_idx.tolist()
-        max_idx = np.cumsum(np.array([0] + [max_idx[i] for i in perm_idx]))
-        max_onset_div = np.cumsum(np.array([0] + [max_onset_div[i] for i in perm_idx]))
-        x = torch.cat([x[i] for i in perm_idx], dim=0).float()
-        edge_index = torch.cat([edge_index[pi]+max_idx[i] for i, pi in enumerate(perm_idx)], dim=1).long()
-        edge_types = torch.cat([edge_types[i] for i in perm_idx], dim=0).long()
-        # y = torch.cat([y[i] for i in perm_idx], dim=0).float()
-        # batch_label = {task: y[:, i].squeeze().long() for i, task in
-        #                enumerate(available_representations.keys())}
-        # batch_label["onset"] = y[:, -1]
-        y = torch.nn.utils.rnn.pad_sequence([y[i] for i in perm_idx], batch_first=True, padding_value=-1)
-        if self.version == "v1.0.0":
-            from chordgnn.utils.chord_representations import available_representations
-        else:
-            from chordgnn.utils.chord_representations_latest import available_representations
-        batch_label = {task: y[:, :, i].squeeze().long() for i, task in
-                       enumerate(available_representations.keys())}
-        batch_label["onset"] = y[:, :, -1]
-        onset_divs = torch.cat([onset_divs[pi]+max_onset_div[i] for i, pi in enumerate(perm_idx)], dim=0).long()
-        return x, edge_index, edge_types, batch_label, onset_divs, lengths
+        return collate_train_graphs(examples, version=self.version)
+
+    def train_sampler(self):
+        """The batch sampler of the training set, under the batch budgets if any is given.
+
+        In a distributed run every rank only samples (and reads the graphs of) its own shard of the training set.
+        """
+        trainer = getattr(self, "trainer", None)
+        num_replicas, rank = (trainer.world_size, trainer.global_rank) if trainer is not None else (None, None)
+        if any(budget is not None for budget in (self.max_nodes, self.max_edges, self.max_onsets)):
+            return TokenBudgetBatchSampler(
+                self.train_sizes, max_nodes=self.max_nodes, max_edges=self.max_edges, max_onsets=self.max_onsets,
+                seed=self.seed if self.seed is not None else 0, num_replicas=num_replicas, rank=rank)
+        return BySequenceLengthSampler(
+            self.dataset_train, self.bucket_boundaries, self.batch_size, lengths=self.train_lengths, seed=self.seed,
+            num_replicas=num_replicas, rank=rank)
 
     def train_dataloader(self):
-        sampler = BySequenceLengthSampler(self.dataset_train, self.bucket_boundaries, self.batch_size)
+        sampler = self.train_sampler()
+        # The workers crop the graphs and collate the batches, and are kept alive across epochs.
+        worker_kwargs = dict(
+            prefetch_factor=self.prefetch_factor, persistent_workers=True) if self.num_workers > 0 else dict()
         return torch.utils.data.DataLoader(
             self.dataset_train,
             batch_sampler=sampler,
-            batch_size=1,
-            num_workers=0,
-            collate_fn=self.collate_train_fn,
-            drop_last=False,
-            pin_memory=False,
+            num_workers=self.num_workers,
+            collate_fn=partial(collate_train_graphs, version=self.version),
+            pin_memory=self.pin_memory,
+            **worker_kwargs
         )
 
     def val_dataloader(self):
@@ -3,6 +3,7 @@ import warnings
 import errno
 import requests
 from git import Repo
+from chordgnn.data.manifest import file_sha1
 
 
 def check_sha1(filename, sha1_hash):
@@ -19,15 +20,7 @@ def check_sha1(filename, sha1_hash):
     bool
         Whether the file content matches the expected hash.
     """
-    sha1 = hashlib.sha1()
-    with open(filename, 'rb') as f:
-        while True:
-            data = f.read(1048576)
-            if not data:
-                break
-            sha1.update(data)
-
-    return sha1.hexdigest() == sha1_hash
+    return file_sha1(filename) == sha1_hash
 
 
 def makedirs(path):
@@ -1,16 +1,32 @@
 import numpy as np
-from chordgnn.utils import load_score_hgraph, hetero_graph_from_note_array, select_features, HeteroScoreGraph
-from chordgnn.utils import time_divided_tsv_to_part
+from chordgnn.utils import fast_hetero_graph_from_note_array, select_features, HeteroScoreGraph, crop_edges
+from chordgnn.utils import time_divided_tsv_to_part, time_divided_tsv_to_transposable_part
 from chordgnn.models.core import positional_encoding
-from chordgnn.utils.chord_representations import available_representations
+from chordgnn.utils.chord_representations import available_representations, transposition_tables
+from chordgnn.descriptors.utils.note_features import NOTE_FEATURES
 import torch
 import os
+import time
+import shutil
 from chordgnn.data.dataset import BuiltinDataset, chordgnnDataset
+from chordgnn.data.manifest import ProcessingManifest
+from chordgnn.data.graph_store import PackedGraphStore, LazyGraphList, pack_graph_dirs, packed_store_digest
 from joblib import Parallel, delayed
 from tqdm import tqdm
 import random
 
 
+# Bump when the graphs or features written by data_to_graph change, to reprocess cached scores.
+FEATURIZER_VERSION = "1"
+# Bump when the transposition tables written with the graphs of the online transposition mode change.
+TRANSPOSITION_TABLES_VERSION = "2"
+
+# Columns of the chord analysis features that change under transposition, the midi pitch and the
+# first columns of the two copies of the (7 steps, 7 alterations) spelling one-hots.
+PITCH_COLUMN = 0
+SPELLING_COLUMNS = (1, 16 + len(NOTE_FEATURES))
+
+
 class AugmentedNetChordDataset(BuiltinDataset):
     r"""The AugmentedNet Chord Dataset.
 
@@ -91,9 +107,14 @@ class AugmentedNetLatestChordDataset(BuiltinDataset):
 
 
 class ChordGraphDataset(chordgnnDataset):
-    def __init__(self, dataset_base, max_size=None, verbose=True, nprocs=1, name=None, raw_dir=None, force_reload=False, prob_pieces=[]):
+    def __init__(self, dataset_base, max_size=None, verbose=True, nprocs=1, name=None, raw_dir=None, force_reload=False, prob_pieces=[], lazy=False, cache_size=1024, online_transpose=False):
         self.dataset_base = dataset_base
         self.prob_pieces = prob_pieces
+        # In lazy mode only the graph index is kept in memory and graphs are materialized on access.
+        self.lazy = lazy
+        # In online transposition mode one graph is stored per score and transposed when it is sampled.
+        self.online_transpose = online_transpose
+        self.cache_size = cache_size
         self.dataset_base.process()
         self.max_size = max_size
         if verbose:
@@ -106,86 +127,191 @@ class ChordGraphDataset(chordgnnDataset):
             force_reload=force_reload,
             verbose=verbose)
 
+    @property
+    def featurizer_version(self):
+        """The version of the processed graphs, the online transposition mode writes different graphs."""
+        if self.online_transpose:
+            return FEATURIZER_VERSION + "-online" + TRANSPOSITION_TABLES_VERSION
+        return FEATURIZER_VERSION
+
+    @property
+    def manifest_path(self):
+        """The processing manifest of the dataset, next to its graph directory."""
+        return os.path.join(self.save_dir, self.name + "_manifest.jsonl")
+
     def process(self):
-        Parallel(self.n_jobs)(delayed(self._process_score)(fn) for fn in
-                              tqdm(self.dataset_base.scores, desc="Processing AugmentedNetChordGraphDataset"))
+        """Process the scores that are new, changed or featurized with another featurizer version.
+
+        Every finished score is appended to the processing manifest, so an interrupted run resumes
+        where it stopped. Throughput statistics are printed per worker when verbose.
+        """
+        manifest = ProcessingManifest(self.manifest_path, self.featurizer_version, reset=self._force_reload)
+        pending = manifest.pending(self.dataset_base.scores)
+        # Drop the graphs of scores that changed or left the dataset, a new version may have fewer transpositions.
+        for score_fn in manifest.removed(self.dataset_base.scores) + pending:
+            for graph_name in manifest.outputs(score_fn):
+                shutil.rmtree(os.path.join(self.save_path, graph_name), ignore_errors=True)
+            if score_fn in manifest.entries:
+                manifest.forget(score_fn)
+        if self.verbose:
+            print("{} of {} scores need processing.".format(len(pending), len(self.dataset_base.scores)))
+        worker_stats = dict()
+        chunk_size = max(1, self.n_jobs) * 8
+        with Parallel(self.n_jobs) as parallel, tqdm(total=len(pending), desc="Processing {}".format(self.name)) as pbar:
+            for start in range(0, len(pending), chunk_size):
+                results = parallel(delayed(self._process_and_time)(fn) for fn in pending[start:start + chunk_size])
+                for score_fn, outputs, elapsed, worker in results:
+                    manifest.record(score_fn, outputs)
+                    stats = worker_stats.setdefault(worker, [0, 0, 0.0])
+                    stats[0] += 1
+                    stats[1] += len(outputs)
+                    stats[2] += elapsed
+                    pbar.update(1)
+        manifest.compact()
+        if self.verbose:
+            for worker, (n_scores, n_graphs, elapsed) in sorted(worker_stats.items()):
+                print("Worker {}: {} scores, {} transpositions in {:.1f}s ({:.2f} scores/s, {:.2f} transpositions/s)".format(
+                    worker, n_scores, n_graphs, elapsed, n_scores / max(elapsed, 1e-9), n_graphs / max(elapsed, 1e-9)))
         self.load()
 
+    def _process_and_time(self, score_fn):
+        start = time.perf_counter()
+        outputs = self._process_score(score_fn)
+        return score_fn, outputs if outputs is not None else [], time.perf_counter() - start, os.getpid()
+
     def _process_score(self, score_fn):
+        """Process a score into graphs saved under save_path, returns the names of the saved graphs."""
         pass
+
     def has_cache(self):
-        # return True
-        if all([
-            os.path.exists(os.path.join(self.save_path, os.path.splitext(os.path.basename(path))[0])) for path
-            in
-            self.dataset_base.scores]):
-            return True
-        return False
+        if not os.path.exists(self.manifest_path):
+            return False
+        return not ProcessingManifest(self.manifest_path, self.featurizer_version).pending(self.dataset_base.scores)
 
     def save(self):
         """save the graph list and the labels"""
         pass
 
+    @property
+    def packed_path(self):
+        """The packed graph store of the dataset, next to its graph directory."""
+        return os.path.join(self.save_dir, self.name + "_packed")
+
     def load(self):
-        self.graphs = list()
-        for fn in os.listdir(self.save_path):
-            path = os.path.join(self.save_path, fn)
-            graph = load_score_hgraph(path, fn)
-            if not self.include_synth and graph.name.endswith("-synth"):
+        """Open the packed graph store, packing the processed graph directories first if it is outdated."""
+        if os.path.exists(self.manifest_path):
+            manifest = ProcessingManifest(self.manifest_path, self.featurizer_version)
+            graph_names, digest = sorted(manifest.outputs()), manifest.digest()
+        else:
+            graph_names, digest = sorted(os.listdir(self.save_path)), None
+        if digest is None or packed_store_digest(self.packed_path) != digest:
+            pack_graph_dirs(self.save_path, graph_names, self.packed_path, digest=digest or "")
+        self.store = PackedGraphStore(self.packed_path)
+        keep = list()
+        for i, (name, collection) in enumerate(zip(self.store.names, self.store.collections)):
+            if not self.include_synth and name.endswith("-synth"):
                 continue
-            if self.collection != "all" and not graph.name.startswith(
-                    self.collection) and graph.collection == "test":
+            if self.collection != "all" and not name.startswith(self.collection) and collection == "test":
                 continue
-            if graph.name in self.prob_pieces:
+            if name in self.prob_pieces:
                 continue
-            self.graphs.append(graph)
+            keep.append(i)
+        self.index = [self.store.index_entry(i) for i in keep]
+        if self.lazy:
+            self.graphs = LazyGraphList(self.store, keep, cache_size=self.cache_size)
+        else:
+            self.graphs = [self.store[i] for i in keep]
+        if self.online_transpose and self.store.transposable:
+            semitones, spellings = transposition_tables()
+            self.semitones, self.spellings = torch.from_numpy(semitones), torch.from_numpy(spellings)
 
     @property
     def features(self):
-        return self.graphs[0].x.shape[-1]
+        return self.store.arrays["x"].shape[-1]
 
     def __len__(self):
         return len(self.graphs)
 
     def __getitem__(self, idx):
+        if isinstance(idx, (int, np.integer)):
+            return self.get_graph_attr(idx)
         return [
             self.get_graph_attr(i)
             for i in idx
         ]
 
     def get_graph_attr(self, idx):
-        if self.graphs[idx].x.size(0) > self.max_size and self.graphs[idx].collection != "test":
-            random_idx = random.randint(0, self.graphs[idx].x.size(0) - self.max_size)
-            indices = torch.arange(random_idx, random_idx + self.max_size)
-            edge_indices = torch.isin(self.graphs[idx].edge_index[0], indices) & torch.isin(
-                self.graphs[idx].edge_index[1], indices)
-            onset_divs = torch.tensor(
-                self.graphs[idx].note_array["onset_div"][random_idx:random_idx + self.max_size])
-            unique_onsets = torch.unique(torch.tensor(self.graphs[idx].note_array["onset_div"]), sorted=True)
-            label_idx = (unique_onsets >= onset_divs.min()) & (unique_onsets <= onset_divs.max())
-            return [
-                self.graphs[idx].x[indices],
-                self.graphs[idx].edge_index[:, edge_indices] - random_idx,
-                self.graphs[idx].edge_type[edge_indices],
-                self.graphs[idx].y[label_idx],
-                onset_divs,
-                self.graphs[idx].name
-            ]
-
-        else:
-            return [
-                self.graphs[idx].x,
-                self.graphs[idx].edge_index,
-                self.graphs[idx].edge_type,
-                self.graphs[idx].y,
-                torch.tensor(self.graphs[idx].note_array["onset_div"]),
-                self.graphs[idx].name
-            ]
+        graph = self.graphs[idx]
+        x, edge_index, edge_type, y, onset_divs = graph.x, graph.edge_index, graph.edge_type, graph.y, graph.onset_div
+        label_idx = None
+        if graph.x.size(0) > self.max_size and graph.collection != "test":
+            random_idx = random.randint(0, graph.x.size(0) - self.max_size)
+            x, edge_index, edge_type, y, onset_divs, label_idx = self.crop_graph(
+                graph, random_idx, random_idx + self.max_size)
+        if self.online_transpose and graph.intervals is not None and graph.collection != "test":
+            x, y = self.transpose_graph_attr(graph, x, y, label_idx)
+        return [x, edge_index, edge_type, y, onset_divs, graph.name]
+
+    @staticmethod
+    def crop_graph(graph, start, end):
+        """The nodes start to end - 1 of a graph with their edges and the labels of their onsets.
+
+        The edges of the cropped nodes are a slice of the source-sorted edges and the labels are a slice
+        of the sorted unique onsets, so the crop does not depend on the size of the graph.
+
+        Returns
+        -------
+        x, edge_index, edge_type, y, onset_div : torch.Tensor
+            The cropped graph.
+        label_idx : slice
+            The labels kept by the crop.
+        """
+        onset_divs = graph.onset_div[start:end]
+        label_idx = slice(int(torch.searchsorted(graph.unique_onsets, onset_divs.min())),
+                          int(torch.searchsorted(graph.unique_onsets, onset_divs.max(), right=True)))
+        edge_index, edge_type = crop_edges(graph.edge_index, graph.edge_type, start, end, edge_ptr=graph.edge_ptr)
+        return graph.x[start:end], edge_index, edge_type, graph.y[label_idx], onset_divs, label_idx
+
+    def transpose_graph_attr(self, graph, x, y, label_idx=None):
+        """Transpose the features and labels of a graph by one of its legal intervals, drawn at random.
+
+        The pitch is shifted by the semitones of the interval and the spellings and transposing labels
+        are remapped with the lookup tables, the untransposed graph is one of the draws.
+
+        Parameters
+        ----------
+        graph : PackedGraph
+            The graph, with its transposition tables.
+        x : torch.Tensor
+            The (cropped) node features of the graph.
+        y : torch.Tensor
+            The (cropped) labels of the graph.
+        label_idx : slice
+            The labels kept by the crop, None when the graph is not cropped.
+        """
+        intervals = torch.nonzero(graph.intervals).flatten()
+        if len(intervals) == 0:
+            return x, y
+        k = intervals[random.randrange(len(intervals))]
+        x, y = x.clone(), y.clone()
+        x[:, PITCH_COLUMN] += self.semitones[k]
+        start = SPELLING_COLUMNS[0]
+        spelling = self.spellings[k][x[:, start:start + 7].argmax(dim=1) * 7 + x[:, start + 7:start + 14].argmax(dim=1)]
+        one_hot = torch.zeros((x.size(0), 14), dtype=x.dtype)
+        one_hot[torch.arange(x.size(0)), spelling // 7] = 1
+        one_hot[torch.arange(x.size(0)), 7 + spelling % 7] = 1
+        for start in SPELLING_COLUMNS:
+            x[:, start:start + 14] = one_hot
+        value_ids = graph.value_ids if label_idx is None else graph.value_ids[label_idx]
+        columns = torch.from_numpy(self.store.label_columns)
+        y[:, columns] = graph.label_table[k][value_ids].to(y.dtype).reshape(y[:, columns].shape)
+        return x, y
 
 
 class AugmentedNetChordGraphDataset(ChordGraphDataset):
     def __init__(self, raw_dir=None, force_reload=False,
-                 verbose=True, nprocs=4, include_synth=False, num_tasks=11, collection="all", max_size=512):
+                 verbose=True, nprocs=4, include_synth=False, num_tasks=11, collection="all", max_size=512, lazy=False,
+                 online_transpose=False):
         dataset_base = AugmentedNetChordDataset(raw_dir=raw_dir)
         self.collection = collection
         # Collection is one of ["abc", "bps", "haydnop20", "wir", "wirwtc", "tavern"]
@@ -213,7 +339,9 @@ class AugmentedNetChordGraphDataset(ChordGraphDataset):
             name="AugmentedNetChordGraphDataset",
             raw_dir=raw_dir,
             force_reload=force_reload,
-            verbose=verbose)
+            verbose=verbose,
+            lazy=lazy,
+            online_transpose=online_transpose)
 
     def _process_score(self, score_fn):
         name = os.path.splitext(os.path.basename(score_fn))[0]
@@ -222,23 +350,35 @@ class AugmentedNetChordGraphDataset(ChordGraphDataset):
         # Skip synthetic scores in testing.
 
         if os.path.join("AugmentedNetChordDataset", "dataset-synth") in score_fn and os.path.basename(os.path.dirname(score_fn)) in ["test"]:
-            return
+            return []
         collection = "training" if os.path.basename(
             os.path.dirname(score_fn)) == "validation" else os.path.basename(os.path.dirname(score_fn))
         if collection == "test":
             note_array, labels = time_divided_tsv_to_part(score_fn, transpose=False)
-            data_to_graph(note_array, labels, collection, name, save_path=self.save_path)
+            feature_time = data_to_graph(note_array, labels, collection, name, save_path=self.save_path)
+            outputs = [name]
+        elif self.online_transpose:
+            note_array, labels, transpositions = time_divided_tsv_to_transposable_part(score_fn)
+            feature_time = data_to_graph(
+                note_array, labels, collection, name, save_path=self.save_path, transpositions=transpositions)
+            outputs = [name]
         else:
             x = time_divided_tsv_to_part(score_fn, transpose=True)
+            feature_time = 0.0
+            outputs = list()
             for i, (note_array, labels) in enumerate(x):
-                data_to_graph(note_array, labels, collection, (name + "-{}".format(i) if i > 0 else name), save_path=self.save_path)
-        return
+                outputs.append(name + "-{}".format(i) if i > 0 else name)
+                feature_time += data_to_graph(note_array, labels, collection, outputs[-1], save_path=self.save_path)
+        if self.verbose:
+            print("{}: feature extraction took {:.3f}s".format(name, feature_time))
+        return outputs
 
 
 class Augmented2022ChordGraphDataset(ChordGraphDataset):
 
     def __init__(self, raw_dir=None, force_reload=False,
-                 verbose=True, nprocs=4, include_synth=False, num_tasks=11, collection="all", max_size=512):
+                 verbose=True, nprocs=4, include_synth=False, num_tasks=11, collection="all", max_size=512, lazy=False,
+                 online_transpose=False):
         dataset_base = AugmentedNetLatestChordDataset(raw_dir=raw_dir)
         # Collection is one of ["abc", "bps", "haydnop20", "wir", "wirwtc", "tavern"]
         self.collection = collection
@@ -312,7 +452,9 @@ class Augmented2022ChordGraphDataset(ChordGraphDataset):
             raw_dir=raw_dir,
             force_reload=force_reload,
             verbose=verbose,
-            prob_pieces=prob_pieces)
+            prob_pieces=prob_pieces,
+            lazy=lazy,
+            online_transpose=online_transpose)
 
     def _process_score(self, score_fn):
         name = os.path.splitext(os.path.basename(score_fn))[0]
@@ -320,25 +462,41 @@ class Augmented2022ChordGraphDataset(ChordGraphDataset):
         # Skip synthetic scores in testing.
         if os.path.join("AugmentedNetLatestChordDataset", "dataset-synth") in score_fn and os.path.basename(
                 os.path.dirname(score_fn)) in ["test"]:
-            return
+            return []
         collection = "training" if os.path.basename(
             os.path.dirname(score_fn)) == "validation" else os.path.basename(os.path.dirname(score_fn))
         if collection == "test":
             note_array, labels = time_divided_tsv_to_part(score_fn, transpose=False, version="latest")
-            data_to_graph(note_array, labels, collection, name, save_path=self.save_path)
+            feature_time = data_to_graph(note_array, labels, collection, name, save_path=self.save_path)
+            outputs = [name]
+        elif self.online_transpose:
+            note_array, labels, transpositions = time_divided_tsv_to_transposable_part(score_fn, version="latest")
+            feature_time = data_to_graph(
+                note_array, labels, collection, name, save_path=self.save_path, transpositions=transpositions)
+            outputs = [name]
         else:
             x = time_divided_tsv_to_part(score_fn, transpose=True, version="latest")
+            feature_time = 0.0
+            outputs = list()
             for i, (note_array, labels) in enumerate(x):
-                data_to_graph(note_array, labels, collection, (name + "-{}".format(i) if i > 0 else name),
-                              save_path=self.save_path)
-        return
+                outputs.append(name + "-{}".format(i) if i > 0 else name)
+                feature_time += data_to_graph(note_array, labels, collection, outputs[-1], save_path=self.save_path)
+        if self.verbose:
+            print("{}: feature extraction took {:.3f}s".format(name, feature_time))
+        return outputs
 
 
 
 
-def data_to_graph(note_array, labels, collection, name, save_path):
-    nodes, edges = hetero_graph_from_note_array(note_array=note_array)
+def data_to_graph(note_array, labels, collection, name, save_path, transpositions=None):
+    """Build and save the graph of a score, returns the time spent on feature extraction in seconds.
+
+    The transposition tables of time_divided_tsv_to_transposable_part are saved with the graph when given.
+    """
+    nodes, edges = fast_hetero_graph_from_note_array(note_array=note_array)
+    start = time.perf_counter()
     note_features = select_features(note_array, "chord")
+    feature_time = time.perf_counter() - start
     hg = HeteroScoreGraph(
         note_features,
         edges,
@@ -350,5 +508,7 @@ def data_to_graph(note_array, labels, collection, name, save_path):
     # pos_enc = positional_encoding(hg.edge_index, len(hg.x), 20)
     # hg.x = torch.cat((hg.x, pos_enc), dim=1)
     hg.save(save_path)
+    if transpositions is not None:
+        np.savez(os.path.join(save_path, name, "transpositions.npz"), **transpositions)
     del hg, note_array, nodes, edges, note_features
-    return
\ No newline at end of file
+    return feature_time
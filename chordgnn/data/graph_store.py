@@ -0,0 +1,312 @@
+import os
+import shutil
+import pickle
+from collections import OrderedDict, namedtuple
+import numpy as np
+import torch
+
+
+PACKED_KINDS = ("x", "edge_index", "edge_type", "y", "onset_div")
+
+# Crop index of every graph, the per-node offsets of its edges (sorted by source) and its unique onsets.
+CROP_KINDS = ("edge_offsets", "unique_onset")
+
+# Bump when the layout of the store files changes, to repack the stores.
+STORE_FORMAT = "2"
+
+# Optional transposition tables (see time_divided_tsv_to_transposable_part), one line of interval flags
+# per graph, value ids per label and the class index of every value per interval.
+TRANSPOSITION_KINDS = ("intervals", "value_ids", "label_table")
+
+# What is known about a stored graph without reading its arrays, offsets are rows (columns for edges) in the store files.
+GraphIndexEntry = namedtuple("GraphIndexEntry", [
+    "name", "collection", "num_nodes", "num_edges", "num_labels", "node_offset", "edge_offset", "label_offset"])
+
+
+class PackedGraph(object):
+    """A graph read from a PackedGraphStore, its tensors are views on the memory-mapped store files.
+
+    The edges are sorted by source, the edges of node i are edge_ptr[i] to edge_ptr[i + 1] - 1.
+    """
+    def __init__(self, name, collection, x, edge_index, edge_type, y, onset_div, edge_ptr, unique_onsets, intervals=None, value_ids=None, label_table=None):
+        self.name = name
+        self.collection = collection
+        self.x = x
+        self.edge_index = edge_index
+        self.edge_type = edge_type
+        self.y = y
+        self.onset_div = onset_div
+        self.edge_ptr = edge_ptr
+        # The sorted unique onset divisions, one per label.
+        self.unique_onsets = unique_onsets
+        # Transposition tables, None when the store has none.
+        self.intervals = intervals
+        self.value_ids = value_ids
+        self.label_table = label_table
+
+
+def _read_graph_dir(path):
+    """The arrays of a graph directory written by HeteroScoreGraph.save, memory mapped where possible."""
+    x = np.load(os.path.join(path, "x.npy"), mmap_mode="r")
+    edges = np.load(os.path.join(path, "edge_index.npy"), mmap_mode="r")
+    y = np.load(os.path.join(path, "y.npy"), mmap_mode="r") if os.path.exists(os.path.join(path, "y.npy")) else None
+    try:
+        note_array = np.load(os.path.join(path, "note_array.npy"), mmap_mode="r")
+    except ValueError:
+        # Note arrays with object fields cannot be memory mapped.
+        note_array = np.load(os.path.join(path, "note_array.npy"), allow_pickle=True)
+    with open(os.path.join(path, "graph_info.pkl"), "rb") as f:
+        graph_info = pickle.load(f)
+    transpositions = None
+    if os.path.exists(os.path.join(path, "transpositions.npz")):
+        with np.load(os.path.join(path, "transpositions.npz")) as npz:
+            transpositions = {key: npz[key] for key in npz.files}
+    return {
+        "x": x,
+        "edge_index": edges[:2],
+        "edge_type": edges[-1],
+        "y": y,
+        "onset_div": note_array["onset_div"],
+        "collection": graph_info.get("collection", ""),
+        "transpositions": transpositions,
+    }
+
+
+def _allocate(path, dtype, shape):
+    shape = tuple(int(n) for n in shape)
+    if int(np.prod(shape)) == 0:
+        # Empty arrays cannot be memory mapped.
+        np.save(path, np.zeros(shape, dtype=dtype))
+        return None
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+
+
+def pack_graph_dirs(save_path, names, store_path, digest=""):
+    """Pack graph directories into a store with one contiguous file per array kind.
+
+    Nodes, edges and labels of all graphs are concatenated along their first axis (the second one
+    for the edge index) and an index of per-graph offsets is written next to them. The edges of every
+    graph are sorted by source and indexed by per-node offsets, for cropping. Transposition
+    tables are packed when any graph has them, graphs without tables get no legal interval.
+
+    Parameters
+    ----------
+    save_path : str
+        The directory holding the graph directories written by HeteroScoreGraph.save.
+    names : list
+        The names of the graphs to pack, in store order.
+    store_path : str
+        The directory of the packed store, replaced if it exists.
+    digest : str
+        An identifier of the packed content (e.g. the processing manifest digest).
+    """
+    if not names:
+        raise ValueError("There are no graphs to pack in {}.".format(save_path))
+    # First pass only reads the array headers to size the store.
+    n_nodes, n_edges, n_labels, n_onsets, collections = list(), list(), list(), list(), list()
+    x_dtype, x_width, y_dtype, y_width = None, None, None, (0,)
+    n_values, n_intervals, label_columns = list(), None, None
+    for name in names:
+        graph = _read_graph_dir(os.path.join(save_path, name))
+        n_nodes.append(graph["x"].shape[0])
+        n_edges.append(graph["edge_type"].shape[0])
+        n_labels.append(graph["y"].shape[0] if graph["y"] is not None else 0)
+        n_onsets.append(len(np.unique(graph["onset_div"])))
+        collections.append(graph["collection"])
+        if x_dtype is None:
+            x_dtype, x_width = graph["x"].dtype, graph["x"].shape[1:]
+        if graph["y"] is not None and y_dtype is None:
+            y_dtype, y_width = graph["y"].dtype, graph["y"].shape[1:]
+        n_values.append(graph["transpositions"]["table"].shape[1] if graph["transpositions"] is not None else 0)
+        if graph["transpositions"] is not None and n_intervals is None:
+            n_intervals, label_columns = len(graph["transpositions"]["intervals"]), graph["transpositions"]["columns"]
+    node_ptr = np.r_[0, np.cumsum(n_nodes)].astype(np.int64)
+    edge_ptr = np.r_[0, np.cumsum(n_edges)].astype(np.int64)
+    label_ptr = np.r_[0, np.cumsum(n_labels)].astype(np.int64)
+    value_ptr = np.r_[0, np.cumsum(n_values)].astype(np.int64)
+    onset_ptr = np.r_[0, np.cumsum(n_onsets)].astype(np.int64)
+
+    tmp_path = store_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    out = {
+        "x": _allocate(os.path.join(tmp_path, "x.npy"), x_dtype, (node_ptr[-1],) + tuple(x_width)),
+        "edge_index": _allocate(os.path.join(tmp_path, "edge_index.npy"), np.int64, (2, edge_ptr[-1])),
+        "edge_type": _allocate(os.path.join(tmp_path, "edge_type.npy"), np.int64, (edge_ptr[-1],)),
+        "y": _allocate(os.path.join(tmp_path, "y.npy"), y_dtype or np.float64, (label_ptr[-1],) + tuple(y_width)),
+        "onset_div": _allocate(os.path.join(tmp_path, "onset_div.npy"), np.int64, (node_ptr[-1],)),
+        # Global edge offsets of every node, the offsets of the last node of a graph end on the next graph.
+        "edge_offsets": _allocate(os.path.join(tmp_path, "edge_offsets.npy"), np.int64, (node_ptr[-1] + 1,)),
+        "unique_onset": _allocate(os.path.join(tmp_path, "unique_onset.npy"), np.int64, (onset_ptr[-1],)),
+    }
+    if n_intervals is not None:
+        out["intervals"] = _allocate(os.path.join(tmp_path, "intervals.npy"), bool, (len(names), n_intervals))
+        out["value_ids"] = _allocate(
+            os.path.join(tmp_path, "value_ids.npy"), np.int64, (label_ptr[-1], len(label_columns)))
+        out["label_table"] = _allocate(os.path.join(tmp_path, "label_table.npy"), np.int64, (n_intervals, value_ptr[-1]))
+    for i, name in enumerate(names):
+        graph = _read_graph_dir(os.path.join(save_path, name))
+        if out["x"] is not None:
+            out["x"][node_ptr[i]:node_ptr[i + 1]] = graph["x"]
+            out["onset_div"][node_ptr[i]:node_ptr[i + 1]] = graph["onset_div"]
+        if out["unique_onset"] is not None:
+            out["unique_onset"][onset_ptr[i]:onset_ptr[i + 1]] = np.unique(graph["onset_div"])
+        order = np.argsort(graph["edge_index"][0], kind="stable")
+        source = np.asarray(graph["edge_index"][0])[order]
+        out["edge_offsets"][node_ptr[i]:node_ptr[i + 1] + 1] = edge_ptr[i] + np.searchsorted(
+            source, np.arange(n_nodes[i] + 1), side="left")
+        if out["edge_type"] is not None:
+            out["edge_index"][:, edge_ptr[i]:edge_ptr[i + 1]] = graph["edge_index"][:, order]
+            out["edge_type"][edge_ptr[i]:edge_ptr[i + 1]] = graph["edge_type"][order]
+        if graph["y"] is not None and out["y"] is not None:
+            out["y"][label_ptr[i]:label_ptr[i + 1]] = graph["y"]
+        if n_intervals is not None:
+            tables = graph["transpositions"]
+            out["intervals"][i] = tables["intervals"] if tables is not None else False
+            if out["value_ids"] is not None:
+                out["value_ids"][label_ptr[i]:label_ptr[i + 1]] = tables["value_ids"] if tables is not None else 0
+            if tables is not None and out["label_table"] is not None:
+                out["label_table"][:, value_ptr[i]:value_ptr[i + 1]] = tables["table"]
+    for array in out.values():
+        if array is not None:
+            array.flush()
+    del out
+    np.savez(
+        os.path.join(tmp_path, "index.npz"), names=np.array(names), collections=np.array(collections),
+        node_ptr=node_ptr, edge_ptr=edge_ptr, label_ptr=label_ptr, value_ptr=value_ptr, onset_ptr=onset_ptr,
+        label_columns=np.array(label_columns if label_columns is not None else [], dtype=np.int64), digest=np.array(digest),
+        format=np.array(STORE_FORMAT))
+    shutil.rmtree(store_path, ignore_errors=True)
+    os.rename(tmp_path, store_path)
+
+
+def packed_store_digest(store_path):
+    """The digest a packed store was written with, None if there is no complete store of the current format."""
+    index_path = os.path.join(store_path, "index.npz")
+    if not os.path.exists(index_path):
+        return None
+    with np.load(index_path) as index:
+        if "format" not in index.files or str(index["format"]) != STORE_FORMAT:
+            return None
+        return str(index["digest"])
+
+
+class PackedGraphStore(object):
+    """Read access to a store written by pack_graph_dirs.
+
+    Opening the store maps the array files in memory, so it costs a constant number of file opens
+    regardless of the number of graphs, and every graph is a zero-copy slice of the maps.
+
+    Parameters
+    ----------
+    store_path : str
+        The directory of the packed store.
+    """
+    def __init__(self, store_path):
+        self._open(store_path)
+
+    def _open(self, store_path):
+        self.store_path = store_path
+        with np.load(os.path.join(store_path, "index.npz")) as index:
+            self.names = index["names"].tolist()
+            self.collections = index["collections"].tolist()
+            self.node_ptr = index["node_ptr"]
+            self.edge_ptr = index["edge_ptr"]
+            self.label_ptr = index["label_ptr"]
+            self.onset_ptr = index["onset_ptr"]
+            self.value_ptr = index["value_ptr"] if "value_ptr" in index.files else None
+            self.label_columns = index["label_columns"] if "label_columns" in index.files else None
+            self.digest = str(index["digest"])
+        # Copy-on-write maps give writable arrays, so that torch does not warn about read-only memory.
+        self.arrays = {
+            kind: np.load(os.path.join(store_path, kind + ".npy"), mmap_mode="c") for kind in PACKED_KINDS + CROP_KINDS}
+        self.transposable = os.path.exists(os.path.join(store_path, "intervals.npy"))
+        if self.transposable:
+            for kind in TRANSPOSITION_KINDS:
+                self.arrays[kind] = np.load(os.path.join(store_path, kind + ".npy"), mmap_mode="c")
+
+    def __getstate__(self):
+        # Pickle the path only (e.g. for data loader workers), a pickled memory map would copy the whole store.
+        return {"store_path": self.store_path}
+
+    def __setstate__(self, state):
+        self._open(state["store_path"])
+
+    def __len__(self):
+        return len(self.names)
+
+    def index_entry(self, idx):
+        return GraphIndexEntry(
+            name=self.names[idx],
+            collection=self.collections[idx],
+            num_nodes=int(self.node_ptr[idx + 1] - self.node_ptr[idx]),
+            num_edges=int(self.edge_ptr[idx + 1] - self.edge_ptr[idx]),
+            num_labels=int(self.label_ptr[idx + 1] - self.label_ptr[idx]),
+            node_offset=int(self.node_ptr[idx]),
+            edge_offset=int(self.edge_ptr[idx]),
+            label_offset=int(self.label_ptr[idx]),
+        )
+
+    def __getitem__(self, idx):
+        n_start, n_end = self.node_ptr[idx], self.node_ptr[idx + 1]
+        e_start, e_end = self.edge_ptr[idx], self.edge_ptr[idx + 1]
+        l_start, l_end = self.label_ptr[idx], self.label_ptr[idx + 1]
+        o_start, o_end = self.onset_ptr[idx], self.onset_ptr[idx + 1]
+        tables = dict()
+        if self.transposable:
+            v_start, v_end = self.value_ptr[idx], self.value_ptr[idx + 1]
+            tables = dict(
+                intervals=torch.from_numpy(self.arrays["intervals"][idx]),
+                value_ids=torch.from_numpy(self.arrays["value_ids"][l_start:l_end]),
+                label_table=torch.from_numpy(self.arrays["label_table"][:, v_start:v_end]),
+            )
+        return PackedGraph(
+            name=self.names[idx],
+            collection=self.collections[idx],
+            x=torch.from_numpy(self.arrays["x"][n_start:n_end]),
+            edge_index=torch.from_numpy(self.arrays["edge_index"][:, e_start:e_end]),
+            edge_type=torch.from_numpy(self.arrays["edge_type"][e_start:e_end]),
+            y=torch.from_numpy(self.arrays["y"][l_start:l_end]),
+            onset_div=torch.from_numpy(self.arrays["onset_div"][n_start:n_end]),
+            edge_ptr=torch.from_numpy(self.arrays["edge_offsets"][n_start:n_end + 1] - e_start),
+            unique_onsets=torch.from_numpy(self.arrays["unique_onset"][o_start:o_end]),
+            **tables
+        )
+
+
+class LazyGraphList(object):
+    """The graphs of a store, materialized in memory on access and kept in a bounded LRU cache.
+
+    Parameters
+    ----------
+    store : PackedGraphStore
+        The store holding the graphs.
+    indices : list
+        The store positions of the graphs, in list order.
+    cache_size : int
+        The maximum number of materialized graphs kept in memory.
+    """
+    def __init__(self, store, indices, cache_size=1024):
+        self.store = store
+        self.indices = list(indices)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        if idx in self._cache:
+            self._cache.move_to_end(idx)
+            return self._cache[idx]
+        view = self.store[self.indices[idx]]
+        tables = {
+            kind: getattr(view, kind).clone() for kind in TRANSPOSITION_KINDS if getattr(view, kind) is not None}
+        graph = PackedGraph(
+            name=view.name, collection=view.collection, x=view.x.clone(), edge_index=view.edge_index.clone(),
+            edge_type=view.edge_type.clone(), y=view.y.clone(), onset_div=view.onset_div.clone(),
+            edge_ptr=view.edge_ptr, unique_onsets=view.unique_onsets.clone(), **tables)
+        self._cache[idx] = graph
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return graph
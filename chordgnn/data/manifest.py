@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+
+
+def file_sha1(filename):
+    """Hexadecimal sha1 digest of the content of a file."""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(1048576)
+            if not data:
+                break
+            sha1.update(data)
+    return sha1.hexdigest()
+
+
+class ProcessingManifest(object):
+    """Record of which source files have been processed into which graphs.
+
+    The manifest is an append-only JSON lines file with one entry per processed source, holding
+    its content hash, the featurizer version used and the names of the graphs written for it.
+    Entries are appended as soon as a source is done, so an interrupted run keeps everything it
+    finished, and later lines override earlier ones for the same source.
+
+    Parameters
+    ----------
+    path : str
+        The manifest file.
+    version : str
+        The featurizer version, entries written with another version are considered stale.
+    reset : bool
+        Start from an empty manifest, e.g. when the dataset is force reloaded.
+    """
+    def __init__(self, path, version, reset=False):
+        self.path = path
+        self.version = str(version)
+        self.entries = dict()
+        self._hashes = dict()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if reset and os.path.exists(self.path):
+            os.remove(self.path)
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                content = f.read()
+            if content and not content.endswith("\n"):
+                # Terminate a line cut short by an interrupted run before appending to it.
+                with open(self.path, "a") as f:
+                    f.write("\n")
+            for line in content.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("removed", False):
+                    self.entries.pop(entry["source"], None)
+                else:
+                    self.entries[entry["source"]] = entry
+
+    def fingerprint(self, source):
+        """Size, modification time and content hash of a source.
+
+        The hash is only recomputed when the size or modification time differ from the manifest entry.
+        """
+        stat = os.stat(source)
+        entry = self.entries.get(source)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return stat.st_size, stat.st_mtime_ns, entry["hash"]
+        key = (source, stat.st_size, stat.st_mtime_ns)
+        if key not in self._hashes:
+            self._hashes[key] = file_sha1(source)
+        return stat.st_size, stat.st_mtime_ns, self._hashes[key]
+
+    def is_current(self, source):
+        """Whether the source has been processed in its current content with the current featurizer."""
+        entry = self.entries.get(source)
+        if entry is None or entry["version"] != self.version:
+            return False
+        return self.fingerprint(source)[2] == entry["hash"]
+
+    def pending(self, sources):
+        """The sources that are new, changed or processed with another featurizer version."""
+        return [source for source in sources if not self.is_current(source)]
+
+    def removed(self, sources):
+        """The sources in the manifest that are no longer part of the dataset."""
+        sources = set(sources)
+        return [source for source in self.entries.keys() if source not in sources]
+
+    def outputs(self, source=None):
+        """The graph names written for a source, or for all sources."""
+        if source is not None:
+            return list(self.entries[source]["outputs"]) if source in self.entries else []
+        return [name for entry in self.entries.values() for name in entry["outputs"]]
+
+    def digest(self):
+        """A hash of the current entries, changes whenever any source is reprocessed or removed."""
+        sha1 = hashlib.sha1()
+        for source in sorted(self.entries.keys()):
+            entry = self.entries[source]
+            sha1.update(json.dumps([source, entry["hash"], entry["version"], entry["outputs"]]).encode('utf-8'))
+        return sha1.hexdigest()
+
+    def record(self, source, outputs):
+        """Append the entry of a processed source."""
+        size, mtime_ns, digest = self.fingerprint(source)
+        entry = {"source": source, "hash": digest, "size": size, "mtime_ns": mtime_ns,
+                 "version": self.version, "outputs": list(outputs)}
+        self._append(entry)
+        self.entries[source] = entry
+
+    def forget(self, source):
+        """Append a removal entry for a source."""
+        self._append({"source": source, "removed": True})
+        self.entries.pop(source, None)
+
+    def compact(self):
+        """Rewrite the manifest with only the latest entry of every source."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _append(self, entry):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
@@ -4,65 +4,229 @@ from torch.utils.data import Sampler
 import torch
 
 
-class BySequenceLengthSampler(Sampler):
+def distributed_rank(num_replicas=None, rank=None):
+    """The number of processes and the rank of this process, from the default process group when not given."""
+    initialized = torch.distributed.is_available() and torch.distributed.is_initialized()
+    if num_replicas is None:
+        num_replicas = torch.distributed.get_world_size() if initialized else 1
+    if rank is None:
+        rank = torch.distributed.get_rank() if initialized else 0
+    if not 0 <= rank < num_replicas:
+        raise ValueError("Invalid rank {}, rank should be in the interval [0, {}]".format(rank, num_replicas - 1))
+    return num_replicas, rank
+
+
+def shard_examples(lengths, num_replicas, seed=0):
+    """A fixed partition of the examples over the ranks, with the same distribution of lengths on every rank.
+
+    The examples are sorted by length (randomly among equal lengths) and dealt to the ranks in turn, so every
+    rank only ever reads the graphs of its shard.
+
+    Returns
+    -------
+    list of np.ndarray
+        The sorted examples of every rank.
+    """
+    lengths = np.asarray(lengths)
+    order = np.random.default_rng(seed).permutation(len(lengths))
+    order = order[np.argsort(lengths[order], kind="stable")]
+    return [np.sort(order[rank::num_replicas]) for rank in range(num_replicas)]
+
+
+def equalize_batches(batches, num_batches):
+    """Drop the last batches or repeat the first ones to get num_batches batches, so that ranks do not wait on each other."""
+    if len(batches) >= num_batches or not batches:
+        return batches[:num_batches]
+    return (batches * (num_batches // len(batches) + 1))[:num_batches]
+
 
+class BySequenceLengthSampler(Sampler):
+    """Batches of examples of similar length, from buckets of lengths.
+
+    Only the lengths of the examples are kept, not the data source, so that the sampler is cheap to pickle
+    to the processes of a DataLoader or of a distributed run.
+
+    In a distributed run every rank batches its own shard of the examples (see shard_examples) and the
+    ranks are given the same number of batches, the largest one or the smallest one with drop_last.
+
+    Parameters
+    ----------
+    data_source : Dataset
+        The examples, only read for their lengths when lengths is not given.
+    bucket_boundaries : list of int
+        The boundaries of the length buckets.
+    batch_size : int
+        The number of examples of a batch.
+    drop_last : bool
+        Whether to drop the last incomplete batch of every bucket.
+    lengths : list of int
+        The number of nodes of every example, e.g. from a dataset index, avoids loading the data source.
+    seed : int
+        The seed of the shuffling, together with the epoch (see set_epoch, called every epoch by
+        chordgnn.train.callbacks.BatchSamplerEpochCallback). The global random state is used if None.
+    num_replicas, rank : int
+        The number of processes and the rank of this process, from the default process group if None.
+    """
     def __init__(self, data_source,
-                 bucket_boundaries, batch_size=64, drop_last=False):
-        super(BySequenceLengthSampler, self).__init__(data_source)
-        self.data_source = data_source
-        ind_n_len = []
-        for i, x in enumerate(data_source):
-            ind_n_len.append((i, x["x"].shape[0]))
-
-        self.ind_n_len = ind_n_len
+                 bucket_boundaries, batch_size=64, drop_last=False, lengths=None, seed=None,
+                 num_replicas=None, rank=None):
+        if lengths is None:
+            lengths = [x["x"].shape[0] if isinstance(x, dict) else x[0].shape[0] for x in data_source]
+        self.lengths = np.asarray(lengths, dtype=np.int64)
         self.bucket_boundaries = bucket_boundaries
         self.batch_size = batch_size
         self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.num_replicas, self.rank = distributed_rank(num_replicas, rank)
 
         if self.drop_last:
             print("WARNING: drop_last=True, dropping last non batch-size batch in every bucket ... ")
 
-        self.boundaries = list(self.bucket_boundaries)
-        self.buckets_min = torch.tensor([np.iinfo(np.int32).min] + self.boundaries)
-        self.buckets_max = torch.tensor(self.boundaries + [np.iinfo(np.int32).max])
-        self.boundaries = torch.tensor(self.boundaries)
+        self.boundaries = np.asarray(self.bucket_boundaries)
+        self.bucket_ids = np.searchsorted(self.boundaries, self.lengths, side="right")
+        # The shards are the same on every rank, also without a seed.
+        self.shards = shard_examples(self.lengths, self.num_replicas, seed=self.seed or 0)
+        self.indices = self.shards[self.rank]
 
-    def shuffle_tensor(self, t):
-        return t[torch.randperm(len(t))]
+    def set_epoch(self, epoch):
+        """Set the epoch of a seeded sampler, every epoch has its own shuffling."""
+        self.epoch = epoch
 
     def __iter__(self):
-        data_buckets = dict()
-        # where p is the id number and seq_len is the length of this id number.
-        for p, seq_len in self.ind_n_len:
-            pid = self.element_to_bucket_id(p, seq_len)
-            if pid in data_buckets.keys():
-                data_buckets[pid].append(p)
-            else:
-                data_buckets[pid] = [p]
-
-        for k in data_buckets.keys():
-            data_buckets[k] = torch.tensor(data_buckets[k])
+        if self.seed is not None:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch + self.rank)
+            rng = np.random.default_rng(self.seed + self.epoch + self.rank)
+        else:
+            generator, rng = None, None
 
         iter_list = []
-        for k in data_buckets.keys():
-            t = self.shuffle_tensor(data_buckets[k])
+        bucket_ids = self.bucket_ids[self.indices]
+        for k in np.unique(bucket_ids):
+            t = torch.from_numpy(self.indices[bucket_ids == k])
+            t = t[torch.randperm(len(t), generator=generator)]
             batch = torch.split(t, self.batch_size, dim=0)
             if self.drop_last and len(batch[-1]) != self.batch_size:
                 batch = batch[:-1]
 
             iter_list += batch
 
-        shuffle(iter_list)  # shuffle all the batches so they arent ordered by bucket
-        # size
-        for i in iter_list:
+        # shuffle all the batches so they arent ordered by bucket size
+        if rng is not None:
+            iter_list = [iter_list[i] for i in rng.permutation(len(iter_list))]
+        else:
+            shuffle(iter_list)
+        for i in equalize_batches(iter_list, len(self)):
             yield i.numpy().tolist()  # as it was stored in an array
 
+    def _num_batches(self, indices):
+        bucket_sizes = np.bincount(self.bucket_ids[indices])
+        if self.drop_last:
+            return int((bucket_sizes // self.batch_size).sum())
+        return int(((bucket_sizes + self.batch_size - 1) // self.batch_size).sum())
+
     def __len__(self):
-        return len(self.data_source)//self.batch_size
+        num_batches = [self._num_batches(shard) for shard in self.shards]
+        return min(num_batches) if self.drop_last else max(num_batches)
 
     def element_to_bucket_id(self, x, seq_length):
-        valid_buckets = (seq_length >= self.buckets_min) * (seq_length < self.buckets_max)
-        bucket_id = valid_buckets.nonzero()[0].item()
-        return bucket_id
+        return int(np.searchsorted(self.boundaries, seq_length, side="right"))
+
+
+def padding_waste(batches, onsets):
+    """The padding of the onset sequences of batches, as padded to the longest sequence of every batch for the GRU.
+
+    Parameters
+    ----------
+    batches : list of list of int
+        The examples of every batch.
+    onsets : array-like
+        The number of onsets (the sequence length) of every example.
+
+    Returns
+    -------
+    dict
+        The number of onsets, the number of padded positions and the fraction of the padded positions that is padding.
+    """
+    onsets = np.asarray(onsets)
+    total = int(sum(onsets[batch].sum() for batch in batches))
+    padded = int(sum(onsets[batch].max() * len(batch) for batch in batches if len(batch)))
+    return {"onsets": total, "padded": padded, "waste": 1 - total / max(padded, 1)}
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """Batches of examples of similar length under a budget of nodes, edges and padded onsets.
+
+    The examples are sorted by number of onsets (randomly among equal lengths) and packed greedily, a batch
+    is closed when the next example would exceed one of the budgets. The onset budget counts the padded
+    sequences of the batch, the number of examples times the longest one. An example over a budget forms a
+    batch of its own. The order of the batches is shuffled.
+
+    The batches only depend on the seed and the epoch (see set_epoch, called every epoch by
+    chordgnn.train.callbacks.BatchSamplerEpochCallback). In a distributed run every rank
+    packs its own shard of the examples (see shard_examples), and the batches are repeated (or dropped, with
+    drop_last) so that all ranks have the same number of batches.
+
+    Parameters
+    ----------
+    sizes : array-like
+        The (nodes, edges, onsets) of every example, e.g. from a dataset index, shape (num_examples, 3).
+    max_nodes, max_edges, max_onsets : int
+        The budgets of a batch, None for no budget.
+    seed : int
+        The seed of the shuffling.
+    num_replicas, rank : int
+        The number of processes and the rank of this process, from the default process group if None.
+    drop_last : bool
+        Drop the last batches instead of repeating batches to equalize the ranks.
+    """
+    def __init__(self, sizes, max_nodes=None, max_edges=None, max_onsets=None, seed=0,
+                 num_replicas=None, rank=None, drop_last=False):
+        self.num_replicas, self.rank = distributed_rank(num_replicas, rank)
+        self.sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 3)
+        self.budget = np.array([np.iinfo(np.int64).max if b is None else b for b in (max_nodes, max_edges, max_onsets)])
+        self.seed = seed
+        self.epoch = 0
+        self.drop_last = drop_last
+        self.shards = shard_examples(self.sizes[:, 2], self.num_replicas, seed=seed)
+        # The batches of every rank, for the last epoch they were computed for.
+        self._batches = (None, None)
+
+    def set_epoch(self, epoch):
+        """Set the epoch, every epoch has its own batches."""
+        self.epoch = epoch
+
+    def _pack(self, indices, rng):
+        order = indices[rng.permutation(len(indices))]
+        order = order[np.argsort(self.sizes[order, 2], kind="stable")]
+        batches, batch = list(), list()
+        nodes = edges = longest = 0
+        for i in order.tolist():
+            n, e, o = self.sizes[i]
+            if batch and (nodes + n > self.budget[0] or edges + e > self.budget[1]
+                          or max(longest, o) * (len(batch) + 1) > self.budget[2]):
+                batches.append(batch)
+                batch, nodes, edges, longest = list(), 0, 0, 0
+            batch.append(i)
+            nodes, edges, longest = nodes + n, edges + e, max(longest, o)
+        if batch:
+            batches.append(batch)
+        return [batches[i] for i in rng.permutation(len(batches))]
+
+    def batches(self, rank=None):
+        """The batches of a rank (this one by default) for the current epoch, before equalization."""
+        if self._batches[0] != self.epoch:
+            self._batches = (self.epoch, [
+                self._pack(shard, np.random.default_rng((self.seed, self.epoch, r))) for r, shard in enumerate(self.shards)])
+        return self._batches[1][self.rank if rank is None else rank]
+
+    def __iter__(self):
+        return iter(equalize_batches(self.batches(), len(self)))
 
+    def __len__(self):
+        num_batches = [len(self.batches(rank)) for rank in range(self.num_replicas)]
+        return min(num_batches) if self.drop_last else max(num_batches)
 
+    def padding_waste(self):
+        """The padding waste of the batches of this rank for the current epoch, see padding_waste."""
+        return padding_waste(equalize_batches(self.batches(), len(self)), self.sizes[:, 2])
@@ -1,35 +1,92 @@
 import numpy as np
 from chordgnn.utils import chord_to_intervalVector
+from chordgnn.utils.interval_index import OnsetIntervalIndex
+from chordgnn.utils.pcset_table import CHORDS, INTERVAL_VECTORS, CHORD_MATCHES, IS_MAJ_TRIAD, IS_MIN_TRIAD
 import partitura as pt
 from typing import List, Tuple
 
 
-CHORDS = {
-    "M/m": [0, 0, 1, 1, 1, 0],
-    "sus4": [0, 1, 0, 0, 2, 0],
-	"M7": [0, 1, 2, 1, 1, 1],
-	"M7wo5": [0, 1, 0, 1, 0, 1],
-	"Mmaj7": [1, 0, 1, 2, 2, 0],
-	"Mmaj7maj9" : [1, 2, 2, 2, 3, 0],
-	"M9": [1, 1, 4, 1, 1, 2],
-	"M9wo5": [1, 1, 2, 1, 0, 1],
-	"m7": [0, 1, 2, 1, 2, 0],
-	"m7wo5": [0, 1, 1, 0, 1, 0],
-	"m9": [1, 2, 2, 2, 3, 0],
-	"m9wo5": [1, 2, 1, 1, 1, 0],
-	"m9wo7": [1, 1, 1, 1, 2, 0],
-	"mmaj7": [1, 0, 1, 3, 1, 0],
-	"Maug": [0, 0, 0, 3, 0, 0],
-	"Maug7": [1, 0, 1, 3, 1, 0],
-	"mdim": [0, 0, 2, 0, 0, 1],
-	"mdim7": [0, 0, 4, 0, 0, 2]
-}
-
 NOTE_FEATURES = ["int_vec1", "int_vec2", "int_vec3", "int_vec4", "int_vec5", "int_vec6"] + \
     ["interval"+str(i) for i in range(13)] + list(CHORDS.keys()) + \
     ["is_maj_triad", "is_pmaj_triad", "is_min_triad", 'ped_note',
      'hv_7', "hv_5", "hv_3", "hv_1", "chord_has_2m", "chord_has_2M"]
 
+def get_chord_context_features(note_array):
+    """
+    Create the NOTE_FEATURES chord context columns and the min/max pitch flags of every note.
+
+    The chord of a note is made of the notes starting at its onset and the notes held over it,
+    therefore it is computed once per unique onset and broadcast to the notes through the
+    inverse index of the unique onsets.
+
+    Parameters
+    ----------
+    note_array : numpy structured array
+        A note array with onset_beat, duration_beat, ts_beats and pitch fields.
+
+    Returns
+    -------
+    ca : np.ndarray
+        The NOTE_FEATURES columns, one line per note.
+    min_max_pitch : np.ndarray
+        Whether a note is the lowest, resp. the highest, pitch of its chord.
+    """
+    ca = np.zeros((len(note_array), len(NOTE_FEATURES)))
+    min_max_pitch = np.zeros((len(note_array), 2))
+    if len(note_array) == 0:
+        return ca, min_max_pitch
+    onsets = note_array["onset_beat"]
+    offsets = note_array["onset_beat"] + note_array["duration_beat"]
+    pitch = note_array["pitch"].astype(int)
+    unique_onsets, inverse = np.unique(onsets, return_inverse=True)
+    n_chords = len(unique_onsets)
+
+    # chord members: every note at its own onset, plus the onsets falling strictly inside it
+    held_note, held_onset = OnsetIntervalIndex(unique_onsets).query_all(onsets, offsets)
+    member_note = np.r_[np.arange(len(note_array)), held_note]
+    member_chord = np.r_[inverse, held_onset]
+    chord_min = np.full(n_chords, pitch.max())
+    chord_max = np.full(n_chords, pitch.min())
+    pc_mask = np.zeros(n_chords, dtype=int)
+    np.minimum.at(chord_min, member_chord, pitch[member_note])
+    np.maximum.at(chord_max, member_chord, pitch[member_note])
+    np.bitwise_or.at(pc_mask, member_chord, 1 << (pitch[member_note] % 12))
+
+    # interval vector, CHORDS matches and triad flags are read from the pitch class set tables
+    int_vec = INTERVAL_VECTORS[pc_mask]
+    chords = CHORD_MATCHES[pc_mask]
+    is_maj_triad = IS_MAJ_TRIAD[pc_mask]
+    is_min_triad = IS_MIN_TRIAD[pc_mask]
+    bass_pc = chord_min % 12
+    is_pmaj_triad = is_maj_triad & ((pc_mask >> ((bass_pc + 4) % 12)) & 1 == 1) & ((pc_mask >> ((bass_pc + 7) % 12)) & 1 == 1)
+    span = (chord_max - chord_min) % 12
+    hv = np.stack([span == 10, span == 7, np.isin(span, [3, 4]), (span == 0) & (chord_max != chord_min)], axis=1)
+
+    # intervals to the notes ending at the onset, looked up in a pitch roll of consecutive notes per onset
+    cons = np.searchsorted(unique_onsets, offsets)
+    is_cons = cons < n_chords
+    is_cons[is_cons] = unique_onsets[cons[is_cons]] == offsets[is_cons]
+    low = pitch.min() - 12
+    cons_roll = np.zeros((n_chords, pitch.max() - low + 13), dtype=bool)
+    cons_roll[cons[is_cons], pitch[is_cons] - low] = True
+    rel = pitch - low
+    intervals = np.stack([cons_roll[inverse, rel + i] | cons_roll[inverse, rel - i] for i in range(13)], axis=1)
+
+    to_min = pitch - chord_min[inverse]
+    ca[:, :6] = int_vec[inverse]
+    ca[:, 6:19] = intervals
+    ca[:, 19:37] = chords[inverse]
+    ca[:, 37] = is_maj_triad[inverse]
+    ca[:, 38] = is_pmaj_triad[inverse]
+    ca[:, 39] = is_min_triad[inverse]
+    ca[:, 40] = note_array["duration_beat"] > note_array["ts_beats"]
+    ca[:, 41:45] = hv[inverse]
+    ca[:, 45] = np.abs(to_min) == 1
+    ca[:, 46] = np.abs(to_min) == 2
+    min_max_pitch[:, 0] = chord_min[inverse] == pitch
+    min_max_pitch[:, 1] = chord_max[inverse] == pitch
+    return ca, min_max_pitch
+
 
 def get_general_features(part, note_array):
     """
@@ -257,8 +314,6 @@ def get_chord_analysis_features(part, one_hot=False) -> Tuple[np.ndarray, List]:
     duration_feature = np.expand_dims(1 - np.tanh(note_array["duration_beat"] / note_array["ts_beats"]), 1)
     dur_names = ["bar_exp_duration"]
 
-    # find min pitch per unique onset and set to one
-    min_max_pitch = np.zeros((len(note_array), 2))
     min_max_pitch_names = ["min_pitch", "max_pitch"]
     metrical_features = np.zeros((len(note_array), 4))
     # is first note of bar
@@ -273,35 +328,8 @@ def get_chord_analysis_features(part, one_hot=False) -> Tuple[np.ndarray, List]:
     time_until_next_onset = np.r_[np.diff(unique_onsets), 0.0]
     time_until_next_onset = time_until_next_onset[np.searchsorted(unique_onsets, note_array["onset_beat"])]
     metrical_features[:, 3] = 1 - np.tanh(time_until_next_onset/note_array["ts_beats"])
-    ca = np.zeros((len(note_array), len(NOTE_FEATURES)))
-    for i, n in enumerate(note_array):
-        n_onset = note_array[note_array["onset_beat"] == n["onset_beat"]]
-        n_dur = note_array[np.where((note_array["onset_beat"] < n["onset_beat"]) & (
-                    note_array["onset_beat"] + note_array["duration_beat"] > n["onset_beat"]))]
-        n_cons = note_array[note_array["onset_beat"] + note_array["duration_beat"] == n["onset_beat"]]
-        chord_pitch = np.hstack((n_onset["pitch"], n_dur["pitch"]))
-        min_max_pitch[i, 0] = np.min(chord_pitch) == n["pitch"]
-        min_max_pitch[i, 1] = np.max(chord_pitch) == n["pitch"]
-        int_vec, pc_class = chord_to_intervalVector(chord_pitch.tolist(), return_pc_class=True)
-        chords_features = {k: (1 if int_vec == v else 0) for k, v in CHORDS.items()}
-        pc_class_recentered = sorted(list(map(lambda x: x - min(pc_class), pc_class)))
-        is_maj_triad = 1 if chords_features["M/m"] and pc_class_recentered in [[0, 4, 7], [0, 5, 9], [0, 3, 8]] else 0
-        is_min_triad = 1 if chords_features["M/m"] and pc_class_recentered in [[0, 3, 7], [0, 5, 8], [0, 4, 9]] else 0
-        is_pmaj_triad = 1 if is_maj_triad and 4 in (chord_pitch - chord_pitch.min()) % 12 and 7 in (
-                    chord_pitch - chord_pitch.min()) % 12 else 0
-        ped_note = 1 if n["duration_beat"] > n["ts_beats"] else 0
-        hv_7 = 1 if (chord_pitch.max() - chord_pitch.min()) % 12 == 10 else 0
-        hv_5 = 1 if (chord_pitch.max() - chord_pitch.min()) % 12 == 7 else 0
-        hv_3 = 1 if (chord_pitch.max() - chord_pitch.min()) % 12 in [3, 4] else 0
-        hv_1 = 1 if (chord_pitch.max() - chord_pitch.min()) % 12 == 0 and chord_pitch.max() != chord_pitch.min() else 0
-        chord_has_2m = 1 if n["pitch"] - chord_pitch.min() in [1, -1] else 0
-        chord_has_2M = 1 if n["pitch"] - chord_pitch.min() in [2, -2] else 0
-        intervals = {"interval" + str(i): (1 if i in (n_cons["pitch"] - n["pitch"]) or -i in (
-                n_cons["pitch"] - n["pitch"]) else 0) for i in range(13)} if n_cons.size else {"interval" + str(i): 0
-                                                                                               for i in range(13)}
-        ca[i] = np.array(int_vec + list(intervals.values()) + list(chords_features.values()) +
-                         [is_maj_triad, is_pmaj_triad, is_min_triad, ped_note, hv_7, hv_5, hv_3, hv_1, chord_has_2m,
-                          chord_has_2M])
+    # chord context and min/max pitch per unique onset, broadcast to the notes
+    ca, min_max_pitch = get_chord_context_features(note_array)
     out = np.hstack((pitch_features, spelling_features, duration_feature, ca, spelling_features, min_max_pitch, metrical_features))
     names = pitch_names + snames + dur_names + NOTE_FEATURES + snames + min_max_pitch_names + metrical_names
     return out, names
@@ -1,11 +1,12 @@
 import torch
-import copy
+import time
+import bisect
+import numpy as np
 from chordgnn.models.core import *
 from torch_scatter import scatter_add
 from torch_sparse import coalesce
 from pytorch_lightning import LightningModule
 from chordgnn.metrics.eval import MultitaskAccuracy
-import pandas as pd
 import rotograd
 
 
@@ -33,6 +34,12 @@ class MultiTaskLoss(nn.Module):
             self.params = torch.ones(len(tasks), requires_grad=False)
 
     def forward(self, pred, gt):
+        # The losses and their log-variance weights are computed in fp32 under mixed precision.
+        device_type = next(iter(pred.values())).device.type
+        with torch.autocast(device_type, enabled=False):
+            return self._forward({task: pred[task].float() for task in self.tasks}, gt)
+
+    def _forward(self, pred, gt):
         out = {task: self.loss_ft[task](pred[task], gt[task]) for task in self.tasks}
         loss_sum = 0
         for i, loss in enumerate(out.values()):
@@ -45,6 +52,52 @@ class MultiTaskLoss(nn.Module):
         return out
 
 
+def greedy_edge_matching(edge_index, edge_score, num_nodes):
+    """Match the edges greedily by decreasing score, an edge is matched if none of its nodes is.
+
+    The greedy matching is computed in rounds, every round matches the edges that rank first among
+    the unmatched edges of both their nodes, which gives the same matching as going through the
+    edges one by one.
+
+    Returns
+    -------
+    cluster : LongTensor
+        The cluster of every node, matched edges first in matching order, then the unmatched nodes.
+    matched_edges : LongTensor
+        The matched edges in matching order.
+    num_clusters : int
+        The number of clusters.
+    """
+    device = edge_index.device
+    num_edges = edge_index.size(1)
+    # Rank of every edge, decreasing score with the later edge first on ties.
+    order = torch.sort(edge_score.detach(), stable=True)[1].flip(0)
+    rank = torch.empty(num_edges, dtype=torch.long, device=device)
+    rank[order] = torch.arange(num_edges, device=device)
+    source, target = edge_index
+    matched = torch.zeros(num_nodes, dtype=torch.bool, device=device)
+    selected = torch.zeros(num_edges, dtype=torch.bool, device=device)
+    active = torch.ones(num_edges, dtype=torch.bool, device=device)
+    while active.any():
+        edges = active.nonzero().view(-1)
+        # The best ranked active edge of every node.
+        best = scatter(
+            rank[edges].repeat(2), torch.cat([source[edges], target[edges]]), 0, dim_size=num_nodes, reduce="min")
+        dominant = edges[(best[source[edges]] == rank[edges]) & (best[target[edges]] == rank[edges])]
+        selected[dominant] = True
+        matched[source[dominant]] = True
+        matched[target[dominant]] = True
+        active &= ~(matched[source] | matched[target])
+    matched_edges = selected.nonzero().view(-1)
+    matched_edges = matched_edges[torch.argsort(rank[matched_edges])]
+    remaining = (~matched).nonzero().view(-1)
+    cluster = torch.empty(num_nodes, dtype=torch.long, device=device)
+    cluster[source[matched_edges]] = torch.arange(matched_edges.size(0), device=device)
+    cluster[target[matched_edges]] = torch.arange(matched_edges.size(0), device=device)
+    cluster[remaining] = torch.arange(remaining.size(0), device=device) + matched_edges.size(0)
+    return cluster, matched_edges, matched_edges.size(0) + remaining.size(0)
+
+
 class OnsetEdgePooling(nn.Module):
     def __init__(self, in_channels, dropout=0, add_to_edge_score=0.5):
         super(OnsetEdgePooling, self).__init__()
@@ -83,60 +136,22 @@ class OnsetEdgePooling(nn.Module):
         e = F.dropout(e, p=self.dropout, training=self.training)
         e = self.compute_edge_score(e, edge_index, x.size(0))
         e = e + self.add_to_edge_score
-        device = x.get_device()
-        if device > 0:
-            adj = torch.sparse_coo_tensor(
-                edge_index, torch.ones(len(edge_index[0])).to(x.get_device()), (len(x), len(x))).to_dense().to(x.get_device())
-        else:
-            adj = torch.sparse_coo_tensor(
-                edge_index, torch.ones(len(edge_index[0])), (len(x), len(x))).to_dense()
-        # Get neighbor information
-        h = x + torch.mm(adj, self.trans(x)) / (adj.sum(dim=1).reshape(adj.shape[0], -1) + 1)
+        # Get neighbor information, the sum of the transformed neighbors over the degree plus one.
+        neighbors = scatter_add(self.trans(x)[edge_index[1]], edge_index[0], dim=0, dim_size=x.size(0))
+        degree = torch.bincount(edge_index[0], minlength=x.size(0)).to(x.dtype)
+        h = x + neighbors / (degree.view(-1, 1) + 1)
         x, edge_index, batch = self.__merge_edges__(h, edge_index, batch, e)
         return x, edge_index.long(), batch
 
     def __merge_edges__(self, x, edge_index, batch, edge_score):
-        nodes_remaining = set(range(x.size(0)))
-        cluster = torch.empty_like(batch, device=torch.device('cpu'))
-        edge_argsort = edge_score.detach().cpu().numpy().argsort(kind='stable')[::-1]  # Use stable sort
-
-        # Iterate through all edges, selecting it if it is not incident to
-        # another already chosen edge.
-        i = 0
-        new_edge_indices = []
-        edge_index_cpu = edge_index.cpu()
-        for edge_idx in edge_argsort.tolist():
-            source = edge_index_cpu[0, edge_idx].item()
-            # I source not in the remaining nodes move to the next edge.
-            if source not in nodes_remaining:
-                continue
-
-            target = edge_index_cpu[1, edge_idx].item()
-            # If target is not in the remaining nodes move to the next edge.
-            if target not in nodes_remaining:
-                continue
-
-            new_edge_indices.append(edge_idx)
-
-            cluster[source] = i
-            nodes_remaining.remove(source)
-
-            if source != target:
-                cluster[target] = i
-                nodes_remaining.remove(target)
-
-            i += 1
-
-        # The remaining nodes are simply kept.
-        for node_idx in nodes_remaining:
-            cluster[node_idx] = i
-            i += 1
-        cluster = cluster.to(x.device)
+        # Select the edges by decreasing score, if none of their nodes is already in a selected edge.
+        cluster, new_edge_indices, i = greedy_edge_matching(edge_index, edge_score, x.size(0))
 
         # We compute the new features as an addition of the old ones.
         new_x = scatter_add(x, cluster, dim=0, dim_size=i)
         new_edge_score = edge_score[new_edge_indices]
-        if len(nodes_remaining) > 0:
+        if i > len(new_edge_indices):
+            # The remaining nodes are simply kept.
             remaining_score = x.new_ones(
                 (new_x.size(0) - len(new_edge_indices), ))
             new_edge_score = torch.cat([new_edge_score, remaining_score])
@@ -153,7 +168,7 @@ class OnsetEdgePooling(nn.Module):
 
 class SimpleOnsetEdgePooling(nn.Module):
     def __init__(self, in_channels, dropout=0, add_to_edge_score=0.5):
-        super(OnsetEdgePooling, self).__init__()
+        super(SimpleOnsetEdgePooling, self).__init__()
         self.in_channels = in_channels
         self.add_to_edge_score = add_to_edge_score
         self.dropout = dropout
@@ -187,60 +202,22 @@ class SimpleOnsetEdgePooling(nn.Module):
         e = F.dropout(e, p=self.dropout, training=self.training)
         e = self.compute_edge_score(e, edge_index, x.size(0))
         e = e + self.add_to_edge_score
-        adj = torch.sparse_coo_tensor(
-            edge_index, torch.ones(len(edge_index[0])).to(x.get_device()), (len(x), len(x))).to_dense().to(
-            x.get_device())
         # Get neighbor information
-        # h = x + torch.mm(adj, self.trans(x)) / (adj.sum(dim=1).reshape(adj.shape[0], -1) + 1)
-        x, edge_index, batch = self.__merge_edges__(x, edge_index, batch, e)
-        return x, edge_index.long(), batch
+        # h = x + scatter_add(self.trans(x)[edge_index[1]], edge_index[0], dim=0, dim_size=x.size(0)) / (degree + 1)
+        return self.__merge_edges__(x, edge_index, batch, e)
 
     def __merge_edges__(self, x, edge_index, batch, edge_score):
-        nodes_remaining = set(range(x.size(0)))
-        nodes_discarded = nodes_remaining(set(torch.unique(edge_index[0]).tolist()), nodes_remaining)
-        cluster = torch.empty_like(batch, device=torch.device('cpu'))
-        edge_argsort = edge_score.detach().cpu().numpy().argsort(kind='stable')[::-1]  # Use stable sort
-
-        # Iterate through all edges, selecting it if it is not incident to
-        # another already chosen edge.
-        i = 0
-        new_edge_indices = []
-        edge_index_cpu = edge_index.cpu()
-        for edge_idx in edge_argsort.tolist():
-            source = edge_index_cpu[0, edge_idx].item()
-            # I source not in the remaining nodes move to the next edge.
-            if source not in nodes_remaining:
-                continue
-
-            target = edge_index_cpu[1, edge_idx].item()
-            # If target is not in the remaining nodes move to the next edge.
-            if target not in nodes_remaining:
-                continue
-
-            # if target is not in the discarded nodes move to the next edge.
-            if target not in nodes_discarded:
-                continue
-
-            cluster[source] = i
-            nodes_remaining.remove(source)
-            nodes_discarded.remove(target)
-
-            if source != target:
-                cluster[target] = i
-                nodes_remaining.remove(target)
-
-            i += 1
-
-        # The remaining nodes are simply kept.
-        for node_idx in nodes_remaining:
-            cluster[node_idx] = i
-            i += 1
-        cluster = cluster.to(x.device)
+        # Only edges whose target is the source of an edge can be selected.
+        is_source = torch.zeros(x.size(0), dtype=torch.bool, device=edge_index.device)
+        is_source[edge_index[0]] = True
+        candidates = is_source[edge_index[1]].nonzero().view(-1)
+        cluster, new_edge_indices, i = greedy_edge_matching(edge_index[:, candidates], edge_score[candidates], x.size(0))
 
         # We compute the new features as an addition of the old ones.
         new_x = scatter_add(x, cluster, dim=0, dim_size=i)
-        new_edge_score = edge_score[new_edge_indices]
-        if len(nodes_remaining) > 0:
+        new_edge_score = edge_score[candidates[new_edge_indices]]
+        if i > len(new_edge_indices):
+            # The remaining nodes are simply kept.
             remaining_score = x.new_ones(
                 (new_x.size(0) - len(new_edge_indices),))
             new_edge_score = torch.cat([new_edge_score, remaining_score])
@@ -278,7 +255,8 @@ class OnsetEdgePoolingVersion2(nn.Module):
         # h = torch.mm(adj, self.trans(x)) / adj.sum(dim=1).reshape(adj.shape[0], -1)
         # add self loops to edge_index with size (2, num_edges + num_nodes)
         edge_index_sl = torch.cat([edge_index, torch.arange(x.size(0)).view(1, -1).repeat(2, 1).to(device)], dim=1)
-        h = scatter(self.trans(x)[edge_index_sl[0]], edge_index_sl[1], 0, out=torch.zeros(x.shape).to(device), reduce='mean')
+        # The mean is taken in fp32, also under mixed precision.
+        h = scatter(self.trans(x)[edge_index_sl[0]].float(), edge_index_sl[1], 0, out=torch.zeros(x.shape).to(device), reduce='mean')
         if idx is not None:
             out = h[idx]
         else:
@@ -286,6 +264,36 @@ class OnsetEdgePoolingVersion2(nn.Module):
         return out, idx
 
     def __merge_edges__(self, x, edge_index):
+        """Keep one node per onset cluster and trim the features to the kept nodes.
+
+        Onset edges connect every pair of notes with the same onset, sorted by source then target.
+        Contracting them greedily in that order keeps the highest node of every cluster, so the kept
+        nodes are found with a scatter-max over the edges. Edges without that structure are
+        contracted one by one.
+        """
+        num_nodes = x.size(0)
+        nodes = torch.arange(num_nodes, device=edge_index.device)
+        # The highest node of the out neighbourhood of every node, itself included.
+        highest = torch.maximum(nodes, scatter(edge_index[1], edge_index[0], 0, dim_size=num_nodes, reduce="max"))
+        if not self.__is_onset_clusters__(edge_index, highest):
+            return self.__merge_edges_sequential__(x, edge_index)
+        nodes_remaining = (highest == nodes).long()
+        new_x = x[nodes_remaining.to(x.device) == 1]
+        return new_x, nodes_remaining
+
+    @staticmethod
+    def __is_onset_clusters__(edge_index, highest):
+        """Whether the edges connect all pairs of nodes of disjoint clusters, sorted by source then target."""
+        source, target = edge_index
+        num_nodes = highest.size(0)
+        key = source * num_nodes + target
+        degree = torch.bincount(source, minlength=num_nodes)
+        cluster_size = torch.bincount(highest, minlength=num_nodes)
+        valid = (key[1:] > key[:-1]).all() & (source != target).all()
+        valid &= (highest[source] == highest[target]).all() & (degree == cluster_size[highest] - 1).all()
+        return bool(valid)
+
+    def __merge_edges_sequential__(self, x, edge_index):
         nodes_remaining = torch.ones(x.size(0), dtype=torch.long)
         nodes_discarded = torch.zeros(x.size(0), dtype=torch.long)
         nodes_discarded[torch.unique(edge_index[0])] = 1
@@ -451,13 +459,24 @@ class ChordPredictionModel(nn.Module):
             self.classifier = MultiTaskMLP(n_hidden, n_hidden, tasks=tasks, n_layers=1, activation=activation, dropout=dropout)
 
     def forward(self, batch):
-        x, edge_index, edge_type, onset_index, onset_idx, lengths = batch
-        h = self.encoder((x, edge_index, edge_type, onset_index, onset_idx, lengths))
+        h = self.encoder(batch)
         prediction = self.classifier(h)
         return prediction
 
-    def predict(self, score):
-        from chordgnn.utils import hetero_graph_from_note_array, select_features, add_reverse_edges_from_edge_index
+    @staticmethod
+    def score_to_graph(score):
+        """The input graph of a partitura score, with the onset and measure number of its unique onsets.
+
+        Returns
+        -------
+        x, edge_index, edge_type, onset_div : torch.Tensor
+            The note features, the edges with their reverse edges, their types and the onset of every note.
+        onsets : torch.Tensor
+            The unique onsets in beats.
+        s_measure : torch.Tensor
+            The measure number of every unique onset.
+        """
+        from chordgnn.utils import fast_hetero_graph_from_note_array, select_features, add_reverse_edges_from_edge_index
         note_array = score.note_array(include_time_signature=True, include_pitch_spelling=True)
         onsets = torch.unique(torch.tensor(note_array["onset_beat"]))
         unique_onset_divs = torch.unique(torch.tensor(note_array["onset_div"]))
@@ -466,19 +485,142 @@ class ChordPredictionModel(nn.Module):
         s_measure = torch.zeros((len(unique_onset_divs)))
         for idx, measure_num in enumerate(measure_names):
             s_measure[torch.where((unique_onset_divs >= measures[idx, 0]) & (unique_onset_divs < measures[idx, 1]))] = measure_num
-        nodes, edges = hetero_graph_from_note_array(note_array=note_array)
+        nodes, edges = fast_hetero_graph_from_note_array(note_array=note_array)
         note_features = select_features(note_array, "chord")
-        onset_idx = unique_onsets(torch.tensor(note_array["onset_div"]))
+        onset_div = torch.tensor(note_array["onset_div"])
         edge_index = torch.tensor(edges[:2, :]).long()
         x = torch.tensor(note_features).float()
         edge_type = torch.tensor(edges[2, :]).long()
-        onset_edges = edge_index[:, edge_type == 0]
         edge_index, edge_type = add_reverse_edges_from_edge_index(edge_index, edge_type)
+        return x, edge_index, edge_type, onset_div, onsets, s_measure
+
+    def predict(self, score):
+        x, edge_index, edge_type, onset_div, onsets, s_measure = self.score_to_graph(score)
+        # Reverse edges are appended with a new type, so the onset edges are the ones of the score.
+        onset_edges = edge_index[:, edge_type == 0]
+        onset_idx = unique_onsets(onset_div)
         onset_predictions = self.forward((x, edge_index, edge_type, onset_edges, onset_idx, None))
         onset_predictions["onset"] = onsets
         onset_predictions["s_measure"] = s_measure
         return onset_predictions
 
+    def predict_many(self, scores, batch_size=8, post_processing=None, verbose=False):
+        """Predict several scores, batch_size of them at a time as one disjoint union graph.
+
+        The graphs of a batch are packed as for training (see chordgnn.utils.batch_graphs), the encoder and
+        the post-processing model run once per batch and the predictions are split back per score.
+
+        Parameters
+        ----------
+        scores : list of partitura.score.Score
+            The scores to predict.
+        batch_size : int
+            The number of scores per batch.
+        post_processing : PostProcessingMLTModel
+            Applied on the predictions of every batch, optional.
+        verbose : bool
+            Print the number of scores predicted per second.
+
+        Returns
+        -------
+        predictions : list of dict
+            The predictions of every score, as returned by predict (and post_processing.predict).
+        """
+        from chordgnn.utils import batch_graphs
+        start = time.time()
+        predictions = list()
+        for b in range(0, len(scores), batch_size):
+            graphs = [self.score_to_graph(score) for score in scores[b:b + batch_size]]
+            # Onsets start at zero, so that the onsets of the graphs of the batch do not overlap.
+            x, edge_index, edge_type, onset_div, lengths, perm_idx = batch_graphs(
+                [g[0] for g in graphs], [g[1] for g in graphs], [g[2] for g in graphs],
+                [g[3] - g[3].min() for g in graphs], [len(torch.unique(g[3])) for g in graphs])
+            onset_edges = edge_index[:, edge_type == 0]
+            onset_idx = unique_onsets(onset_div)
+            batch_pred = self.forward((x, edge_index, edge_type, onset_edges, onset_idx, lengths))
+            batch_pred = {k: v.reshape(len(graphs), -1, v.shape[-1]) for k, v in batch_pred.items()}
+            if post_processing is not None:
+                batch_pred = post_processing(batch_pred, lengths)
+                batch_pred = {k: v.reshape(len(graphs), -1, v.shape[-1]) for k, v in batch_pred.items()}
+            batch_predictions = [None] * len(graphs)
+            for i, pi in enumerate(perm_idx):
+                onset_predictions = {k: v[i, :lengths[i]] for k, v in batch_pred.items()}
+                onset_predictions["onset"] = graphs[pi][4]
+                onset_predictions["s_measure"] = graphs[pi][5]
+                batch_predictions[pi] = onset_predictions
+            predictions.extend(batch_predictions)
+        if verbose:
+            elapsed = time.time() - start
+            print("Predicted {} scores in {:.2f} s, {:.2f} scores/s".format(len(scores), elapsed, len(scores) / elapsed))
+        return predictions
+
+    def predict_windowed(self, score, window_size=512, overlap=128, merge="center"):
+        """Predict a score window by window, with a peak memory bounded by the window size.
+
+        Windows hold at most window_size notes (at least one onset) and always cover whole onsets, a
+        window starts so that it shares about overlap notes with the previous one. The predictions of
+        the onsets covered by several windows are merged.
+
+        Parameters
+        ----------
+        score : partitura.score.Score
+            The score to predict.
+        window_size : int
+            The maximum number of notes of a window, as max_size for the training crops.
+        overlap : int
+            The number of notes shared by consecutive windows.
+        merge : str
+            "mean" averages the logits of the windows of an onset, "center" keeps the logits of the window
+            where the onset is the furthest from the window edges.
+
+        Returns
+        -------
+        onset_predictions : dict
+            The predictions of every onset, as returned by predict.
+        """
+        from chordgnn.utils import crop_edges
+        if merge not in ("mean", "center"):
+            raise ValueError("merge must be either 'mean' or 'center'")
+        x, edge_index, edge_type, onset_div, onsets, s_measure = self.score_to_graph(score)
+        # Notes in onset order, so that the notes of a range of onsets are a range of nodes.
+        perm = torch.argsort(onset_div, stable=True)
+        inverse = torch.empty_like(perm)
+        inverse[perm] = torch.arange(perm.size(0))
+        x, edge_index, onset_div = x[perm], inverse[edge_index], onset_div[perm]
+        unique, counts = torch.unique_consecutive(onset_div, return_counts=True)
+        # The first note of every onset, and the end of the last one.
+        ptr = torch.cat((counts.new_zeros(1), counts.cumsum(0))).tolist()
+        n_onsets = len(unique)
+        merged, best = dict(), torch.full((n_onsets,), -1)
+        count = torch.zeros(n_onsets)
+        s = 0
+        while s < n_onsets:
+            e = max(bisect.bisect_right(ptr, ptr[s] + window_size) - 1, s + 1)
+            w_edge_index, w_edge_type = crop_edges(edge_index, edge_type, ptr[s], ptr[e])
+            w_onset_div = onset_div[ptr[s]:ptr[e]]
+            onset_edges = w_edge_index[:, w_edge_type == 0]
+            pred = self.forward((x[ptr[s]:ptr[e]], w_edge_index, w_edge_type, onset_edges, unique_onsets(w_onset_div), None))
+            if merge == "mean":
+                for task, logits in pred.items():
+                    merged.setdefault(task, logits.new_zeros((n_onsets, logits.shape[-1])))[s:e] += logits
+                count[s:e] += 1
+            else:
+                pos = torch.arange(s, e)
+                distance = torch.minimum(pos - s, e - 1 - pos)
+                keep = distance > best[s:e]
+                best[s:e] = torch.where(keep, distance, best[s:e])
+                for task, logits in pred.items():
+                    merged.setdefault(task, logits.new_zeros((n_onsets, logits.shape[-1])))[pos[keep]] = logits[keep]
+            if e == n_onsets:
+                break
+            # The next window starts at the first onset of the last overlap notes of this one.
+            s = min(max(bisect.bisect_left(ptr, ptr[e] - overlap), s + 1), e)
+        if merge == "mean":
+            merged = {task: logits / count.unsqueeze(-1) for task, logits in merged.items()}
+        merged["onset"] = onsets
+        merged["s_measure"] = s_measure
+        return merged
+
 
 class PostProcessingMLTModel(nn.Module):
     """
@@ -496,11 +638,17 @@ class PostProcessingMLTModel(nn.Module):
         self.dropout = nn.Dropout(dropout)
         self.activation = activation
 
-    def forward(self, x):
+    def forward(self, x, lengths=None):
         h = torch.cat([F.softmax(x[task], dim=-1) for task in self.tasks.keys()], dim=-1)
         if len(h.shape) == 2:
             h = h.unsqueeze(0)
-        h, _ = self.lstm(h)
+        if lengths is not None:
+            # Padded batch of sequences, sorted by decreasing length.
+            h = nn.utils.rnn.pack_padded_sequence(h, lengths.cpu(), batch_first=True)
+            h, _ = self.lstm(h)
+            h, _ = nn.utils.rnn.pad_packed_sequence(h, batch_first=True)
+        else:
+            h, _ = self.lstm(h)
         h = self.activation(self.fc(h.squeeze()))
         h = F.normalize(h, p=2, dim=-1)
         h = self.dropout(h)
@@ -691,25 +839,7 @@ class ChordPrediction(LightningModule):
         return batch_pred
 
     def acc_compute_time_step(self, acc_RomNum, onset):
-        if isinstance(acc_RomNum, torch.Tensor):
-            df = pd.DataFrame({"onset": onset, "acc": acc_RomNum})
-        elif isinstance(acc_RomNum, dict):
-
-            acc_RomNum["onset"] = onset
-            df = pd.DataFrame(acc_RomNum)
-        dfout = copy.deepcopy(df)
-        dfout["onset"] = dfout["onset"] - dfout["onset"].min()
-        for i in range(1, len(df)):
-            onset_diff = int((df["onset"][i] - df["onset"][i - 1]) / 0.125) - 1
-            row = df.iloc[i - 1]
-            for j in range(onset_diff):
-                row["onset"] = row["onset"] + 0.125
-                dfout = dfout.append(row, ignore_index=True)
-        dfout.sort_values(by="onset", inplace=True)
-        if isinstance(acc_RomNum, dict):
-            return {k: dfout[k].to_numpy() for k in acc_RomNum.keys()}
-        else:
-            return dfout["acc"].to_numpy()
+        return time_step_accuracy(acc_RomNum, onset)
 
     def configure_optimizers(self):
         if self.use_rotograd:
@@ -807,17 +937,7 @@ class SingleTaskPrediction(LightningModule):
         return batch_pred
 
     def acc_compute_time_step(self, acc_RomNum, onset):
-        df = pd.DataFrame({"onset": onset, "acc": acc_RomNum})
-        dfout = copy.deepcopy(df)
-        dfout["onset"] = dfout["onset"] - dfout["onset"].min()
-        for i in range(1, len(df)):
-            onset_diff = int((df["onset"][i] - df["onset"][i - 1]) / 0.125) - 1
-            row = df.iloc[i - 1]
-            for j in range(onset_diff):
-                row["onset"] = row["onset"] + 0.125
-                dfout = dfout.append(row, ignore_index=True)
-        dfout.sort_values(by="onset", inplace=True)
-        return dfout["acc"].to_numpy().mean()
+        return time_step_accuracy(acc_RomNum, onset).mean()
 
     def configure_optimizers(self):
         if self.use_rotograd:
@@ -973,25 +1093,7 @@ class PostChordPrediction(LightningModule):
         return batch_pred
 
     def acc_compute_time_step(self, acc_RomNum, onset):
-        if isinstance(acc_RomNum, torch.Tensor):
-            df = pd.DataFrame({"onset": onset, "acc": acc_RomNum})
-        elif isinstance(acc_RomNum, dict):
-
-            acc_RomNum["onset"] = onset
-            df = pd.DataFrame(acc_RomNum)
-        dfout = copy.deepcopy(df)
-        dfout["onset"] = dfout["onset"] - dfout["onset"].min()
-        for i in range(1, len(df)):
-            onset_diff = int((df["onset"][i] - df["onset"][i - 1]) / 0.125) - 1
-            row = df.iloc[i - 1]
-            for j in range(onset_diff):
-                row["onset"] = row["onset"] + 0.125
-                dfout = dfout.append(row, ignore_index=True)
-        dfout.sort_values(by="onset", inplace=True)
-        if isinstance(acc_RomNum, dict):
-            return {k: dfout[k].to_numpy() for k in acc_RomNum.keys()}
-        else:
-            return dfout["acc"].to_numpy()
+        return time_step_accuracy(acc_RomNum, onset)
 
     def configure_optimizers(self):
         optimizer = torch.optim.AdamW([
@@ -1010,4 +1112,37 @@ def unique_onsets(onsets):
     perm = torch.arange(inverse.size(0), dtype=inverse.dtype, device=inverse.device)
     inverse, perm = inverse.flip([0]), perm.flip([0])
     perm = inverse.new_empty(unique.size(0)).scatter_(0, inverse, perm)
-    return perm
\ No newline at end of file
+    return perm
+
+
+def time_step_accuracy(acc, onset, step=0.125):
+    """Expand onset level accuracies to a grid of time steps (32nd notes), for the chord symbol recall.
+
+    Every onset is repeated on the grid until the next onset, the last onset takes a single step.
+
+    Parameters
+    ----------
+    acc : torch.Tensor, np.ndarray or dict
+        The accuracy of every onset, or a dict of them.
+    onset : torch.Tensor or np.ndarray
+        The sorted onsets in beats.
+    step : float
+        The time step in beats.
+
+    Returns
+    -------
+    np.ndarray or dict
+        The accuracies of every time step, the dict also holds the time steps under "onset".
+    """
+    onset = np.asarray(onset)
+    if len(onset) > 0:
+        # A gap of k steps to the next onset repeats the onset k times.
+        repeats = np.r_[np.maximum(np.trunc(np.diff(onset) / step).astype(np.int64), 1), 1]
+    else:
+        repeats = np.zeros(0, dtype=np.int64)
+    if not isinstance(acc, dict):
+        return np.repeat(np.asarray(acc), repeats)
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    time_steps = {k: np.repeat(np.asarray(v), repeats) for k, v in acc.items()}
+    time_steps["onset"] = np.repeat(onset - onset.min(initial=0), repeats) + offsets * step
+    return time_steps
@@ -1,9 +1,43 @@
 import torch.nn as nn
 from torch.nn import functional as F
 import torch
+from torch_scatter import scatter, segment_csr
+from chordgnn.utils.hgraph import relation_csr
 from .gnn import SageConvScatter as SageConv, ResGatedGraphConv, JumpingKnowledge
 
 
+def relation_edges(edge_type, etypes):
+    """The edges of every relation of etypes, with the position of the relation for each edge.
+
+    An edge appears once for every relation with its type, as with a mask per relation.
+    """
+    values = torch.tensor(list(etypes.values()), dtype=edge_type.dtype, device=edge_type.device)
+    edge_idx, relation = (edge_type.unsqueeze(-1) == values).nonzero(as_tuple=True)
+    return edge_idx, relation
+
+
+def shared_relation_csr(etypes, x, edge_index, edge_type, csr=None):
+    """The RelationCSR the layers of a network share in a forward pass, if the relations of etypes are numbered 0 to n - 1.
+
+    A given csr must have been built with the number of relations of etypes.
+    """
+    if csr is not None and csr.num_relations != len(etypes):
+        raise ValueError("The RelationCSR has {} relations, the layers have {}.".format(csr.num_relations, len(etypes)))
+    if csr is None and list(etypes.values()) == list(range(len(etypes))):
+        csr = relation_csr(edge_index, edge_type, x.shape[0], len(etypes))
+    return csr
+
+
+def stacked_linear(x, linears, weights=None):
+    """Apply the linear layers of all relations with a single matmul, the output is [num_nodes, num_relations, out].
+
+    weights optionally selects the columns of the weights of every layer (e.g. slice(0, in_features)).
+    """
+    weight = torch.cat([lin.weight if weights is None else lin.weight[:, weights] for lin in linears], dim=0)
+    bias = None if linears[0].bias is None else torch.cat([lin.bias for lin in linears], dim=0)
+    return F.linear(x, weight, bias).view(x.shape[0], len(linears), -1)
+
+
 class HeteroAttention(nn.Module):
     def __init__(self, n_hidden, n_layers):
         super(HeteroAttention, self).__init__()
@@ -54,12 +88,30 @@ class HeteroResGatedGraphConvLayer(nn.Module):
         for conv in self.conv.values():
             conv.reset_parameters()
 
-    def forward(self, x, edge_index, edge_type):
-        out = torch.zeros((len(self.conv.keys()), x.shape[0], self.out_features))
-        for idx, (ekey, evalue) in enumerate(self.etypes.items()):
-            mask = edge_type == evalue
-            out[idx] = self.conv[ekey](x, edge_index[:, mask])
-        return self.reduction(out).to(x.device)
+    def forward(self, x, edge_index, edge_type, csr=None):
+        """All relations at once, every ResGatedGraphConv weight is stacked over the relations and
+        the messages of all edges are summed with a single scatter over (node, relation).
+
+        With the RelationCSR of the edges (see chordgnn.utils.hgraph.relation_csr) the messages
+        are summed with a segment reduction instead."""
+        convs = [self.conv[ekey] for ekey in self.etypes.keys()]
+        n_rel = len(convs)
+        h1 = stacked_linear(x, [conv.W1 for conv in convs])
+        h2 = stacked_linear(x, [conv.W2 for conv in convs])
+        h3 = stacked_linear(x, [conv.W3 for conv in convs])
+        h4 = stacked_linear(x, [conv.W4 for conv in convs])
+        if csr is not None:
+            src, dst, relation = csr.node, csr.col, csr.relation
+        else:
+            edge_idx, relation = relation_edges(edge_type, self.etypes)
+            src, dst = edge_index[0, edge_idx], edge_index[1, edge_idx]
+        gate = torch.sigmoid(h3[src, relation] + h4[dst, relation])
+        if csr is not None:
+            s = segment_csr(gate * h2[dst, relation], csr.rowptr, reduce='sum')
+        else:
+            s = scatter(gate * h2[dst, relation], src * n_rel + relation, 0, dim_size=x.shape[0] * n_rel, reduce='sum')
+        out = 2 * h1 + s.view(x.shape[0], n_rel, -1)
+        return self.reduction(out.transpose(0, 1))
 
 
 class HeteroSageConvLayer(nn.Module):
@@ -92,12 +144,30 @@ class HeteroSageConvLayer(nn.Module):
         for conv in self.conv.values():
             conv.reset_parameters()
 
-    def forward(self, x, edge_index, edge_type):
-        out = torch.zeros((len(self.conv.keys()), x.shape[0], self.out_features))
-        for idx, (ekey, evalue) in enumerate(self.etypes.items()):
-            mask = edge_type == evalue
-            out[idx] = self.conv[ekey](x, edge_index[:, mask])
-        return self.reduction(out).to(x.device)
+    def forward(self, x, edge_index, edge_type, csr=None):
+        """All relations at once, every SageConv weight is stacked over the relations and the
+        neighbors of all edges are averaged with a single scatter over (node, relation).
+
+        With the RelationCSR of the edges (see chordgnn.utils.hgraph.relation_csr) the neighbors
+        are summed with a segment reduction and divided by the degrees of the CSR instead."""
+        convs = [self.conv[ekey] for ekey in self.etypes.keys()]
+        n_rel = len(convs)
+        in_features = x.shape[-1]
+        # The neighbors are averaged in fp32, also under mixed precision.
+        h = stacked_linear(x, [conv.neigh_linear for conv in convs]).float()
+        # The node itself is added to the neighbor sum and divided by the number of neighbors, as in SageConv.
+        if csr is not None:
+            s = segment_csr(h[csr.col, csr.relation], csr.rowptr, reduce='sum').view(x.shape[0], n_rel, in_features)
+            s = (h + s) / csr.degree.clamp(min=1).unsqueeze(-1).float()
+        else:
+            edge_idx, relation = relation_edges(edge_type, self.etypes)
+            src, dst = edge_index[0, edge_idx], edge_index[1, edge_idx]
+            s = scatter(h[dst, relation], src * n_rel + relation, 0, out=h.reshape(-1, in_features).clone(), reduce='mean')
+            s = s.view(x.shape[0], n_rel, in_features)
+        neigh_weight = torch.stack([conv.linear.weight[:, in_features:] for conv in convs], dim=0)
+        out = stacked_linear(x, [conv.linear for conv in convs], slice(0, in_features))
+        out = out + torch.einsum("nri,roi->nro", s, neigh_weight)
+        return self.reduction(out.transpose(0, 1))
 
 
 
@@ -105,6 +175,8 @@ class HGCN(nn.Module):
     def __init__(self, in_feats, n_hidden, out_feats, n_layers, etypes={"onset":0, "consecutive":1, "during":2, "rests":3, "consecutive_rev":4, "during_rev":5, "rests_rev":6}, activation=F.relu, dropout=0.5, jk=False):
         super(HGCN, self).__init__()
         self.n_hidden = n_hidden
+        # Aggregate over a RelationCSR of the edges, exports that do not support segment_csr turn it off.
+        self.segment_reduce = True
         self.layers = nn.ModuleList()
         self.normalize = F.normalize
         self.activation = activation
@@ -124,18 +196,20 @@ class HGCN(nn.Module):
         for conv in self.layers:
             conv.reset_parameters()
 
-    def forward(self, x, edge_index, edge_type):
+    def forward(self, x, edge_index, edge_type, csr=None):
+        # The edges are grouped by node and relation once for all layers.
+        csr = shared_relation_csr(self.layers[0].etypes, x, edge_index, edge_type, csr) if self.segment_reduce else None
         h = x
         hs = []
         for conv in self.layers[:-1]:
-            h = conv(h, edge_index, edge_type)
+            h = conv(h, edge_index, edge_type, csr)
             h = self.activation(h)
             h = self.normalize(h)
             h = self.dropout(h)
             hs.append(h)
         if self.use_knowledge:
             h = self.jk(hs)
-        h = self.layers[-1](h, edge_index, edge_type)
+        h = self.layers[-1](h, edge_index, edge_type, csr)
         return h
 
 
@@ -143,6 +217,8 @@ class HResGatedConv(nn.Module):
     def __init__(self, in_feats, n_hidden, out_feats, n_layers, etypes={"onset":0, "consecutive":1, "during":2, "rests":3, "consecutive_rev":4, "during_rev":5, "rests_rev":6}, activation=F.relu, dropout=0.5, jk=False):
         super(HResGatedConv, self).__init__()
         self.n_hidden = n_hidden
+        # Aggregate over a RelationCSR of the edges, exports that do not support segment_csr turn it off.
+        self.segment_reduce = True
         self.layers = nn.ModuleList()
         self.normalize = F.normalize
         self.activation = activation
@@ -162,11 +238,13 @@ class HResGatedConv(nn.Module):
         for conv in self.layers:
             conv.reset_parameters()
 
-    def forward(self, x, edge_index, edge_type):
+    def forward(self, x, edge_index, edge_type, csr=None):
+        # The edges are grouped by node and relation once for all layers.
+        csr = shared_relation_csr(self.layers[0].etypes, x, edge_index, edge_type, csr) if self.segment_reduce else None
         h = x
         hs = []
         for conv in self.layers:
-            h = conv(h, edge_index, edge_type)
+            h = conv(h, edge_index, edge_type, csr)
             h = self.activation(h)
             h = self.normalize(h)
             h = self.dropout(h)
@@ -218,11 +296,11 @@ class HGPSLayer(nn.Module):
         self.attn = nn.MultiheadAttention(out_features, num_heads, dropout=dropout, bias=bias, batch_first=True)
         self.local = HeteroResGatedGraphConvLayer(out_features, out_features, bias=bias, etypes=etypes)
 
-    def forward(self, x, edge_index, edge_type):
+    def forward(self, x, edge_index, edge_type, csr=None):
 
         h_init = self.embedding(x)
         # Local embeddings
-        local_out = self.local(h_init, edge_index, edge_type)
+        local_out = self.local(h_init, edge_index, edge_type, csr)
         local_out = self.activation(local_out)
         local_out = self.normalize_local(local_out)
         local_out = self.dropout_local(local_out)
@@ -251,6 +329,8 @@ class HGPS(nn.Module):
     def __init__(self, in_feats, n_hidden, out_feats, n_layers, etypes={"onset":0, "consecutive":1, "during":2, "rests":3, "consecutive_rev":4, "during_rev":5, "rests_rev":6}, activation=F.relu, dropout=0.5, jk=False):
         super(HGPS, self).__init__()
         self.n_hidden = n_hidden
+        # Aggregate over a RelationCSR of the edges, exports that do not support segment_csr turn it off.
+        self.segment_reduce = True
         self.layers = nn.ModuleList()
         self.normalize = F.normalize
         self.activation = activation
@@ -265,11 +345,13 @@ class HGPS(nn.Module):
             self.use_knowledge = False
         self.layers.append(HGPSLayer(n_hidden, out_feats, etypes=etypes, num_heads=4))
 
-    def forward(self, x, edge_index, edge_type):
+    def forward(self, x, edge_index, edge_type, csr=None):
+        # The edges are grouped by node and relation once for all layers.
+        csr = shared_relation_csr(self.layers[0].local.etypes, x, edge_index, edge_type, csr) if self.segment_reduce else None
         h = x
         hs = []
         for conv in self.layers:
-            h = conv(h, edge_index, edge_type)
+            h = conv(h, edge_index, edge_type, csr)
             h = self.activation(h)
             h = self.normalize(h)
             h = self.dropout(h)
@@ -0,0 +1,172 @@
+"""
+Export of the chord prediction inference graph to TorchScript and ONNX, and a CPU runner of the exported files.
+
+The exported graph is the encoder, the multi-task classifier and the post-processing model. It takes the
+score graph (x, edge_index, edge_type, onset_edges, onset_idx) and returns the logits of every task, so that
+inference needs neither Lightning, rotograd nor the checkpoint hyper-parameters.
+"""
+import copy
+import inspect
+import json
+import os
+import torch
+import torch.nn as nn
+from .chord import ChordPredictionModel, unique_onsets
+
+
+class ChordInferenceModel(nn.Module):
+    """The inference graph of a ChordPredictionModel and an optional PostProcessingMLTModel.
+
+    The logits are returned as a tuple, in the order of the tasks of the encoder.
+    """
+    def __init__(self, encoder, post_processing=None):
+        super(ChordInferenceModel, self).__init__()
+        self.encoder = encoder
+        self.post_processing = post_processing
+        self.tasks = list(encoder.tasks.keys())
+
+    def forward(self, x, edge_index, edge_type, onset_edges, onset_idx):
+        prediction = self.encoder((x, edge_index, edge_type, onset_edges, onset_idx, None))
+        if self.post_processing is not None:
+            prediction = self.post_processing(prediction)
+        return tuple(prediction[task] for task in self.tasks)
+
+
+def example_inputs(score):
+    """The inputs of the inference graph for a partitura score."""
+    x, edge_index, edge_type, onset_div, _, _ = ChordPredictionModel.score_to_graph(score)
+    return x, edge_index, edge_type, edge_index[:, edge_type == 0], unique_onsets(onset_div)
+
+
+def _inference_model(encoder, post_processing):
+    model = ChordInferenceModel(encoder, post_processing).eval()
+    # segment_csr is a custom op, the exported graph aggregates with scatter.
+    model.encoder.encoder.encoder.segment_reduce = False
+    return model
+
+
+def export_torchscript(encoder, post_processing, inputs, path):
+    """Trace the inference graph on example inputs and save it with its task names.
+
+    Parameters
+    ----------
+    encoder : ChordPredictionModel
+        The encoder and multi-task classifier.
+    post_processing : PostProcessingMLTModel
+        The post-processing model, or None.
+    inputs : tuple
+        Example inputs (x, edge_index, edge_type, onset_edges, onset_idx), see example_inputs.
+    path : str
+        The file to save the TorchScript module to.
+    """
+    model = _inference_model(encoder, post_processing)
+    try:
+        with torch.no_grad():
+            traced = torch.jit.trace(model, inputs, check_trace=False)
+        torch.jit.save(traced, path, _extra_files={"tasks.json": json.dumps(model.tasks)})
+    finally:
+        model.encoder.encoder.encoder.segment_reduce = True
+    return path
+
+
+def export_onnx(encoder, post_processing, inputs, path, opset_version=17):
+    """Export the inference graph to ONNX, with a dynamic number of notes, edges and onsets.
+
+    The outputs are named after the tasks. See export_torchscript for the parameters.
+    """
+    model = _inference_model(encoder, post_processing)
+    input_names = ["x", "edge_index", "edge_type", "onset_edges", "onset_idx"]
+    dynamic_axes = {"x": {0: "notes"}, "edge_index": {1: "edges"}, "edge_type": {0: "edges"},
+                    "onset_edges": {1: "onset_edges"}, "onset_idx": {0: "onsets"}}
+    dynamic_axes.update({task: {0: "onsets"} for task in model.tasks})
+    # The TorchScript based exporter keeps the sequence length of the GRUs dynamic.
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    try:
+        with torch.no_grad():
+            torch.onnx.export(model, inputs, path, input_names=input_names, output_names=model.tasks,
+                              dynamic_axes=dynamic_axes, opset_version=opset_version, **kwargs)
+    finally:
+        model.encoder.encoder.encoder.segment_reduce = True
+    return path
+
+
+def _dynamic_qconfig_spec(model, skip=()):
+    from torch.ao.quantization import default_dynamic_qconfig, float_qparams_weight_only_qconfig
+    qconfig_spec = dict()
+    for name, module in model.named_modules():
+        if any(name.startswith(prefix) for prefix in skip):
+            continue
+        if isinstance(module, (nn.Linear, nn.GRU, nn.LSTM)):
+            qconfig_spec[name] = default_dynamic_qconfig
+        elif isinstance(module, nn.Embedding):
+            qconfig_spec[name] = float_qparams_weight_only_qconfig
+    return qconfig_spec
+
+
+def quantize_models(encoder, post_processing=None):
+    """Int8 dynamic quantization of the linear, recurrent and embedding layers, for CPU inference.
+
+    The hetero graph convolutions stack the weights of their linear layers over the relations in the
+    forward pass, so they are kept in fp32. The models are copied.
+
+    Returns
+    -------
+    encoder, post_processing : nn.Module
+        The quantized models, post_processing is None if not given.
+    """
+    from torch.ao.quantization import quantize_dynamic
+    encoder = copy.deepcopy(encoder).eval()
+    encoder = quantize_dynamic(encoder, _dynamic_qconfig_spec(encoder, skip=("encoder.encoder.",)), dtype=torch.qint8)
+    if post_processing is not None:
+        post_processing = copy.deepcopy(post_processing).eval()
+        post_processing = quantize_dynamic(post_processing, _dynamic_qconfig_spec(post_processing), dtype=torch.qint8)
+    return encoder, post_processing
+
+
+class ExportedChordModel(object):
+    """CPU runner of an exported inference graph, TorchScript (.pt) or ONNX (.onnx) by file extension.
+
+    Parameters
+    ----------
+    path : str
+        The exported file.
+    num_threads : int
+        The number of intra-op threads, the runtime default if None.
+    """
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        if os.path.splitext(path)[1] == ".onnx":
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            if num_threads is not None:
+                options.intra_op_num_threads = num_threads
+            self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            self.tasks = [output.name for output in self.session.get_outputs()]
+            self.module = None
+        else:
+            if num_threads is not None:
+                torch.set_num_threads(num_threads)
+            extra_files = {"tasks.json": ""}
+            self.module = torch.jit.load(path, map_location="cpu", _extra_files=extra_files)
+            self.tasks = json.loads(extra_files["tasks.json"])
+            self.session = None
+
+    def __call__(self, x, edge_index, edge_type, onset_edges, onset_idx):
+        """The logits of every task, as a dict of tensors."""
+        if self.session is not None:
+            inputs = {"x": x, "edge_index": edge_index, "edge_type": edge_type,
+                      "onset_edges": onset_edges, "onset_idx": onset_idx}
+            inputs = {i.name: inputs[i.name].numpy() for i in self.session.get_inputs()}
+            outputs = self.session.run(self.tasks, inputs)
+            return {task: torch.from_numpy(out) for task, out in zip(self.tasks, outputs)}
+        with torch.no_grad():
+            outputs = self.module(x, edge_index, edge_type, onset_edges, onset_idx)
+        return {task: out for task, out in zip(self.tasks, outputs)}
+
+    def predict(self, score):
+        """The predictions of a partitura score, as returned by the predict methods of the models."""
+        x, edge_index, edge_type, onset_div, onsets, s_measure = ChordPredictionModel.score_to_graph(score)
+        onset_predictions = self(x, edge_index, edge_type, edge_index[:, edge_type == 0], unique_onsets(onset_div))
+        onset_predictions["onset"] = onsets
+        onset_predictions["s_measure"] = s_measure
+        return onset_predictions
@@ -0,0 +1,65 @@
+import time
+import resource
+import torch
+from torch.utils.data import DataLoader
+from pytorch_lightning.callbacks import Callback
+from pytorch_lightning.utilities.apply_func import apply_to_collection
+
+
+def trainer_precision(precision):
+    """The Trainer precision of a command line value, "32", "16" or "bf16"."""
+    return int(precision) if precision.isdigit() else precision
+
+
+class EpochStatsCallback(Callback):
+    """Log the wall time and the peak memory of every training epoch.
+
+    The peak memory is the allocated CUDA memory on GPU, and the maximum resident set size of the process
+    on CPU. The statistics of every epoch are kept in `history`.
+    """
+    def __init__(self, verbose=True):
+        super(EpochStatsCallback, self).__init__()
+        self.verbose = verbose
+        self.history = list()
+        self._start = None
+
+    @staticmethod
+    def _peak_memory(device):
+        """Peak memory in MB."""
+        if device.type == "cuda":
+            return torch.cuda.max_memory_allocated(device) / 2**20
+        # ru_maxrss is in KB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+    def on_train_epoch_start(self, trainer, pl_module):
+        if pl_module.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(pl_module.device)
+        self._start = time.perf_counter()
+
+    def on_train_epoch_end(self, trainer, pl_module, *args):
+        if pl_module.device.type == "cuda":
+            torch.cuda.synchronize(pl_module.device)
+        stats = {"epoch": trainer.current_epoch, "epoch_time": time.perf_counter() - self._start,
+                 "peak_memory": self._peak_memory(pl_module.device)}
+        self.history.append(stats)
+        pl_module.log("epoch_time", stats["epoch_time"], on_step=False, on_epoch=True)
+        pl_module.log("peak_memory_mb", stats["peak_memory"], on_step=False, on_epoch=True)
+        if self.verbose:
+            print("Epoch {epoch}: {epoch_time:.1f}s, peak memory {peak_memory:.0f}MB".format(**stats))
+
+
+class BatchSamplerEpochCallback(Callback):
+    """Set the epoch of the batch samplers of the training DataLoaders at the start of every epoch.
+
+    Lightning only sets the epoch of the sampler of a DataLoader, not of its batch sampler, so the seeded
+    batch samplers of AugmentedGraphDatamodule would draw the same batches every epoch. The hook runs before
+    the DataLoader of the epoch is iterated, also after a reload of the DataLoaders.
+    """
+    def on_train_epoch_start(self, trainer, pl_module):
+        loaders = getattr(trainer.train_dataloader, "loaders", trainer.train_dataloader)
+        apply_to_collection(loaders, DataLoader, self._set_epoch, trainer.current_epoch)
+
+    @staticmethod
+    def _set_epoch(loader, epoch):
+        if callable(getattr(loader.batch_sampler, "set_epoch", None)):
+            loader.batch_sampler.set_epoch(epoch)
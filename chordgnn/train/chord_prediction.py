@@ -7,6 +7,7 @@ from pytorch_lightning import Trainer
 from pytorch_lightning.plugins import DDPPlugin
 from pytorch_lightning.callbacks.early_stopping import EarlyStopping
 import argparse
+from chordgnn.train.callbacks import BatchSamplerEpochCallback, EpochStatsCallback, trainer_precision
 
 
 parser = argparse.ArgumentParser()
@@ -15,6 +16,8 @@ parser.add_argument('--n_layers', type=int, default=1)
 parser.add_argument('--n_hidden', type=int, default=256)
 parser.add_argument('--dropout', type=float, default=0.44)
 parser.add_argument('--batch_size', type=int, default=100)
+parser.add_argument('--max_nodes', type=int, default=None, help="Node budget of a batch, replaces the fixed batch size.")
+parser.add_argument('--max_onsets', type=int, default=None, help="Padded onset budget of a batch, replaces the fixed batch size.")
 parser.add_argument('--lr', type=float, default=0.0015)
 parser.add_argument('--weight_decay', type=float, default=0.0035)
 parser.add_argument('--num_workers', type=int, default=20)
@@ -29,6 +32,8 @@ parser.add_argument("--use_ckpt", type=str, default=None, help="Use checkpoint f
 parser.add_argument("--num_tasks", type=int, default=11, choices=[5, 11, 14], help="Number of tasks to train on.")
 parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"], help="Version of the dataset to use.")
 parser.add_argument("--n_epochs", type=int, default=100, help="Number of epochs to train for.")
+parser.add_argument("--precision", type=str, default="32", choices=["32", "16", "bf16"],
+                    help="Training precision, 16 and bf16 train with automatic mixed precision.")
 
 # for reproducibility
 torch.manual_seed(0)
@@ -72,7 +77,8 @@ wandb_logger = WandbLogger(
 
 datamodule = st.data.AugmentedGraphDatamodule(
     num_workers=16, include_synth=args.include_synth, num_tasks=args.num_tasks,
-    collection=args.collection, batch_size=args.batch_size, version=args.data_version)
+    collection=args.collection, batch_size=args.batch_size, version=args.data_version,
+    max_nodes=args.max_nodes, max_onsets=args.max_onsets)
 model = st.models.chord.ChordPrediction(
     datamodule.features, args.n_hidden, datamodule.tasks, args.n_layers, lr=args.lr, dropout=args.dropout,
     weight_decay=args.weight_decay, use_nade=use_nade, use_jk=args.use_jk, use_rotograd=use_rotograd,
@@ -86,8 +92,11 @@ trainer = Trainer(
     num_sanity_val_steps=1,
     logger=wandb_logger,
     plugins=DDPPlugin(find_unused_parameters=False) if use_ddp else None,
-    callbacks=[checkpoint_callback],
+    # The training batch sampler shards the examples over the ranks itself.
+    replace_sampler_ddp=False,
+    callbacks=[checkpoint_callback, EpochStatsCallback(), BatchSamplerEpochCallback()],
     reload_dataloaders_every_n_epochs=5,
+    precision=trainer_precision(args.precision),
     )
 
 if not args.predict:
@@ -7,6 +7,7 @@ from pytorch_lightning import Trainer
 from pytorch_lightning.plugins import DDPPlugin
 from pytorch_lightning.callbacks.early_stopping import EarlyStopping
 import argparse
+from chordgnn.train.callbacks import BatchSamplerEpochCallback, EpochStatsCallback, trainer_precision
 
 
 parser = argparse.ArgumentParser()
@@ -29,6 +30,8 @@ parser.add_argument("--force_reload", action="store_true", help="Force reload of
 parser.add_argument("--use_ckpt", type=str, default=None, help="Use checkpoint for prediction.")
 parser.add_argument("--num_tasks", type=int, default=11, help="Number of tasks to train on.")
 parser.add_argument("--data_version", type=str, default="v1.0.0", choices=["v1.0.0", "latest"], help="Version of the dataset to use.")
+parser.add_argument("--precision", type=str, default="32", choices=["32", "16", "bf16"],
+                    help="Training precision, 16 and bf16 train with automatic mixed precision.")
 
 # for reproducibility
 torch.manual_seed(0)
@@ -78,8 +81,11 @@ trainer = Trainer(
     num_sanity_val_steps=1,
     logger=wandb_logger,
     plugins=DDPPlugin(find_unused_parameters=False) if use_ddp else None,
-    callbacks=[checkpoint_callback],
-    reload_dataloaders_every_n_epochs=5
+    # The training batch sampler shards the examples over the ranks itself.
+    replace_sampler_ddp=False,
+    callbacks=[checkpoint_callback, EpochStatsCallback(), BatchSamplerEpochCallback()],
+    reload_dataloaders_every_n_epochs=5,
+    precision=trainer_precision(args.precision),
     )
 
 import wandb, os
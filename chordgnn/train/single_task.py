@@ -7,6 +7,7 @@ from pytorch_lightning import Trainer
 from pytorch_lightning.plugins import DDPPlugin
 from pytorch_lightning.callbacks.early_stopping import EarlyStopping
 import argparse
+from chordgnn.train.callbacks import BatchSamplerEpochCallback, EpochStatsCallback, trainer_precision
 
 
 parser = argparse.ArgumentParser()
@@ -28,6 +29,8 @@ parser.add_argument("--include_synth", action="store_true", help="Include synthe
 parser.add_argument("--force_reload", action="store_true", help="Force reload of the data")
 parser.add_argument("--use_ckpt", type=str, default=None, help="Use checkpoint for prediction.")
 parser.add_argument("--task", type=str, default="localkey", help="Which task to train on")
+parser.add_argument("--precision", type=str, default="32", choices=["32", "16", "bf16"],
+                    help="Training precision, 16 and bf16 train with automatic mixed precision.")
 
 # for reproducibility
 # torch.manual_seed(0)
@@ -87,7 +90,11 @@ trainer = Trainer(
     num_sanity_val_steps=1,
     logger=wandb_logger,
     plugins=DDPPlugin(find_unused_parameters=False) if use_ddp else None,
+    # The training batch sampler shards the examples over the ranks itself.
+    replace_sampler_ddp=False,
     # callbacks=[early_stop_callback],
+    callbacks=[EpochStatsCallback(), BatchSamplerEpochCallback()],
+    precision=trainer_precision(args.precision),
     )
 
 if not args.predict:
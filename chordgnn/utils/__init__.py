@@ -1,4 +1,4 @@
-from chordgnn.utils.chord_representations import chord_to_intervalVector, time_divided_tsv_to_note_array, time_divided_tsv_to_part
+from chordgnn.utils.chord_representations import chord_to_intervalVector, time_divided_tsv_to_note_array, time_divided_tsv_to_part, time_divided_tsv_to_transposable_part
 from .graph import *
 from .hgraph import *
 from .globals import *
\ No newline at end of file
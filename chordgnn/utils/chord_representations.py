@@ -2,13 +2,14 @@
 Adapted from https://github.com/napulen/AugmentedNet
 """
 
-from itertools import combinations
 import re
-import partitura
 import numpy as np
 import pandas as pd
 from chordgnn.utils.globals import *
 from chordgnn.utils.general import exit_after
+from chordgnn.utils.pcset_table import INTERVAL_VECTORS, pc_mask
+from chordgnn.utils.tsv_reader import read_time_divided_tsv, parse_literal_column, frames_to_note_array
+from chordgnn.utils.label_encoding import factorize, class_indices, transposition_table, NOT_A_CLASS
 from fractions import Fraction
 import numpy.lib.recfunctions as rfn
 from music21.key import Key
@@ -25,6 +26,7 @@ _keyObj = {}
 _intervalObj = {}
 _weberEuclidean = {}
 _getTonicizationScaleDegree = {}
+_transpositionTables = {}
 
 
 def chord_to_intervalVector(midi_pitches, return_pc_class=False):
@@ -41,26 +43,18 @@ def chord_to_intervalVector(midi_pitches, return_pc_class=False):
     intervalVector : list(int)
         The interval Vector is a list of six integer values.
     '''
-    intervalVector = [0, 0, 0, 0, 0, 0]
-    PC = set([mp%12 for mp in midi_pitches])
-    for p1, p2 in combinations(PC, 2):
-        interval = int(abs(p1 - p2))
-        if interval <= 6:
-            index = interval
-        else:
-            index = 12 - interval
-        if index != 0:
-            index = index-1
-            intervalVector[index] += 1
+    intervalVector = INTERVAL_VECTORS[pc_mask(midi_pitches)].tolist()
     if return_pc_class:
-        return intervalVector, list(PC)
+        return intervalVector, list(set([mp%12 for mp in midi_pitches]))
     else:
         return intervalVector
 
 
 def encode_one_hot(df, object, transposition=None):
     '''Given a dataframe it encodes the chord column as one hot.'''
-    return object(df).run(transposition=transposition)
+    representation = object(df)
+    # The representation is already encoded untransposed when it is built.
+    return representation.array if transposition == "P1" else representation.run(transposition=transposition)
 
 
 def fixkey(key_string):
@@ -71,7 +65,6 @@ def fixkey(key_string):
 
 
 def create_data(filtered_df, time_signature, interval="P1"):
-    note_array = list()
     onset = np.expand_dims(filtered_df["j_offset"].to_numpy(), axis=1)
     localkey = encode_one_hot(filtered_df, LocalKey35, transposition=interval)
     tonkey = encode_one_hot(filtered_df, TonicizedKey35, transposition=interval)
@@ -87,45 +80,18 @@ def create_data(filtered_df, time_signature, interval="P1"):
     y = np.stack(
         (localkey, tonkey, degree1, degree2, quality, inversion, root, romanNumeral, hrythm, pcset, bass, onset),
         axis=1)
-    for i, row in filtered_df.iterrows():
-        pitches = eval(row["s_notes"])
-        # is_onset = eval(row["s_isOnset"])
-        for j, pitch in enumerate(pitches):
-            pitch = TransposePitch(pitch, interval)
-            p = re.findall(r'[A-Za-z]+|\W+|\d+', pitch)
-            step, alter, octave = (p[0], p[1], eval(p[2])) if len(p) == 3 else (p[0], "", eval(p[1]))
-            alter = ALTER[alter]
-            mp = partitura.utils.pitch_spelling_to_midi_pitch(step, alter, octave)
-            note_array.append((row["j_offset"], row["s_duration"], mp, int(time_signature), 4, step, alter, octave))
-    dtype = np.dtype(
-        [('onset_beat', float), ('duration_beat', float), ('pitch', int), ('ts_beats', int), ('ts_beat_type', int),
-         ("step", '<U10'), ("alter", int), ("octave", int)])
-    X = np.array(note_array, dtype)
+    X = frames_to_note_array(filtered_df, time_signature, transpose_pitch=TransposePitch, interval=interval)
     return X, y
 
 
 
 
-def time_divided_tsv_to_note_array(time_divided_tsv_path, transpose=False, version="v1.0.0"):
-    '''Given a time divided tsv file from AugmentedNet Dataset it returns a numpy array of notes.
-
-    Parameters
-    ----------
-    time_divided_tsv_path : str
-        The path to the time divided csv file.
-
-    Returns
-    -------
-    note_array : np.array
-        The note array is a numpy array of notes.
-    '''
-
-    df = pd.read_csv(time_divided_tsv_path, sep='\t', header=0)
+def _read_filtered_tsv(time_divided_tsv_path):
+    """The frames of a time divided tsv file where the sounding notes change, and the time signature."""
+    df, has_onsets, num_notes = read_time_divided_tsv(time_divided_tsv_path)
     time_signature = len(df[df["s_measure"] == 2]) / 8
     # Assume 4/4 time signature when 0
     time_signature = 4 if time_signature == 0 else time_signature
-    has_onsets = df["s_isOnset"].apply(lambda x: any(eval(x))).to_numpy()
-    num_notes = df["s_isOnset"].apply(lambda x: len(eval(x))).to_numpy()
     # Filter when rests are present
     durations = np.absolute(df["s_duration"].to_numpy()[:] - np.roll(df["s_duration"].to_numpy()[:], 1)) > 0
     # Filter when a note stop sounding in a set others are still present.
@@ -136,8 +102,26 @@ def time_divided_tsv_to_note_array(time_divided_tsv_path, transpose=False, versi
     # NOTE: reset index.
     filtered_df = df.iloc[idx, :].sort_values(by=["j_offset"])
     filtered_df["a_degree1"] = filtered_df["a_degree1"].astype(str)
-    filtered_df["a_pcset"] = filtered_df["a_pcset"].apply(eval)
+    filtered_df["a_pcset"] = parse_literal_column(filtered_df["a_pcset"])
     filtered_df["a_localKey"] = filtered_df["a_localKey"].apply(fixkey)
+    return filtered_df, time_signature
+
+
+def time_divided_tsv_to_note_array(time_divided_tsv_path, transpose=False, version="v1.0.0"):
+    '''Given a time divided tsv file from AugmentedNet Dataset it returns a numpy array of notes.
+
+    Parameters
+    ----------
+    time_divided_tsv_path : str
+        The path to the time divided csv file.
+
+    Returns
+    -------
+    note_array : np.array
+        The note array is a numpy array of notes.
+    '''
+
+    filtered_df, time_signature = _read_filtered_tsv(time_divided_tsv_path)
     createfunction = create_data if version == "v1.0.0" else create_data_latest
     if transpose:
         transpositions = _getTranspositions(filtered_df) if version=="v1.0.0" else _getTranspositions_latest(filtered_df)
@@ -234,6 +218,59 @@ def time_divided_tsv_to_part(time_divided_tsv_path, transpose=False, version="v1
         return note_array, labels
 
 
+def time_divided_tsv_to_transposable_part(time_divided_tsv_path, version="v1.0.0"):
+    '''Given a time divided tsv file it returns the untransposed note array and labels with the tables to transpose them.
+
+    Transposition does not change the notes order nor the graph of a score, only the pitch and spelling
+    of the notes and the transposing labels (keys, spellings and pitch class sets). Instead of one copy of
+    the score per interval, the tables give the labels of every legal interval and the note spellings
+    are moved with the tables of transposition_tables.
+
+    Parameters
+    ----------
+    time_divided_tsv_path : str
+        The path to the time divided csv file.
+    version : str
+        The dataset version, "v1.0.0" or "latest".
+
+    Returns
+    -------
+    note_array : np.ndarray
+        The note array, as returned by time_divided_tsv_to_part without transposition.
+    labels : np.ndarray
+        The labels of the note array.
+    transpositions : dict
+        "intervals" flags the legal intervals of INTERVALCLASSES, "columns" are the label columns that
+        transpose, "value_ids" (one line per label) index their values in "table", which holds the class
+        index of every value under every interval.
+    '''
+    filtered_df, time_signature = _read_filtered_tsv(time_divided_tsv_path)
+    if version == "v1.0.0":
+        note_array, labels = create_data(filtered_df, time_signature)
+        intervals = ["P1"] + _getTranspositions(filtered_df)
+        representations = list(available_representations.values())
+        transposing = OutputRepresentation
+    else:
+        from .chord_representations_latest import available_representations as latest_representations
+        from .chord_representations_latest import OutputRepresentation as LatestOutputRepresentation
+        note_array, labels = create_data_latest(filtered_df, time_signature)
+        intervals = ["P1"] + _getTranspositions_latest(filtered_df)
+        representations = list(latest_representations.values())
+        transposing = LatestOutputRepresentation
+    note_array, labels = tie_consecutive_notes(note_array, labels)
+    note_array = create_divs_from_beats(note_array)
+    legal = np.isin(INTERVALCLASSES, intervals)
+    columns, value_ids, table, encodable = transposition_label_tables(
+        filtered_df, representations, legal, transposing=transposing)
+    # Keep the value ids of the labels kept by tie_consecutive_notes.
+    value_ids = value_ids[np.isin(filtered_df["j_offset"].to_numpy(), np.unique(note_array["onset_beat"]))]
+    _, spelling_table = transposition_tables()
+    spellings = np.array([NOTENAMES.index(step) for step in note_array["step"]]) * 7 + note_array["alter"] + 3
+    legal = legal & encodable & np.all(spelling_table[:, spellings] >= 0, axis=1)
+    transpositions = {"intervals": legal, "columns": columns, "value_ids": value_ids, "table": table}
+    return note_array, labels, transpositions
+
+
 """The output tonal representations learned through multitask learning.
 Classes and data structures related to tonal features."""
 
@@ -315,6 +352,87 @@ def _getTranspositions(df):
     return ret
 
 
+def transposition_tables():
+    """Semitones of every interval of INTERVALCLASSES and where it moves every note spelling.
+
+    Spellings are indexed as step * 7 + alter + 3, with the steps of NOTENAMES and alterations from -3 to 3
+    as in the spelling features, and are moved to -1 when the transposed alteration leaves that range.
+
+    Returns
+    -------
+    semitones : np.ndarray
+        The semitones of every interval.
+    spellings : np.ndarray
+        The transposed spelling index of every spelling (columns) under every interval (lines).
+    """
+    if "tables" in _transpositionTables:
+        return _transpositionTables["tables"]
+    semitones = np.array([m21IntervalStr(interval).semitones for interval in INTERVALCLASSES])
+    spellings = np.full((len(INTERVALCLASSES), len(NOTENAMES) * 7), -1, dtype=int)
+    accidentals = {alter: accidental for accidental, alter in ALTER.items()}
+    for i, interval in enumerate(INTERVALCLASSES):
+        for step_idx, step in enumerate(NOTENAMES):
+            for alter in range(-3, 4):
+                pitch = TransposePitch(f"{step}{accidentals[alter]}4", interval)
+                p = re.findall(r'[A-Za-z]+|\W+|\d+', pitch)
+                new_step, new_alter = (p[0], p[1]) if len(p) == 3 else (p[0], "")
+                if new_alter in ALTER:
+                    spellings[i, step_idx * 7 + alter + 3] = NOTENAMES.index(new_step) * 7 + ALTER[new_alter] + 3
+    _transpositionTables["tables"] = (semitones, spellings)
+    return semitones, spellings
+
+
+def transposition_label_tables(df, representations, intervals, transposing=None):
+    """Class indices of the values of the transposing labels under every interval of INTERVALCLASSES.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The filtered frames of a score.
+    representations : list
+        The output representations in label column order.
+    intervals : np.ndarray
+        Flags of the intervals of INTERVALCLASSES to encode, the table is left at 0 for the others.
+    transposing : type
+        The base class of the representations that transpose, the OutputRepresentation of the module of the
+        representations (this module by default).
+
+    Returns
+    -------
+    columns : np.ndarray
+        The label columns of the representations that transpose.
+    value_ids : np.ndarray
+        The index in the table of the value of every frame, one column per transposing representation.
+    table : np.ndarray
+        The class index of every value (columns) under every interval (lines).
+    encodable : np.ndarray
+        Whether all values could be encoded under every interval.
+    """
+    transposing = OutputRepresentation if transposing is None else transposing
+    columns = [i for i, rep in enumerate(representations) if issubclass(rep, transposing)]
+    value_ids = np.zeros((len(df.index), len(columns)), dtype=int)
+    tables = list()
+    encodable = np.ones(len(INTERVALCLASSES), dtype=bool)
+    n_values = 0
+    for c, i in enumerate(columns):
+        rep = representations[i]
+        uniques = {}
+        for frame, value in enumerate(df[rep.dfFeature]):
+            value_ids[frame, c] = n_values + uniques.setdefault(value, len(uniques))
+        n_values += len(uniques)
+        values = pd.DataFrame({rep.dfFeature: list(uniques.keys())})
+        table = np.zeros((len(INTERVALCLASSES), len(uniques)), dtype=int)
+        for k in np.flatnonzero(intervals):
+            try:
+                table[k] = rep(values).run(transposition=INTERVALCLASSES[k]).reshape(-1)
+            except ValueError:
+                # Some representations fail on values outside of their classes.
+                encodable[k] = False
+        tables.append(table)
+    table = np.hstack(tables) if tables else np.zeros((len(INTERVALCLASSES), 0), dtype=int)
+    return np.array(columns, dtype=int), value_ids, table, encodable
+
+
 class FeatureRepresentation(object):
     features = 1
 
@@ -376,15 +494,10 @@ class OutputRepresentation(FeatureRepresentation):
     transpositionFn = None
 
     def run(self, transposition="P1"):
-        array = np.zeros(self.shape, dtype=self.dtype)
-        for frame, dfFeature in enumerate(self.df[self.dfFeature]):
-            transposed = self.transpositionFn(dfFeature, transposition)
-            if transposed in self.classList:
-                rnIndex = self.classList.index(transposed)
-                array[frame] = rnIndex
-            else:
-                array[frame] = self.classesNumber() - 1
-        return array
+        codes, values = factorize(self.df[self.dfFeature])
+        classes = transposition_table(self.classList, self.transpositionFn).transpose(values, transposition)
+        classes[classes == NOT_A_CLASS] = self.classesNumber() - 1
+        return classes[codes].reshape(self.shape).astype(self.dtype)
 
     @classmethod
     def classesNumber(cls):
@@ -411,14 +524,10 @@ class OutputRepresentationTI(FeatureRepresentationTI):
     dfFeature = ""
 
     def run(self, transposition="P1"):
-        array = np.zeros(self.shape, dtype=self.dtype)
-        for frame, dfFeature in enumerate(self.df[self.dfFeature]):
-            if dfFeature in self.classList:
-                rnIndex = self.classList.index(dfFeature)
-                array[frame] = rnIndex
-            else:
-                array[frame] = self.classesNumber() - 1
-        return array
+        codes, values = factorize(self.df[self.dfFeature])
+        classes = class_indices(self.classList, values)
+        classes[classes == NOT_A_CLASS] = self.classesNumber() - 1
+        return classes[codes].reshape(self.shape).astype(self.dtype)
 
     @classmethod
     def classesNumber(cls):
@@ -450,13 +559,10 @@ class Inversion4(OutputRepresentationTI):
     dfFeature = "a_inversion"
 
     def run(self, transposition="P1"):
-        array = np.zeros(self.shape, dtype=self.dtype)
-        for frame, inversion in enumerate(self.df[self.dfFeature]):
-            if inversion > 3:
-                # Any chord beyond sevenths is encoded as "root" position
-                inversion = 0
-            array[frame] = int(inversion)
-        return array
+        inversion = self.df[self.dfFeature].to_numpy()
+        # Any chord beyond sevenths is encoded as "root" position
+        inversion = np.where(inversion > 3, 0, inversion)
+        return inversion.astype(int).reshape(self.shape).astype(self.dtype)
 
 
 class HarmonicRhythm2(OutputRepresentationTI):
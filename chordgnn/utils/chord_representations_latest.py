@@ -6,9 +6,8 @@ import numpy as np
 from music21.key import Key
 from music21.pitch import Pitch
 from music21.interval import Interval
-from .globals import ALTER
-import partitura
-import re
+from .tsv_reader import frames_to_note_array
+from .label_encoding import factorize, class_indices, transposition_table, NOT_A_CLASS
 
 
 _transposeKey = {}
@@ -2001,7 +2000,9 @@ def _getTranspositions_latest(df, transpositionKeys=TRANSPOSITIONKEYS):
 
 def encode_one_hot(df, object, transposition=None):
     '''Given a dataframe it encodes the chord column as one hot.'''
-    return object(df).run(transposition=transposition)
+    representation = object(df)
+    # The representation is already encoded untransposed when it is built.
+    return representation.array if transposition == "P1" else representation.run(transposition=transposition)
 
 
 def TransposeKey(key, interval):
@@ -2077,7 +2078,6 @@ def m21Pitch(pitch):
 
 
 def create_data_latest(filtered_df, time_signature, interval="P1"):
-    note_array = list()
     onset = np.expand_dims(filtered_df["j_offset"].to_numpy(), axis=1)
     localkey = encode_one_hot(filtered_df, LocalKey38, transposition=interval)
     tonkey = encode_one_hot(filtered_df, TonicizedKey38, transposition=interval)
@@ -2096,20 +2096,7 @@ def create_data_latest(filtered_df, time_signature, interval="P1"):
     y = np.stack(
         (localkey, tonkey, degree1, degree2, quality, inversion, root, romanNumeral, hrythm, pcset, bass, tenor, alto, soprano, onset),
         axis=1)
-    for i, row in filtered_df.iterrows():
-        pitches = eval(row["s_notes"])
-        # is_onset = eval(row["s_isOnset"])
-        for j, pitch in enumerate(pitches):
-            pitch = TransposePitch(pitch, interval)
-            p = re.findall(r'[A-Za-z]+|\W+|\d+', pitch)
-            step, alter, octave = (p[0], p[1], eval(p[2])) if len(p) == 3 else (p[0], "", eval(p[1]))
-            alter = ALTER[alter]
-            mp = partitura.utils.pitch_spelling_to_midi_pitch(step, alter, octave)
-            note_array.append((row["j_offset"], row["s_duration"], mp, int(time_signature), 4, step, alter, octave))
-    dtype = np.dtype(
-        [('onset_beat', float), ('duration_beat', float), ('pitch', int), ('ts_beats', int), ('ts_beat_type', int),
-         ("step", '<U10'), ("alter", int), ("octave", int)])
-    X = np.array(note_array, dtype)
+    X = frames_to_note_array(filtered_df, time_signature, transpose_pitch=TransposePitch, interval=interval)
     return X, y
 
 class FeatureRepresentation(object):
@@ -2174,16 +2161,13 @@ class OutputRepresentation(FeatureRepresentation):
     transpositionFn = None
 
     def run(self, transposition="P1"):
-        array = np.zeros(self.shape, dtype=self.dtype)
-        for frame, dfFeature in enumerate(self.df[self.dfFeature]):
-            transposed = self.transpositionFn(dfFeature, transposition)
-            try:
-                rnIndex = self.classList.index(transposed)
-            except ValueError:
-                print("ValueError: {} not in classList of {}".format(transposed, self.__class__.__name__))
-                raise ValueError
-            array[frame] = rnIndex
-        return array
+        codes, values = factorize(self.df[self.dfFeature])
+        classes = transposition_table(self.classList, self.transpositionFn).transpose(values, transposition)
+        if (classes[codes] == NOT_A_CLASS).any():
+            transposed = self.transpositionFn(values[codes[classes[codes] == NOT_A_CLASS][0]], transposition)
+            print("ValueError: {} not in classList of {}".format(transposed, self.__class__.__name__))
+            raise ValueError
+        return classes[codes].reshape(self.shape).astype(self.dtype)
 
     @classmethod
     def classesNumber(cls):
@@ -2209,11 +2193,11 @@ class OutputRepresentationTI(FeatureRepresentationTI):
     dfFeature = ""
 
     def run(self, transposition="P1"):
-        array = np.zeros(self.shape, dtype=self.dtype)
-        for frame, dfFeature in enumerate(self.df[self.dfFeature]):
-            rnIndex = self.classList.index(dfFeature)
-            array[frame] = rnIndex
-        return array
+        codes, values = factorize(self.df[self.dfFeature])
+        classes = class_indices(self.classList, values)
+        if (classes[codes] == NOT_A_CLASS).any():
+            raise ValueError("{} is not in list".format(values[codes[classes[codes] == NOT_A_CLASS][0]]))
+        return classes[codes].reshape(self.shape).astype(self.dtype)
 
     @classmethod
     def classesNumber(cls):
@@ -2259,13 +2243,10 @@ class Inversion4(OutputRepresentationTI):
     dfFeature = "a_inversion"
 
     def run(self, transposition="P1"):
-        array = np.zeros(self.shape, dtype=self.dtype)
-        for frame, inversion in enumerate(self.df[self.dfFeature]):
-            if inversion > 3:
-                # Any chord beyond sevenths is encoded as "root" position
-                inversion = 0
-            array[frame] = int(inversion)
-        return array
+        inversion = self.df[self.dfFeature].to_numpy()
+        # Any chord beyond sevenths is encoded as "root" position
+        inversion = np.where(inversion > 3, 0, inversion)
+        return inversion.astype(int).reshape(self.shape).astype(self.dtype)
 
 
 class HarmonicRhythm7(OutputRepresentationTI):
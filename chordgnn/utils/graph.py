@@ -2,6 +2,7 @@ import os
 import random, string
 import pickle
 from chordgnn.utils.general import exit_after
+from chordgnn.utils.interval_index import during_edges
 from chordgnn.descriptors.general import *
 import torch
 from numpy.lib import recfunctions as rfn
@@ -138,7 +139,7 @@ def check_note_array(na):
         raise (TypeError("The given Note array is missing necessary fields."))
 
 
-def graph_from_note_array(note_array, rest_array=None, norm2bar=True):
+def graph_from_note_array(note_array, rest_array=None, norm2bar=True, legacy_during=False):
     """Turn note_array to homogeneous graph dictionary.
 
     Parameters
@@ -147,11 +148,17 @@ def graph_from_note_array(note_array, rest_array=None, norm2bar=True):
         The partitura note_array object. Every entry has 5 attributes, i.e. onset_time, note duration, note velocity, voice, id.
     rest_array : structured array
         A structured rest array similar to the note array but for rests.
+    legacy_during : bool
+        Find during edges by scanning all notes instead of querying the onset interval index.
     """
 
     edg_src = list()
     edg_dst = list()
     start_rest_index = len(note_array)
+    during_src, during_dst = during_edges(
+        note_array["onset_beat"], note_array["duration_beat"], legacy=legacy_during
+    )
+    during_ptr = np.searchsorted(during_src, np.arange(len(note_array) + 1))
     for i, x in enumerate(note_array):
         for j in np.where(
             (
@@ -190,10 +197,7 @@ def graph_from_note_array(note_array, rest_array=None, norm2bar=True):
                 edg_src.append(i)
                 edg_dst.append(j + start_rest_index)
 
-        for j in np.where(
-            (x["onset_beat"] < note_array["onset_beat"])
-            & (x["onset_beat"] + x["duration_beat"] > note_array["onset_beat"])
-        )[0]:
+        for j in during_dst[during_ptr[i] : during_ptr[i + 1]]:
             edg_src.append(i)
             edg_dst.append(j)
 
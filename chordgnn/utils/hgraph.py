@@ -2,6 +2,7 @@ import os
 import random, string
 import pickle
 from chordgnn.utils.general import exit_after
+from chordgnn.utils.interval_index import during_edges
 from chordgnn.descriptors.general import *
 import torch
 from scipy.sparse import csr_matrix
@@ -9,6 +10,64 @@ from scipy.sparse.csgraph import connected_components
 from numpy.lib import recfunctions as rfn
 
 
+class RelationCSR(object):
+    """The edges of a graph grouped by the node that aggregates them and by relation, in CSR layout.
+
+    Messages go from edge_index[1] to edge_index[0], so row node * num_relations + relation holds
+    the neighbors that node aggregates over the edges of that relation.
+
+    Parameters
+    ----------
+    rowptr : torch.LongTensor
+        The first edge of every row, of size num_nodes * num_relations + 1.
+    row : torch.LongTensor
+        The row of every edge, sorted.
+    col : torch.LongTensor
+        The neighbor of every edge.
+    num_nodes : int
+        The number of nodes.
+    num_relations : int
+        The number of relations.
+    """
+    def __init__(self, rowptr, row, col, num_nodes, num_relations):
+        self.rowptr = rowptr
+        self.row = row
+        self.col = col
+        self.num_nodes = num_nodes
+        self.num_relations = num_relations
+
+    @property
+    def node(self):
+        """The node that aggregates every edge."""
+        return torch.div(self.row, self.num_relations, rounding_mode="floor")
+
+    @property
+    def relation(self):
+        """The relation of every edge."""
+        return self.row % self.num_relations
+
+    @property
+    def degree(self):
+        """The number of neighbors of every node in every relation, of shape [num_nodes, num_relations]."""
+        return (self.rowptr[1:] - self.rowptr[:-1]).view(self.num_nodes, self.num_relations)
+
+    def to(self, device):
+        return RelationCSR(
+            self.rowptr.to(device), self.row.to(device), self.col.to(device), self.num_nodes, self.num_relations)
+
+
+def relation_csr(edge_index, edge_type, num_nodes, num_relations=None):
+    """Build the RelationCSR of typed edges, edge types outside of [0, num_relations) are dropped."""
+    if num_relations is None:
+        num_relations = int(edge_type.max()) + 1 if edge_type.numel() else 1
+    keep = (edge_type >= 0) & (edge_type < num_relations)
+    row = edge_index[0, keep] * num_relations + edge_type[keep]
+    row, perm = torch.sort(row, stable=True)
+    counts = torch.bincount(row, minlength=num_nodes * num_relations)
+    rowptr = torch.cat((counts.new_zeros(1), counts.cumsum(0)))
+    return RelationCSR(rowptr, row, edge_index[1, keep][perm], num_nodes, num_relations)
+
+
 class HeteroScoreGraph(object):
     def __init__(self, note_features, edges, etypes=["onset", "consecutive", "during", "rest"], name=None, note_array=None, edge_weights=None, labels=None):
         self.node_features = note_features.dtype.names if note_features.dtype.names else []
@@ -201,7 +260,7 @@ def check_note_array(na):
 #     nodes = np.hstack((note_array, rest_array))
 #     return nodes, edges
 
-def hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, pot_edge_dist=0):
+def hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, pot_edge_dist=0, legacy_during=False):
     '''Turn note_array to homogeneous graph dictionary.
 
     Parameters
@@ -210,6 +269,8 @@ def hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, po
         The partitura note_array object. Every entry has 5 attributes, i.e. onset_time, note duration, note velocity, voice, id.
     rest_array : structured array
         A structured rest array similar to the note array but for rests.
+    legacy_during : bool
+        Find during edges by scanning all notes instead of querying the onset interval index.
     '''
 
     edg_src = list()
@@ -217,6 +278,8 @@ def hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, po
     etype = list()
     pot_edges = list()
     start_rest_index = len(note_array)
+    during_src, during_dst = during_edges(note_array["onset_div"], note_array["duration_div"], legacy=legacy_during)
+    during_ptr = np.searchsorted(during_src, np.arange(len(note_array) + 1))
     for i, x in enumerate(note_array):
         for j in np.where(np.isclose(note_array["onset_div"], x["onset_div"], rtol=1e-04, atol=1e-04) == True)[0]:
             if i != j:
@@ -240,8 +303,7 @@ def hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, po
                 edg_dst.append(j + start_rest_index)
                 etype.append(1)
 
-        for j in np.where(
-                (x["onset_div"] < note_array["onset_div"]) & (x["onset_div"] + x["duration_div"] > note_array["onset_div"]))[0]:
+        for j in during_dst[during_ptr[i]:during_ptr[i+1]]:
             edg_src.append(i)
             edg_dst.append(j)
             etype.append(2)
@@ -288,6 +350,138 @@ def hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, po
     return nodes, edges
 
 
+def _expand_ranges(starts, counts):
+    """Concatenate the index ranges [starts[i], starts[i] + counts[i]) into one flat array."""
+    total = counts.sum()
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(total) - offsets
+
+
+def _close_matches(sorted_values, order, targets, src):
+    """Pairs (src, j) with np.isclose(values[j], target, rtol=1e-04, atol=1e-04), j in ascending order per src.
+
+    The tolerance of np.isclose grows with the magnitude of the target, so the candidates are taken
+    from a slightly wider window of the sorted values and then filtered with the exact same test.
+    """
+    targets = np.asarray(targets)
+    slack = 2 * (1e-04 + 1e-04 * np.abs(targets.astype(float)))
+    lo = np.searchsorted(sorted_values, targets - slack, side="left")
+    hi = np.searchsorted(sorted_values, targets + slack, side="right")
+    counts = hi - lo
+    pos = _expand_ranges(lo, counts)
+    rep = np.repeat(np.arange(len(targets)), counts)
+    dst = order[pos]
+    keep = np.isclose(sorted_values[pos], targets[rep], rtol=1e-04, atol=1e-04)
+    return src[rep][keep], dst[keep]
+
+
+def fast_hetero_graph_from_note_array(note_array, rest_array=None, norm2bar=False, pot_edge_dist=0, legacy_during=False):
+    '''Sort-and-sweep version of hetero_graph_from_note_array.
+
+    The note array is sorted once by onset_div and every edge type is emitted in bulk with
+    searchsorted range queries, so the cost is O(N log N + E) instead of O(N^2).
+    The returned nodes and edges (including the edge order) are identical to hetero_graph_from_note_array.
+
+    Parameters
+    ----------
+    note_array : structured array
+        The partitura note_array object. Every entry has 5 attributes, i.e. onset_time, note duration, note velocity, voice, id.
+    rest_array : structured array
+        A structured rest array similar to the note array but for rests.
+    legacy_during : bool
+        Find during edges by scanning all notes instead of querying the onset interval index.
+    '''
+    n = len(note_array)
+    index = np.arange(n)
+    has_rests = isinstance(rest_array, np.ndarray) and rest_array.size > 0
+    onset = note_array["onset_div"]
+    end = note_array["onset_div"] + note_array["duration_div"]
+    order = np.argsort(onset, kind="stable")
+    sorted_onset = onset[order]
+
+    # Edges leaving a note are grouped per source note in the order:
+    # onset (0), consecutive (1), consecutive to rests (1), during (2).
+    src, dst, block = [], [], []
+    # Onset edges
+    s, d = _close_matches(sorted_onset, order, onset, index)
+    mask = s != d
+    src.append(s[mask]), dst.append(d[mask]), block.append(np.full(mask.sum(), 0))
+    # Consecutive edges
+    s, d = _close_matches(sorted_onset, order, end, index)
+    src.append(s), dst.append(d), block.append(np.full(len(s), 1))
+    if has_rests:
+        rest_order = np.argsort(rest_array["onset_div"], kind="stable")
+        s, d = _close_matches(rest_array["onset_div"][rest_order], rest_order, end, index)
+        src.append(s), dst.append(d + n), block.append(np.full(len(s), 2))
+    # During edges
+    s, d = during_edges(onset, note_array["duration_div"], legacy=legacy_during)
+    src.append(s), dst.append(d), block.append(np.full(len(s), 3))
+
+    src, dst, block = np.concatenate(src), np.concatenate(dst), np.concatenate(block)
+    perm = np.lexsort((dst, block, src))
+    etype = np.array([0, 1, 1, 2])[block[perm]]
+    edges = [np.vstack((src[perm], dst[perm], etype))]
+
+    if has_rests:
+        rest_end = rest_array["onset_div"] + rest_array["duration_div"]
+        s, d = _close_matches(sorted_onset, order, rest_end, np.arange(len(rest_array)) + n)
+        perm = np.lexsort((d, s))
+        edges.append(np.vstack((s[perm], d[perm], np.ones(len(s), dtype=int))))
+
+        feature_fn = [dname for dname in note_array.dtype.names if dname not in rest_array.dtype.names]
+        if feature_fn:
+            rest_feature_zeros = np.zeros((len(rest_array), len(feature_fn)))
+            rest_feature_zeros = rfn.unstructured_to_structured(rest_feature_zeros, dtype=list(map(lambda x: (x, '<4f'), feature_fn)))
+            rest_array = rfn.merge_arrays((rest_array, rest_feature_zeros))
+    else:
+        # Rest edges connect notes ending where no note starts to the notes of the next onset.
+        unique_ends = np.unique(end)[:-1]
+        unique_ends = unique_ends[~np.isin(unique_ends, onset)]
+        unique_onsets = np.unique(onset)
+        end_order = np.lexsort((index, end))
+        sorted_end = end[end_order]
+        src_lo = np.searchsorted(sorted_end, unique_ends, side="left")
+        src_counts = np.searchsorted(sorted_end, unique_ends, side="right") - src_lo
+        next_idx = np.searchsorted(unique_onsets, unique_ends, side="right")
+        has_next = next_idx < len(unique_onsets)
+        next_onset = unique_onsets[np.minimum(next_idx, len(unique_onsets) - 1)]
+        dst_lo = np.searchsorted(sorted_onset, next_onset, side="left")
+        dst_counts = np.searchsorted(sorted_onset, next_onset, side="right") - dst_lo
+        # Without a later onset every note is a target (all differences are +inf).
+        dst_lo = np.where(has_next, dst_lo, n)
+        dst_counts = np.where(has_next, dst_counts, n)
+        lookup = np.concatenate((order, index))
+        s = end_order[_expand_ranges(src_lo, src_counts)]
+        per_src = np.repeat(dst_counts, src_counts)
+        d = lookup[_expand_ranges(np.repeat(dst_lo, src_counts), per_src)]
+        edges.append(np.vstack((np.repeat(s, per_src), d, np.full(len(d), 3))))
+
+    edges = np.hstack(edges)
+
+    # Resize Onset Beat to bar
+    if norm2bar:
+        note_array["onset_beat"] = np.mod(note_array["onset_beat"], note_array["ts_beats"])
+        if isinstance(rest_array, np.ndarray) and rest_array.size > 0:
+            rest_array["onset_beat"] = np.mod(rest_array["onset_beat"], rest_array["ts_beats"])
+
+    nodes = np.hstack((note_array, rest_array))
+    if pot_edge_dist:
+        bound = note_array["onset_beat"] + note_array["duration_beat"] + pot_edge_dist * note_array["ts_beats"]
+        lo = np.searchsorted(sorted_onset, end, side="right")
+        # When onset_beat follows onset_div the beat bound is a prefix of the sorted order.
+        sorted_beat = note_array["onset_beat"][order]
+        hi = np.searchsorted(sorted_beat, bound, side="right") if np.all(np.diff(sorted_beat) >= 0) else np.full(n, n)
+        counts = np.maximum(hi - lo, 0)
+        s = np.repeat(index, counts)
+        d = order[_expand_ranges(lo, counts)]
+        keep = note_array["onset_beat"][d] <= bound[s]
+        s, d = s[keep], d[keep]
+        perm = np.lexsort((d, s))
+        pot_edges = np.hstack((np.vstack((s[perm], d[perm])), edges[:, edges[2] == 1][:2]))
+        return nodes, edges, pot_edges
+    return nodes, edges
+
+
 @exit_after(120)
 def hetero_graph_from_part(x : Union[Union[partitura.score.Part, partitura.score.PartGroup], np.ndarray], features=None, name=None, norm2bar=True, include_rests=False, labels=None) -> HeteroScoreGraph:
     if isinstance(x, partitura.score.Score) or isinstance(x, partitura.score.Part) or isinstance(x, partitura.score.PartGroup) or isinstance(x, list):
@@ -314,7 +508,7 @@ def hetero_graph_from_part(x : Union[Union[partitura.score.Part, partitura.score
         rest_array = None
         if labels is None:
             labels = rfn.structured_to_unstructured(note_array[["voice", "staff"]])
-    nodes, edges = hetero_graph_from_note_array(note_array, rest_array, norm2bar=norm2bar)
+    nodes, edges = fast_hetero_graph_from_note_array(note_array, rest_array, norm2bar=norm2bar)
     return HeteroScoreGraph(note_features, edges, name=name, labels=labels, note_array=note_array)
 
 
@@ -375,17 +569,76 @@ def add_reverse_edges(graph, mode):
     return graph
 
 
+def crop_edges(edge_index, edge_type, start, end, edge_ptr=None):
+    """The edges between the nodes start to end - 1, with the nodes renumbered from zero.
+
+    If the edges are sorted by source and edge_ptr holds the offsets of the edges of every node
+    (num_nodes + 1 entries), only the edges of the cropped sources are read.
+    """
+    if edge_ptr is not None:
+        e_start, e_end = int(edge_ptr[start]), int(edge_ptr[end])
+        edge_index, edge_type = edge_index[:, e_start:e_end], edge_type[e_start:e_end]
+        edge_indices = (edge_index[1] >= start) & (edge_index[1] < end)
+    else:
+        edge_indices = (edge_index[0] >= start) & (edge_index[0] < end) & (edge_index[1] >= start) & (edge_index[1] < end)
+    return edge_index[:, edge_indices] - start, edge_type[edge_indices]
+
+
+def batch_graphs(x, edge_index, edge_type, onset_div, lengths):
+    """Batch score graphs into their disjoint union, sorted by decreasing length for sequence packing.
+
+    Parameters
+    ----------
+    x, edge_index, edge_type, onset_div : list of torch.Tensor
+        The node features, edges, edge types and onset divisions of every graph.
+    lengths : list of int
+        The number of unique onsets of every graph.
+
+    Returns
+    -------
+    x, edge_index, edge_type, onset_div : torch.Tensor
+        The batched graph, node indices and onset divisions are shifted so that graphs do not overlap.
+    lengths : torch.LongTensor
+        The lengths in decreasing order.
+    perm_idx : list of int
+        The graph at every position of the batch.
+    """
+    lengths = torch.tensor(lengths).long()
+    lengths, perm_idx = lengths.sort(descending=True)
+    perm_idx = perm_idx.tolist()
+    max_idx = np.cumsum(np.array([0] + [x[i].shape[0] for i in perm_idx]))
+    max_onset_div = np.cumsum(np.array([0] + [onset_div[i].max().item() + 1 for i in perm_idx]))
+    batch_x = torch.cat([x[i] for i in perm_idx], dim=0).float()
+    batch_edge_index = torch.cat([edge_index[pi]+max_idx[i] for i, pi in enumerate(perm_idx)], dim=1).long()
+    batch_edge_type = torch.cat([edge_type[i] for i in perm_idx], dim=0).long()
+    batch_onset_div = torch.cat([onset_div[pi]+max_onset_div[i] for i, pi in enumerate(perm_idx)], dim=0).long()
+    return batch_x, batch_edge_index, batch_edge_type, batch_onset_div, lengths, perm_idx
+
+
 def add_reverse_edges_from_edge_index(edge_index, edge_type, mode="new_type"):
+    """Add the reverse of the typed edges.
+
+    The reversed edges are tracked as the original edge they come from and whether it is flipped, and the
+    edges are gathered once at the end.
+    """
+    edge_ids = torch.arange(edge_type.shape[0], device=edge_type.device)
+    flipped = torch.zeros(edge_type.shape[0], dtype=torch.bool, device=edge_type.device)
     if mode == "new_type":
         unique_edge_types = torch.unique(edge_type)
         for type in unique_edge_types:
             if type == 0:
                 continue
-            edge_index = torch.cat((edge_index, edge_index[:, edge_type == type].flip(0)), dim=1)
-            edge_type = torch.cat((edge_type, torch.max(edge_type) + torch.zeros(edge_index.shape[1] - edge_type.shape[0], dtype=torch.long).to(edge_type.device)), dim=0)
+            mask = edge_type == type
+            edge_ids = torch.cat((edge_ids, edge_ids[mask]))
+            flipped = torch.cat((flipped, ~flipped[mask]))
+            edge_type = torch.cat((edge_type, torch.max(edge_type) + torch.zeros(int(mask.sum()), dtype=torch.long).to(edge_type.device)), dim=0)
     else:
-        edge_index = torch.cat((edge_index, edge_index.flip(0)), dim=1)
+        edge_ids = torch.cat((edge_ids, edge_ids))
+        flipped = torch.cat((flipped, ~flipped))
         edge_type = torch.cat((edge_type, edge_type), dim=0)
+    src = torch.where(flipped, edge_index[1, edge_ids], edge_index[0, edge_ids])
+    dst = torch.where(flipped, edge_index[0, edge_ids], edge_index[1, edge_ids])
+    edge_index = torch.stack((src, dst))
     return edge_index, edge_type
 
 
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class OnsetIntervalIndex(object):
+    """Sorted index over note onsets for span queries.
+
+    Answers "which onsets fall strictly inside the span (start, end)" with two binary searches,
+    i.e. in O(log N + k) for k matching notes, independently of how long the queried note is held.
+
+    Parameters
+    ----------
+    onsets : np.ndarray
+        The onsets of the notes (e.g. note_array["onset_div"] or note_array["onset_beat"]).
+    """
+    def __init__(self, onsets):
+        self.onsets = np.asarray(onsets)
+        self.order = np.argsort(self.onsets, kind="stable")
+        self.sorted_onsets = self.onsets[self.order]
+
+    def __len__(self):
+        return len(self.onsets)
+
+    def query(self, start, end):
+        """Indices of the notes with start < onset < end in ascending order."""
+        lo = np.searchsorted(self.sorted_onsets, start, side="right")
+        hi = np.searchsorted(self.sorted_onsets, end, side="left")
+        return np.sort(self.order[lo:max(lo, hi)])
+
+    def query_all(self, starts, ends):
+        """Bulk version of query for many spans.
+
+        Returns
+        -------
+        span : np.ndarray
+            The position of the queried span for every match, in ascending order.
+        idx : np.ndarray
+            The matching note indices, ascending within every span.
+        """
+        lo = np.searchsorted(self.sorted_onsets, starts, side="right")
+        hi = np.searchsorted(self.sorted_onsets, ends, side="left")
+        counts = np.maximum(hi - lo, 0)
+        offsets = np.repeat(np.cumsum(counts) - counts, counts)
+        span = np.repeat(np.arange(len(counts)), counts)
+        idx = self.order[np.repeat(lo, counts) + np.arange(counts.sum()) - offsets]
+        perm = np.lexsort((idx, span))
+        return span[perm], idx[perm]
+
+
+def during_edges(onsets, durations, legacy=False):
+    """Edges (i, j) for every note j that starts while note i is sounding.
+
+    Parameters
+    ----------
+    onsets : np.ndarray
+        The note onsets.
+    durations : np.ndarray
+        The note durations, in the same unit as the onsets.
+    legacy : bool
+        Use the original quadratic scan over all notes (kept for parity testing).
+
+    Returns
+    -------
+    src, dst : np.ndarray
+        Edge sources and destinations, sorted by source and then destination.
+    """
+    onsets = np.asarray(onsets)
+    ends = onsets + np.asarray(durations)
+    if legacy:
+        src, dst = list(), list()
+        for i in range(len(onsets)):
+            for j in np.where((onsets[i] < onsets) & (ends[i] > onsets))[0]:
+                src.append(i)
+                dst.append(j)
+        return np.array(src, dtype=int), np.array(dst, dtype=int)
+    return OnsetIntervalIndex(onsets).query_all(onsets, ends)
@@ -0,0 +1,93 @@
+"""
+Column-wise encoding of the output representations.
+
+A label column has few distinct values, so every value is encoded once and the column is read back through
+its codes. The transposition of a class by an interval does not depend on the score, so it is kept for the
+lifetime of the process in a (interval x class) table shared by the representations with the same classes.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Table entries of transpositions that fall outside of the class list, and of the ones not computed yet.
+NOT_A_CLASS = -1
+UNKNOWN = -2
+
+_tables = {}
+
+
+def factorize(column):
+    """Codes and unique values of a DataFrame column, missing values are kept as a value of their own."""
+    codes, uniques = pd.factorize(column)
+    uniques = list(uniques)
+    if (codes < 0).any():
+        codes = codes.copy()
+        codes[codes < 0] = len(uniques)
+        uniques.append(np.nan)
+    return codes, uniques
+
+
+def class_indices(classList, values):
+    """The class index of every value, NOT_A_CLASS for the values that are not in the class list."""
+    index = _class_index(classList)
+    return np.array([index.get(value, NOT_A_CLASS) for value in values], dtype=int)
+
+
+def _class_index(classList):
+    key = ("index", id(classList))
+    if key not in _tables:
+        index = dict()
+        for i, c in enumerate(classList):
+            # Keep the first position, as list.index does.
+            index.setdefault(c, i)
+        _tables[key] = (classList, index)
+    return _tables[key][1]
+
+
+class TranspositionTable(object):
+    """The class index of the transposition of every class by every interval.
+
+    Entries are computed with the transposition function the first time they are needed.
+
+    Parameters
+    ----------
+    classList : list
+        The classes of the representation.
+    transpositionFn : callable
+        The transposition of a class by an interval string (e.g., 'm3').
+    """
+    def __init__(self, classList, transpositionFn):
+        self.classList = classList
+        self.transpositionFn = transpositionFn
+        self.rows = dict()
+        self.table = np.zeros((0, len(classList)), dtype=int)
+
+    def transpose(self, values, interval):
+        """The class index of the transposition of every value by the interval, NOT_A_CLASS outside of the classes."""
+        row = self._row(interval)
+        classes = class_indices(self.classList, values)
+        known = classes >= 0
+        missing = np.unique(classes[known][self.table[row, classes[known]] == UNKNOWN])
+        if len(missing):
+            self.table[row, missing] = class_indices(
+                self.classList, [self.transpositionFn(self.classList[c], interval) for c in missing])
+        out = np.full(len(values), NOT_A_CLASS, dtype=int)
+        out[known] = self.table[row, classes[known]]
+        # Values outside of the classes are rare, they are transposed one by one.
+        for i in np.flatnonzero(~known):
+            out[i] = class_indices(self.classList, [self.transpositionFn(values[i], interval)])[0]
+        return out
+
+    def _row(self, interval):
+        if interval not in self.rows:
+            self.rows[interval] = len(self.rows)
+            self.table = np.vstack((self.table, np.full((1, len(self.classList)), UNKNOWN, dtype=int)))
+        return self.rows[interval]
+
+
+def transposition_table(classList, transpositionFn):
+    """The per-process TranspositionTable of a class list and transposition function."""
+    key = (id(classList), transpositionFn)
+    if key not in _tables:
+        _tables[key] = TranspositionTable(classList, transpositionFn)
+    return _tables[key]
@@ -0,0 +1,104 @@
+"""
+Lookup tables over all 4096 pitch class sets.
+
+A pitch class set is encoded as a 12-bit mask where bit pc is set when the pitch class pc is in the set,
+so every per-set quantity can be computed once and read back by indexing with the mask.
+"""
+from itertools import combinations
+import numpy as np
+
+
+CHORDS = {
+    "M/m": [0, 0, 1, 1, 1, 0],
+    "sus4": [0, 1, 0, 0, 2, 0],
+    "M7": [0, 1, 2, 1, 1, 1],
+    "M7wo5": [0, 1, 0, 1, 0, 1],
+    "Mmaj7": [1, 0, 1, 2, 2, 0],
+    "Mmaj7maj9": [1, 2, 2, 2, 3, 0],
+    "M9": [1, 1, 4, 1, 1, 2],
+    "M9wo5": [1, 1, 2, 1, 0, 1],
+    "m7": [0, 1, 2, 1, 2, 0],
+    "m7wo5": [0, 1, 1, 0, 1, 0],
+    "m9": [1, 2, 2, 2, 3, 0],
+    "m9wo5": [1, 2, 1, 1, 1, 0],
+    "m9wo7": [1, 1, 1, 1, 2, 0],
+    "mmaj7": [1, 0, 1, 3, 1, 0],
+    "Maug": [0, 0, 0, 3, 0, 0],
+    "Maug7": [1, 0, 1, 3, 1, 0],
+    "mdim": [0, 0, 2, 0, 0, 1],
+    "mdim7": [0, 0, 4, 0, 0, 2]
+}
+
+MAJ_TRIADS = [[0, 4, 7], [0, 5, 9], [0, 3, 8]]
+MIN_TRIADS = [[0, 3, 7], [0, 5, 8], [0, 4, 9]]
+
+N_PC_SETS = 1 << 12
+
+
+def pc_mask(midi_pitches):
+    """The 12-bit pitch class mask of a collection of midi pitches."""
+    mask = 0
+    for mp in midi_pitches:
+        mask |= 1 << (int(mp) % 12)
+    return mask
+
+
+def mask_to_pcs(mask):
+    """The sorted pitch classes of a 12-bit mask."""
+    return [pc for pc in range(12) if (mask >> pc) & 1]
+
+
+def _interval_vector(pcs):
+    """Interval vector of a list of distinct pitch classes."""
+    interval_vector = [0, 0, 0, 0, 0, 0]
+    for p1, p2 in combinations(pcs, 2):
+        interval = abs(p1 - p2)
+        interval_vector[(interval if interval <= 6 else 12 - interval) - 1] += 1
+    return interval_vector
+
+
+def _normal_form(pcs):
+    """Normal form of a sorted list of distinct pitch classes and the transposition that produces it.
+
+    The rotation whose intervals from the first pitch class are smallest, compared from the last
+    position backwards, wins; ties keep the earliest rotation.
+    """
+    current_best = [k - pcs[0] for k in pcs]
+    challenger = current_best[:]
+    transposition = -pcs[0] % 12
+    for i in range(1, len(pcs)):
+        challenger = challenger[1:] + [challenger[0] + 12]
+        challenger = [k - challenger[0] for k in challenger]
+        for j in reversed(range(len(pcs))):
+            if challenger[j] < current_best[j]:
+                current_best = challenger
+                transposition = -pcs[i] % 12
+            elif challenger[j] > current_best[j]:
+                break
+    return current_best, transposition
+
+
+def _build_tables():
+    interval_vectors = np.zeros((N_PC_SETS, 6), dtype=int)
+    recentered = np.zeros(N_PC_SETS, dtype=int)
+    normal_forms = [()] * N_PC_SETS
+    normal_form_transpositions = np.zeros(N_PC_SETS, dtype=int)
+    for mask in range(1, N_PC_SETS):
+        pcs = mask_to_pcs(mask)
+        interval_vectors[mask] = _interval_vector(pcs)
+        recentered[mask] = mask >> pcs[0]
+        normal_form, transposition = _normal_form(pcs)
+        normal_forms[mask] = tuple(normal_form)
+        normal_form_transpositions[mask] = transposition
+    chord_matches = np.all(interval_vectors[:, None, :] == np.array(list(CHORDS.values()))[None], axis=-1)
+    is_maj_triad = chord_matches[:, 0] & np.isin(recentered, [pc_mask(t) for t in MAJ_TRIADS])
+    is_min_triad = chord_matches[:, 0] & np.isin(recentered, [pc_mask(t) for t in MIN_TRIADS])
+    return interval_vectors, chord_matches, is_maj_triad, is_min_triad, recentered, normal_forms, normal_form_transpositions
+
+
+# INTERVAL_VECTORS[mask] : interval vector of the set.
+# CHORD_MATCHES[mask] : whether the interval vector matches each of the CHORDS templates, in CHORDS order.
+# IS_MAJ_TRIAD[mask], IS_MIN_TRIAD[mask] : major/minor triad (or inversion) flags.
+# RECENTERED[mask] : the set transposed so that its lowest pitch class is 0, as a mask.
+# NORMAL_FORMS[mask], NORMAL_FORM_TRANSPOSITIONS[mask] : normal form of the set and the transposition to it.
+INTERVAL_VECTORS, CHORD_MATCHES, IS_MAJ_TRIAD, IS_MIN_TRIAD, RECENTERED, NORMAL_FORMS, NORMAL_FORM_TRANSPOSITIONS = _build_tables()
@@ -0,0 +1,132 @@
+"""
+Typed reader of the time divided tsv files of the AugmentedNet dataset.
+
+List valued columns hold the same few literals over and over (e.g. "['C4', 'E4', 'G4']"), so every
+column is factorized and only its distinct literals are parsed. Pitch spellings are parsed once per
+process and the notes of a score are built with array operations instead of a loop over its frames.
+"""
+import ast
+import re
+import numpy as np
+import pandas as pd
+import partitura
+from .globals import ALTER
+
+
+NOTE_ARRAY_DTYPE = np.dtype(
+    [('onset_beat', float), ('duration_beat', float), ('pitch', int), ('ts_beats', int), ('ts_beat_type', int),
+     ("step", '<U10'), ("alter", int), ("octave", int)])
+
+_INT = re.compile(r"[-+]?\d+$")
+_FLOAT = re.compile(r"[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+
+_pitchSpelling = {}
+
+
+def parse_literal(text):
+    """Parse a flat list or tuple literal of strings, numbers and booleans, as ast.literal_eval does.
+
+    Anything else (nested containers, escaped quotes, ...) is handed to ast.literal_eval.
+    """
+    text = text.strip()
+    if len(text) < 2 or text[0] + text[-1] not in ("[]", "()"):
+        return ast.literal_eval(text)
+    items = [item.strip() for item in text[1:-1].split(",")]
+    if items[-1] == "":
+        # Empty containers and the trailing comma of one element tuples.
+        items.pop()
+    values = list()
+    for item in items:
+        if len(item) >= 2 and item[0] == item[-1] and item[0] in "'\"" and item[0] not in item[1:-1] and "\\" not in item:
+            values.append(item[1:-1])
+        elif item == "True" or item == "False":
+            values.append(item == "True")
+        elif _INT.match(item):
+            values.append(int(item))
+        elif _FLOAT.match(item):
+            values.append(float(item))
+        else:
+            return ast.literal_eval(text)
+    return values if text[0] == "[" else tuple(values)
+
+
+def parse_literal_column(column):
+    """Parse every literal of a column, each distinct literal is parsed once.
+
+    Empty cells raise a ValueError, as they cannot be parsed.
+    """
+    codes, uniques = pd.factorize(column)
+    if (codes == -1).any():
+        raise ValueError("Empty literal in column {} at row {}".format(column.name, column.index[codes == -1][0]))
+    parsed = [parse_literal(text) for text in uniques]
+    return pd.Series([parsed[code] for code in codes], index=column.index, dtype=object)
+
+
+def pitch_spelling(pitch):
+    """The step, alteration, octave and midi pitch of a pitch string (e.g., 'C#4'), cached."""
+    if pitch in _pitchSpelling:
+        return _pitchSpelling[pitch]
+    p = re.findall(r'[A-Za-z]+|\W+|\d+', pitch)
+    step, alter, octave = (p[0], p[1], int(p[2])) if len(p) == 3 else (p[0], "", int(p[1]))
+    alter = ALTER[alter]
+    spelling = (step, alter, octave, partitura.utils.pitch_spelling_to_midi_pitch(step, alter, octave))
+    _pitchSpelling[pitch] = spelling
+    return spelling
+
+
+def read_time_divided_tsv(time_divided_tsv_path):
+    """Read a time divided tsv file with its list valued columns parsed.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        The frames of the file, s_notes and s_isOnset hold lists.
+    has_onsets : np.ndarray
+        Whether any note starts at every frame.
+    num_notes : np.ndarray
+        The number of notes sounding at every frame.
+    """
+    df = pd.read_csv(time_divided_tsv_path, sep='\t', header=0)
+    df["s_notes"] = parse_literal_column(df["s_notes"])
+    df["s_isOnset"] = parse_literal_column(df["s_isOnset"])
+    has_onsets = np.fromiter((any(onsets) for onsets in df["s_isOnset"]), dtype=bool, count=len(df))
+    num_notes = np.fromiter((len(onsets) for onsets in df["s_isOnset"]), dtype=int, count=len(df))
+    return df, has_onsets, num_notes
+
+
+def frames_to_note_array(df, time_signature, transpose_pitch=None, interval="P1"):
+    """The notes of the frames of a time divided tsv file, in frame order.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The frames, as read by read_time_divided_tsv.
+    time_signature : int
+        The number of beats of the time signature.
+    transpose_pitch : callable
+        The transposition of a pitch string by an interval string, only called on the distinct pitches.
+    interval : str
+        The interval to transpose by.
+
+    Returns
+    -------
+    note_array : np.ndarray
+        The note array with NOTE_ARRAY_DTYPE fields.
+    """
+    notes = df["s_notes"].tolist()
+    n_notes = np.fromiter((len(pitches) for pitches in notes), dtype=int, count=len(notes))
+    codes, pitches = pd.factorize(pd.Series([pitch for frame in notes for pitch in frame], dtype=object))
+    if transpose_pitch is not None:
+        pitches = [transpose_pitch(pitch, interval) for pitch in pitches]
+    spellings = [pitch_spelling(pitch) for pitch in pitches]
+    note_array = np.zeros(len(codes), dtype=NOTE_ARRAY_DTYPE)
+    note_array["onset_beat"] = np.repeat(df["j_offset"].to_numpy(), n_notes)
+    note_array["duration_beat"] = np.repeat(df["s_duration"].to_numpy(), n_notes)
+    note_array["ts_beats"] = int(time_signature)
+    note_array["ts_beat_type"] = 4
+    if len(codes):
+        note_array["step"] = np.array([spelling[0] for spelling in spellings])[codes]
+        note_array["alter"] = np.array([spelling[1] for spelling in spellings])[codes]
+        note_array["octave"] = np.array([spelling[2] for spelling in spellings])[codes]
+        note_array["pitch"] = np.array([spelling[3] for spelling in spellings])[codes]
+    return note_array
@@ -0,0 +1,28 @@
+import os
+import argparse
+import partitura as pt
+from analyse_score import load_models
+from chordgnn.models.export import example_inputs, export_torchscript, export_onnx
+
+
+parser = argparse.ArgumentParser("Export the chord prediction model")
+parser.add_argument("--use_ckpt", type=str, default="melkisedeath/chord_rec/model-kvd0jic5:v0",
+                    help="Wandb artifact to export")
+parser.add_argument("--score_path", type=str, default="./artifacts/op20n3-04.musicxml",
+                    help="Example score to trace the model with")
+parser.add_argument("--out_dir", type=str, default="./artifacts/export")
+parser.add_argument("--format", type=str, default="all", choices=["all", "torchscript", "onnx"])
+parser.add_argument("--quantize", action="store_true",
+                    help="Export the int8 dynamically quantized model, TorchScript only")
+args = parser.parse_args()
+
+os.makedirs(args.out_dir, exist_ok=True)
+encoder, model = load_models(args.use_ckpt, quantize=args.quantize)
+inputs = example_inputs(pt.load_score(args.score_path))
+if args.quantize:
+    # The dynamically quantized operators are not exported to ONNX.
+    print("Saved", export_torchscript(encoder, model, inputs, os.path.join(args.out_dir, "chordgnn-int8.pt")))
+elif args.format in ("all", "torchscript"):
+    print("Saved", export_torchscript(encoder, model, inputs, os.path.join(args.out_dir, "chordgnn.pt")))
+if args.format in ("all", "onnx") and not args.quantize:
+    print("Saved", export_onnx(encoder, model, inputs, os.path.join(args.out_dir, "chordgnn.onnx")))
@@ -0,0 +1,48 @@
+import os
+import random
+import sys
+import pandas as pd
+import pytest
+
+# The repository has no package setup, the tests import chordgnn from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# (local key, tonicized key, root, notes, pcset, v1.0.0 quality, latest quality, roman numeral, degree)
+CHORDS = [
+    ("C", "C", "C", ["C4", "E4", "G4"], (0, 4, 7), "major triad", "maj", "I", "1"),
+    ("C", "G", "G", ["G3", "B3", "D4", "F4"], (2, 5, 7, 11), "dominant seventh", "7", "V7", "5"),
+    ("C", "C", "F", ["F3", "A3", "C4"], (0, 5, 9), "major triad", "maj", "IV", "4"),
+    ("a", "a", "E", ["E3", "G#3", "B3"], (4, 8, 11), "major triad", "maj", "V", "5"),
+    ("a", "a", "A", ["A3", "C4", "E4"], (0, 4, 9), "minor triad", "min", "i", "1"),
+]
+
+
+@pytest.fixture
+def time_divided_tsv(tmp_path):
+    """Write a small random time divided tsv score in the format of the AugmentedNet dataset."""
+    def write(version="v1.0.0", frames=40, seed=0):
+        rng = random.Random(seed)
+        rows = list()
+        # The secondary degree is not numeric, so that pandas reads the column as strings.
+        onset = 0.0
+        for _ in range(frames):
+            local_key, tonicized_key, root, notes, pcset, quality, latest_quality, numeral, degree = rng.choice(CHORDS)
+            # Frames of an eighth note, the reader infers 4/4 from the eight frames of the second measure.
+            duration = 0.5
+            row = {
+                "j_offset": onset, "s_duration": duration, "s_measure": int(onset // 4) + 1, "s_notes": str(notes),
+                "s_isOnset": str([True] * len(notes)), "a_localKey": local_key, "a_tonicizedKey": tonicized_key,
+                "a_root": root, "a_bass": notes[0][:-1], "a_pcset": str(pcset), "a_quality": quality,
+                "a_romanNumeral": numeral, "a_degree1": degree, "a_degree2": "#4", "a_inversion": 0,
+                "a_isOnset": True}
+            if version != "v1.0.0":
+                row.update({
+                    "a_quality": latest_quality, "a_harmonicRhythm": 0, "a_tenor": notes[1][:-1],
+                    "a_alto": notes[-2][:-1], "a_soprano": notes[-1][:-1]})
+            rows.append(row)
+            onset += duration
+        path = str(tmp_path / "score-{}.tsv".format(version))
+        pd.DataFrame(rows).to_csv(path, sep="\t", index=False)
+        return path
+    return write
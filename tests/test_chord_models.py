@@ -0,0 +1,69 @@
+import numpy as np
+import torch
+from chordgnn.models.chord import greedy_edge_matching, time_step_accuracy
+
+
+def loop_edge_matching(edge_index, edge_score, num_nodes):
+    """The edge by edge greedy matching greedy_edge_matching replaces."""
+    nodes_remaining = set(range(num_nodes))
+    cluster = torch.empty(num_nodes, dtype=torch.long)
+    edge_argsort = edge_score.numpy().argsort(kind="stable")[::-1]
+    i, new_edge_indices = 0, []
+    for edge_idx in edge_argsort.tolist():
+        source, target = edge_index[0, edge_idx].item(), edge_index[1, edge_idx].item()
+        if source not in nodes_remaining or target not in nodes_remaining:
+            continue
+        new_edge_indices.append(edge_idx)
+        cluster[source] = i
+        nodes_remaining.remove(source)
+        if source != target:
+            cluster[target] = i
+            nodes_remaining.remove(target)
+        i += 1
+    for node_idx in sorted(nodes_remaining):
+        cluster[node_idx] = i
+        i += 1
+    return cluster, torch.tensor(new_edge_indices, dtype=torch.long), i
+
+
+def loop_time_step_accuracy(acc, onset, step=0.125):
+    """The row by row time step expansion time_step_accuracy replaces, for onsets starting at 0."""
+    rows = [(o, a) for o, a in zip(onset, acc)]
+    for i in range(1, len(onset)):
+        row_onset = onset[i - 1]
+        for _ in range(int((onset[i] - onset[i - 1]) / step) - 1):
+            row_onset = row_onset + step
+            rows.append((row_onset, acc[i - 1]))
+    rows.sort(key=lambda r: r[0])
+    return np.array([a for _, a in rows])
+
+
+def test_greedy_edge_matching_matches_the_loop():
+    generator = torch.Generator().manual_seed(0)
+    for num_nodes in [1, 5, 40, 200]:
+        edge_index = torch.randint(0, num_nodes, (2, 4 * num_nodes), generator=generator)
+        # Rounded scores, to have ties.
+        edge_score = torch.round(torch.rand(edge_index.size(1), generator=generator) * 10) / 10
+        cluster, matched, num_clusters = greedy_edge_matching(edge_index, edge_score, num_nodes)
+        expected_cluster, expected_matched, expected_num_clusters = loop_edge_matching(edge_index, edge_score, num_nodes)
+        assert num_clusters == expected_num_clusters
+        assert torch.equal(matched, expected_matched)
+        assert torch.equal(cluster, expected_cluster)
+
+
+def test_time_step_accuracy_matches_the_loop():
+    rng = np.random.default_rng(0)
+    for num_onsets in [1, 2, 30, 300]:
+        onset = np.cumsum(np.r_[0, rng.choice([0.125, 0.25, 0.3, 0.5, 1.0, 1.5], num_onsets - 1)])
+        acc = (rng.random(num_onsets) > 0.3).astype(np.float32)
+        expected = loop_time_step_accuracy(acc, onset)
+        assert np.array_equal(time_step_accuracy(torch.from_numpy(acc), torch.from_numpy(onset)), expected)
+        accs = {"key": acc, "root": 1 - acc}
+        expanded = time_step_accuracy(accs, onset)
+        assert set(expanded) == {"key", "root", "onset"} and "onset" not in accs
+        assert np.array_equal(expanded["key"], expected) and np.array_equal(expanded["root"], 1 - expected)
+        assert np.all(np.diff(expanded["onset"]) > 0)
+
+
+def test_time_step_accuracy_of_an_empty_piece():
+    assert len(time_step_accuracy(np.array([]), np.array([]))) == 0
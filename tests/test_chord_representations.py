@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from chordgnn.utils.globals import INTERVALCLASSES, NOTENAMES
+from chordgnn.utils.chord_representations import (
+    _read_filtered_tsv, _getTranspositions, time_divided_tsv_to_part, time_divided_tsv_to_transposable_part,
+    transposition_tables)
+from chordgnn.utils.chord_representations_latest import _getTranspositions_latest
+
+
+@pytest.mark.parametrize("version, transposing", [
+    ("v1.0.0", ["localkey", "tonkey", "root", "pcset", "bass"]),
+    ("latest", ["localkey", "tonkey", "root", "pcset", "bass", "tenor", "alto", "soprano"]),
+])
+def test_transposable_part_matches_transposed_copies(time_divided_tsv, version, transposing):
+    path = time_divided_tsv(version)
+    copies = time_divided_tsv_to_part(path, transpose=True, version=version)
+    filtered_df, _ = _read_filtered_tsv(path)
+    intervals = ["P1"] + (_getTranspositions(filtered_df) if version == "v1.0.0" else _getTranspositions_latest(filtered_df))
+    note_array, labels, transpositions = time_divided_tsv_to_transposable_part(path, version=version)
+    if version == "v1.0.0":
+        from chordgnn.utils.chord_representations import available_representations
+    else:
+        from chordgnn.utils.chord_representations_latest import available_representations
+    tasks = list(available_representations.keys())
+    assert [tasks[i] for i in transpositions["columns"]] == transposing
+
+    semitones, spellings = transposition_tables()
+    steps = np.array([NOTENAMES.index(step) for step in note_array["step"]]) * 7 + note_array["alter"] + 3
+    legal = np.flatnonzero(transpositions["intervals"])
+    assert len(legal) > 1
+    for k in legal:
+        copy_note_array, copy_labels = copies[intervals.index(INTERVALCLASSES[k])]
+        assert np.array_equal(note_array["pitch"] + semitones[k], copy_note_array["pitch"])
+        transposed = spellings[k, steps]
+        assert np.array_equal(transposed // 7, [NOTENAMES.index(step) for step in copy_note_array["step"]])
+        assert np.array_equal(transposed % 7 - 3, copy_note_array["alter"])
+        transposed = labels.copy()
+        columns = transpositions["columns"]
+        transposed[:, columns] = transpositions["table"][k][transpositions["value_ids"]].reshape(transposed[:, columns].shape)
+        assert np.array_equal(transposed, copy_labels), INTERVALCLASSES[k]
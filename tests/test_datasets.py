@@ -0,0 +1,78 @@
+import os
+import pickle
+import numpy as np
+import torch
+from chordgnn.utils.chord_representations import time_divided_tsv_to_part, time_divided_tsv_to_transposable_part
+from chordgnn.data.graph_store import PackedGraphStore, LazyGraphList, pack_graph_dirs
+from chordgnn.data.datasets.chord import ChordGraphDataset, data_to_graph
+
+
+def isin_crop(graph, start, end):
+    """The crop of get_graph_attr before the edges were indexed by node."""
+    indices = torch.arange(start, end)
+    onset_divs = graph.onset_div[start:end]
+    unique_onsets = torch.unique(graph.onset_div, sorted=True)
+    label_idx = (unique_onsets >= onset_divs.min()) & (unique_onsets <= onset_divs.max())
+    edge_indices = torch.isin(graph.edge_index[0], indices) & torch.isin(graph.edge_index[1], indices)
+    return (graph.x[start:end], graph.edge_index[:, edge_indices] - start, graph.edge_type[edge_indices],
+            graph.y[label_idx], onset_divs)
+
+
+def write_random_graph(save_path, name, num_features, label_shape, seed):
+    """A graph directory as written by HeteroScoreGraph.save, with random unsorted edges."""
+    rng = np.random.default_rng(seed)
+    num_onsets = int(rng.integers(20, 200))
+    onset_div = np.repeat(np.cumsum(rng.integers(1, 5, num_onsets)), rng.integers(1, 6, num_onsets))
+    num_nodes = len(onset_div)
+    note_array = np.zeros(num_nodes, dtype=[("onset_div", "i8"), ("pitch", "i4")])
+    note_array["onset_div"] = onset_div
+    os.makedirs(os.path.join(save_path, name))
+    np.save(os.path.join(save_path, name, "x.npy"), rng.random((num_nodes, num_features)).astype(np.float32))
+    np.save(os.path.join(save_path, name, "edge_index.npy"), np.vstack(
+        [rng.integers(0, num_nodes, 6 * num_nodes), rng.integers(0, num_nodes, 6 * num_nodes),
+         rng.integers(0, 4, 6 * num_nodes)]))
+    np.save(os.path.join(save_path, name, "y.npy"), rng.random((num_onsets,) + label_shape))
+    np.save(os.path.join(save_path, name, "note_array.npy"), note_array)
+    with open(os.path.join(save_path, name, "graph_info.pkl"), "wb") as f:
+        pickle.dump({"collection": "training"}, f)
+
+
+def test_data_to_graph(time_divided_tsv, tmp_path):
+    path = time_divided_tsv()
+    note_array, labels = time_divided_tsv_to_part(path)
+    feature_time = data_to_graph(note_array, labels, "training", "score", save_path=str(tmp_path))
+    assert isinstance(feature_time, float) and feature_time >= 0
+    for name in ["x.npy", "edge_index.npy", "y.npy", "note_array.npy", "graph_info.pkl"]:
+        assert os.path.exists(os.path.join(tmp_path, "score", name))
+    assert len(np.load(os.path.join(tmp_path, "score", "x.npy"))) == len(note_array)
+
+    note_array, labels, transpositions = time_divided_tsv_to_transposable_part(path)
+    feature_time = data_to_graph(
+        note_array, labels, "training", "score-online", save_path=str(tmp_path), transpositions=transpositions)
+    assert isinstance(feature_time, float)
+    assert os.path.exists(os.path.join(tmp_path, "score-online", "transpositions.npz"))
+
+
+def test_crop_graph_matches_the_isin_crop(time_divided_tsv, tmp_path):
+    save_path = str(tmp_path / "graphs")
+    note_array, labels = time_divided_tsv_to_part(time_divided_tsv())
+    data_to_graph(note_array, labels, "training", "score", save_path=save_path)
+    # The graphs of a store have the same features and labels.
+    num_features = np.load(os.path.join(save_path, "score", "x.npy")).shape[1]
+    label_shape = np.load(os.path.join(save_path, "score", "y.npy")).shape[1:]
+    names = ["score"]
+    for seed in range(4):
+        names.append("random-{}".format(seed))
+        write_random_graph(save_path, names[-1], num_features, label_shape, seed)
+    pack_graph_dirs(save_path, names, str(tmp_path / "packed"))
+    store = PackedGraphStore(str(tmp_path / "packed"))
+    rng = np.random.default_rng(0)
+    for graph in [store[i] for i in range(len(store))] + [LazyGraphList(store, range(len(store)))[0]]:
+        num_nodes = graph.x.shape[0]
+        for size in [1, 16, 64, num_nodes]:
+            for _ in range(5):
+                start = int(rng.integers(0, max(1, num_nodes - size)))
+                end = min(num_nodes, start + size)
+                cropped = ChordGraphDataset.crop_graph(graph, start, end)
+                for a, b in zip(isin_crop(graph, start, end), cropped[:5]):
+                    assert torch.equal(a, b)
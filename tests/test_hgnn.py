@@ -0,0 +1,41 @@
+import pytest
+import torch
+from chordgnn.utils.hgraph import relation_csr, add_reverse_edges_from_edge_index
+from chordgnn.models.core.hgnn import HeteroSageConvLayer, HeteroResGatedGraphConvLayer, HGCN
+
+
+ETYPES = {"onset": 0, "consecutive": 1, "during": 2, "rests": 3, "consecutive_rev": 4, "during_rev": 5, "rests_rev": 6}
+
+
+def random_graph(num_nodes=50, num_edges=300, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    edge_index = torch.randint(0, num_nodes, (2, num_edges), generator=generator)
+    edge_type = torch.randint(0, len(ETYPES), (num_edges,), generator=generator)
+    return torch.randn(num_nodes, 16, generator=generator), edge_index, edge_type
+
+
+@pytest.mark.parametrize("layer_class", [HeteroSageConvLayer, HeteroResGatedGraphConvLayer])
+def test_fused_layer_matches_the_convs_of_every_relation(layer_class):
+    torch.manual_seed(0)
+    layer = layer_class(16, 8, etypes=ETYPES).eval()
+    x, edge_index, edge_type = random_graph()
+    with torch.no_grad():
+        # The loop over the relations the fused layers replace.
+        expected = torch.stack([layer.conv[key](x, edge_index[:, edge_type == value])
+                                for key, value in ETYPES.items()]).mean(dim=0)
+        out = layer(x, edge_index, edge_type)
+        out_csr = layer(x, edge_index, edge_type, relation_csr(edge_index, edge_type, x.shape[0], len(ETYPES)))
+    assert torch.allclose(out, expected, atol=1e-5)
+    assert torch.allclose(out_csr, expected, atol=1e-5)
+
+
+def test_shared_csr_must_have_the_relations_of_the_layers():
+    torch.manual_seed(0)
+    net = HGCN(16, 32, 8, 2, dropout=0.0).eval()
+    x, edge_index, edge_type = random_graph()
+    edge_index, edge_type = add_reverse_edges_from_edge_index(edge_index, edge_type % 4)
+    with torch.no_grad():
+        out = net(x, edge_index, edge_type)
+        assert torch.allclose(net(x, edge_index, edge_type, relation_csr(edge_index, edge_type, x.shape[0], 7)), out, atol=1e-5)
+        with pytest.raises(ValueError):
+            net(x, edge_index, edge_type, relation_csr(edge_index, edge_type, x.shape[0], 4))
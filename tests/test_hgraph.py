@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import torch
+from chordgnn.utils.hgraph import (
+    hetero_graph_from_note_array, fast_hetero_graph_from_note_array, relation_csr, add_reverse_edges_from_edge_index)
+
+
+def synthetic_note_array(n_notes, seed=0):
+    """A piano-like note array with chords, held notes and occasional gaps between onsets."""
+    rng = np.random.default_rng(seed)
+    chord_sizes = rng.integers(1, 5, size=n_notes)
+    n_onsets = np.searchsorted(np.cumsum(chord_sizes), n_notes) + 1
+    steps = rng.choice([1, 2, 3, 4, 6, 8, 12], size=n_onsets) + (rng.random(n_onsets) < 0.1) * rng.integers(1, 3, size=n_onsets)
+    onsets = np.repeat(np.r_[0, np.cumsum(steps)[:-1]], chord_sizes[:n_onsets])[:n_notes]
+    durations = rng.choice([1, 2, 3, 4, 6, 8, 12, 16, 24, 48], size=n_notes)
+    note_array = np.zeros(n_notes, dtype=[
+        ("onset_div", int), ("duration_div", int), ("onset_beat", float), ("duration_beat", float),
+        ("ts_beats", int), ("ts_beat_type", int), ("pitch", int)])
+    note_array["onset_div"] = onsets
+    note_array["duration_div"] = durations
+    note_array["onset_beat"] = onsets / 12
+    note_array["duration_beat"] = durations / 12
+    note_array["ts_beats"] = 4
+    note_array["ts_beat_type"] = 4
+    note_array["pitch"] = rng.integers(30, 90, size=n_notes)
+    return note_array
+
+
+@pytest.mark.parametrize("n_notes, seed", [(1, 0), (10, 1), (300, 2), (1000, 3)])
+def test_fast_builder_matches_the_legacy_builder(n_notes, seed):
+    note_array = synthetic_note_array(n_notes, seed)
+    _, expected = hetero_graph_from_note_array(note_array.copy())
+    _, edges = fast_hetero_graph_from_note_array(note_array.copy())
+    assert edges.shape == expected.shape and np.array_equal(edges, expected)
+
+
+def test_relation_csr():
+    edge_index = torch.tensor([[2, 0, 2, 1, 0], [0, 1, 1, 2, 2]])
+    edge_type = torch.tensor([1, 0, 1, 0, 5])
+    csr = relation_csr(edge_index, edge_type, 3, 2)
+    # The edge of type 5 is out of the relations and dropped.
+    assert csr.rowptr.tolist() == [0, 1, 1, 2, 2, 2, 4]
+    assert csr.node.tolist() == [0, 1, 2, 2] and csr.relation.tolist() == [0, 0, 1, 1]
+    assert csr.col.tolist() == [1, 2, 0, 1]
+    assert csr.degree.tolist() == [[1, 0], [1, 0], [0, 2]]
+
+
+def test_add_reverse_edges():
+    edge_index = torch.tensor([[0, 1, 2], [1, 2, 0]])
+    edge_type = torch.tensor([0, 1, 2])
+    new_index, new_type = add_reverse_edges_from_edge_index(edge_index, edge_type)
+    # The reversed edges take the largest type so far, and the ones of the last type are reversed again.
+    assert new_index.tolist() == [[0, 1, 2, 2, 0, 1], [1, 2, 0, 1, 2, 2]]
+    assert new_type.tolist() == [0, 1, 2, 2, 2, 2]
+    new_index, new_type = add_reverse_edges_from_edge_index(edge_index, edge_type, mode="undirected")
+    assert new_index.tolist() == [[0, 1, 2, 1, 2, 0], [1, 2, 0, 0, 1, 2]]
+    assert new_type.tolist() == [0, 1, 2, 0, 1, 2]
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from chordgnn.utils.label_encoding import factorize, class_indices, transposition_table, NOT_A_CLASS
+from chordgnn.utils.chord_representations import (
+    _read_filtered_tsv, available_representations, OutputRepresentation, OutputRepresentationTI, TransposeKey)
+from chordgnn.utils.globals import KEYS
+
+
+def loop_run(rep, df, interval):
+    """The frame by frame encoding of the output representations the tables replace."""
+    array = np.zeros((len(df.index), 1), dtype="i8")
+    for frame, value in enumerate(df[rep.dfFeature]):
+        if issubclass(rep, OutputRepresentation):
+            value = rep.transpositionFn(value, interval)
+        array[frame] = rep.classList.index(value) if value in rep.classList else len(rep.classList) - 1
+    return array
+
+
+def test_factorize_keeps_missing_values():
+    codes, uniques = factorize(pd.Series(["a", None, "b", "a"]))
+    assert codes.tolist() == [0, 2, 1, 0]
+    assert uniques[:2] == ["a", "b"] and np.isnan(uniques[2])
+
+
+def test_class_indices():
+    assert class_indices(["a", "b", "a"], ["b", "a", "c"]).tolist() == [1, 0, NOT_A_CLASS]
+
+
+def test_transposition_table():
+    table = transposition_table(KEYS, TransposeKey)
+    assert transposition_table(KEYS, TransposeKey) is table
+    values = ["C", "a", "E-", "f#"]
+    for interval in ["P1", "m3", "A4", "m3"]:
+        expected = [KEYS.index(TransposeKey(key, interval)) if TransposeKey(key, interval) in KEYS else NOT_A_CLASS
+                    for key in values]
+        assert table.transpose(values, interval).tolist() == expected
+
+
+def test_representations_match_the_frame_loop(time_divided_tsv):
+    filtered_df, _ = _read_filtered_tsv(time_divided_tsv())
+    for rep in available_representations.values():
+        if rep.run not in (OutputRepresentation.run, OutputRepresentationTI.run):
+            continue
+        for interval in ["P1", "M2", "m3", "P5"]:
+            assert np.array_equal(rep(filtered_df).run(transposition=interval), loop_run(rep, filtered_df, interval))
@@ -0,0 +1,45 @@
+from itertools import combinations
+import numpy as np
+from chordgnn.utils.pcset_table import (
+    CHORDS, INTERVAL_VECTORS, CHORD_MATCHES, IS_MAJ_TRIAD, IS_MIN_TRIAD, NORMAL_FORMS, NORMAL_FORM_TRANSPOSITIONS,
+    N_PC_SETS, pc_mask, mask_to_pcs)
+
+
+def combinations_interval_vector(pcs):
+    """The per call interval vector the tables replace."""
+    interval_vector = [0, 0, 0, 0, 0, 0]
+    for p1, p2 in combinations(pcs, 2):
+        interval = abs(p1 - p2)
+        interval_vector[(interval if interval <= 6 else 12 - interval) - 1] += 1
+    return interval_vector
+
+
+def test_pc_mask():
+    assert pc_mask([60, 64, 67, 72]) == pc_mask([0, 4, 7])
+    assert mask_to_pcs(pc_mask([67, 60, 64])) == [0, 4, 7]
+
+
+def test_interval_vectors_and_chord_matches():
+    templates = list(CHORDS.values())
+    for mask in range(1, N_PC_SETS):
+        interval_vector = combinations_interval_vector(mask_to_pcs(mask))
+        assert INTERVAL_VECTORS[mask].tolist() == interval_vector
+        assert CHORD_MATCHES[mask].tolist() == [interval_vector == template for template in templates]
+
+
+def test_triads():
+    # Every transposition of the three positions of the triads.
+    assert IS_MAJ_TRIAD.sum() == 12 and IS_MIN_TRIAD.sum() == 12
+    assert IS_MAJ_TRIAD[pc_mask([0, 4, 7])] and IS_MAJ_TRIAD[pc_mask([2, 7, 11])]
+    assert IS_MIN_TRIAD[pc_mask([9, 0, 4])] and not IS_MIN_TRIAD[pc_mask([0, 4, 7])]
+
+
+def test_normal_forms():
+    for mask in range(1, N_PC_SETS):
+        pcs = mask_to_pcs(mask)
+        normal_form = list(NORMAL_FORMS[mask])
+        # The normal form is a transposition of the set starting on 0, and the same for all its transpositions.
+        assert normal_form[0] == 0 and normal_form == sorted(normal_form)
+        assert sorted((pc + NORMAL_FORM_TRANSPOSITIONS[mask]) % 12 for pc in pcs) == normal_form
+        assert list(NORMAL_FORMS[pc_mask([pc + 5 for pc in pcs])]) == normal_form
+    assert list(NORMAL_FORMS[pc_mask([7, 11, 2, 5])]) == [0, 3, 6, 8]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from chordgnn.data.samplers import BySequenceLengthSampler, TokenBudgetBatchSampler
+from chordgnn.data.samplers.graph_samplers import shard_examples, equalize_batches
+
+
+def random_sizes(num_examples=300, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.c_[rng.integers(10, 500, num_examples), rng.integers(10, 5000, num_examples),
+                 rng.integers(5, 300, num_examples)]
+
+
+def test_shard_examples():
+    lengths = random_sizes()[:, 0]
+    shards = shard_examples(lengths, 4, seed=0)
+    assert np.array_equal(np.sort(np.concatenate(shards)), np.arange(len(lengths)))
+    assert max(len(shard) for shard in shards) - min(len(shard) for shard in shards) <= 1
+    assert all(np.array_equal(a, b) for a, b in zip(shards, shard_examples(lengths, 4, seed=0)))
+
+
+def test_equalize_batches():
+    assert equalize_batches([[0], [1]], 5) == [[0], [1], [0], [1], [0]]
+    assert equalize_batches([[0], [1], [2]], 2) == [[0], [1]]
+
+
+@pytest.mark.parametrize("drop_last", [False, True])
+def test_token_budget_sampler(drop_last):
+    sizes = random_sizes()
+    samplers = [TokenBudgetBatchSampler(sizes, max_nodes=3000, max_onsets=1500, seed=0, num_replicas=3, rank=rank,
+                                        drop_last=drop_last) for rank in range(3)]
+    batches = [list(sampler) for sampler in samplers]
+    # The ranks have the same number of batches, from disjoint shards.
+    assert len(set(len(rank_batches) for rank_batches in batches)) == 1
+    assert len(batches[0]) == len(samplers[0])
+    examples = [set(i for batch in rank_batches for i in batch) for rank_batches in batches]
+    assert not (examples[0] & examples[1]) and not (examples[1] & examples[2])
+    if not drop_last:
+        assert set.union(*examples) == set(range(len(sizes)))
+    for batch in samplers[0].batches():
+        if len(batch) > 1:
+            assert sizes[batch, 0].sum() <= 3000 and sizes[batch, 2].max() * len(batch) <= 1500
+    # The batches only depend on the seed and the epoch.
+    assert batches[0] == list(TokenBudgetBatchSampler(
+        sizes, max_nodes=3000, max_onsets=1500, seed=0, num_replicas=3, rank=0, drop_last=drop_last))
+    samplers[0].set_epoch(1)
+    assert list(samplers[0]) != batches[0]
+
+
+def test_by_sequence_length_sampler():
+    lengths = random_sizes()[:, 0]
+    samplers = [BySequenceLengthSampler(None, [50, 100, 200, 400], 16, lengths=lengths, seed=0, num_replicas=2,
+                                        rank=rank) for rank in range(2)]
+    batches = [list(sampler) for sampler in samplers]
+    assert len(batches[0]) == len(batches[1]) == len(samplers[0])
+    assert set(i for batch in batches[0] for i in batch).isdisjoint(i for batch in batches[1] for i in batch)
+    for batch in batches[0]:
+        assert len(batch) <= 16 and len(set(samplers[0].bucket_ids[batch])) == 1
+    assert batches[0] == list(samplers[0])
+    samplers[0].set_epoch(1)
+    assert batches[0] != list(samplers[0])
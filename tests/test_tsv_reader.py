@@ -0,0 +1,42 @@
+import re
+import numpy as np
+import pandas as pd
+import partitura
+import pytest
+from chordgnn.utils.globals import ALTER
+from chordgnn.utils.tsv_reader import (
+    parse_literal, parse_literal_column, read_time_divided_tsv, frames_to_note_array, NOTE_ARRAY_DTYPE)
+
+
+def eval_note_array(df, time_signature):
+    """The eval based construction of the note array the reader replaces."""
+    note_array = list()
+    for i, row in df.iterrows():
+        for pitch in eval(row["s_notes"]):
+            p = re.findall(r'[A-Za-z]+|\W+|\d+', pitch)
+            step, alter, octave = (p[0], p[1], eval(p[2])) if len(p) == 3 else (p[0], "", eval(p[1]))
+            alter = ALTER[alter]
+            mp = partitura.utils.pitch_spelling_to_midi_pitch(step, alter, octave)
+            note_array.append((row["j_offset"], row["s_duration"], mp, int(time_signature), 4, step, alter, octave))
+    return np.array(note_array, NOTE_ARRAY_DTYPE)
+
+
+@pytest.mark.parametrize("text", [
+    "['C4', 'E-4', 'G#4']", "[True, False]", "(0, 4, 7)", "(3,)", "[]", "[1.5, -2, 'a b']", "['it''s']", "[[1], 2]"])
+def test_parse_literal(text):
+    assert parse_literal(text) == eval(text)
+
+
+def test_parse_literal_column_raises_on_empty_cells():
+    column = pd.Series(["[1, 2]", np.nan, "[3]"], name="s_notes")
+    with pytest.raises(ValueError):
+        parse_literal_column(column)
+
+
+def test_typed_reader_matches_eval(time_divided_tsv):
+    path = time_divided_tsv()
+    df, has_onsets, num_notes = read_time_divided_tsv(path)
+    raw = pd.read_csv(path, sep="\t", header=0)
+    assert has_onsets.tolist() == [any(eval(x)) for x in raw["s_isOnset"]]
+    assert num_notes.tolist() == [len(eval(x)) for x in raw["s_isOnset"]]
+    assert np.array_equal(frames_to_note_array(df, 4), eval_note_array(raw, 4))
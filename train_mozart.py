@@ -13,6 +13,7 @@ from pytorch_lightning.callbacks import ModelCheckpoint
 from pytorch_lightning import Trainer
 from pytorch_lightning.callbacks.early_stopping import EarlyStopping
 import argparse
+from chordgnn.train.callbacks import BatchSamplerEpochCallback, EpochStatsCallback, trainer_precision
 
 # Import the base dataset class
 from chordgnn.data.dataset import BuiltinDataset
@@ -106,14 +107,16 @@ class MozartChordGraphDataset(ChordGraphDataset):
             # Test: no transposition
             note_array, labels = time_divided_tsv_to_part(score_fn, transpose=False)
             data_to_graph(note_array, labels, collection, name, save_path=self.save_path)
+            outputs = [name]
         else:
             # Training: with transposition augmentation (automatic!)
             x = time_divided_tsv_to_part(score_fn, transpose=True)
+            outputs = []
             for i, (note_array, labels) in enumerate(x):
-                data_to_graph(note_array, labels, collection,
-                            (name + "-{}".format(i) if i > 0 else name),
+                outputs.append(name + "-{}".format(i) if i > 0 else name)
+                data_to_graph(note_array, labels, collection, outputs[-1],
                             save_path=self.save_path)
-        return
+        return outputs
 
 
 # ============================================================================
@@ -133,6 +136,8 @@ parser.add_argument('--n_epochs', type=int, default=50, help="Number of epochs")
 parser.add_argument('--mozart_data', type=str, default="./mozart_dataset", help="Mozart dataset path")
 parser.add_argument('--use_wandb', action="store_true", help="Use Weights & Biases logging")
 parser.add_argument('--force_reload', action="store_true", help="Force reload dataset")
+parser.add_argument('--precision', type=str, default="32", choices=["32", "16", "bf16"],
+                    help="Training precision, 16 and bf16 train with automatic mixed precision")
 
 # Reproducibility
 torch.manual_seed(0)
@@ -173,6 +178,7 @@ print(f"Model: {args.n_layers} layers × {args.n_hidden} hidden units")
 print(f"Learning rate: {args.lr}")
 print(f"Batch size: {args.batch_size}")
 print(f"Device: {'GPU ' + args.gpus if devices else 'CPU'}")
+print(f"Precision: {args.precision}")
 print(f"{'='*70}\n")
 
 # Create Mozart dataset
@@ -198,7 +204,13 @@ datamodule.__dict__.update({
     'num_workers': args.num_workers,
     'force_reload': args.force_reload,
     'normalize_features': True,
-    'version': 'v1.0.0'
+    'version': 'v1.0.0',
+    'prefetch_factor': 2,
+    'pin_memory': torch.cuda.is_available(),
+    'seed': None,
+    'max_nodes': None,
+    'max_edges': None,
+    'max_onsets': None
 })
 
 datamodule.datasets = [mozart_dataset]
@@ -246,8 +258,9 @@ trainer = Trainer(
     devices=devices,
     num_sanity_val_steps=1,
     logger=logger,
-    callbacks=[checkpoint_callback, early_stop_callback],
+    callbacks=[checkpoint_callback, early_stop_callback, EpochStatsCallback(), BatchSamplerEpochCallback()],
     reload_dataloaders_every_n_epochs=5,
+    precision=trainer_precision(args.precision),
 )
 
 # Train